@@ -0,0 +1,44 @@
+"""Helpers for ETag-based conditional GETs."""
+from email.utils import parsedate_to_datetime
+
+from fastapi import Request, Response
+
+REVALIDATE = "private, no-cache"
+# For responses whose URL never changes content (e.g. UUID-named images).
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def etag_for(digest: str) -> str:
+    """Strong ETag for a content hash."""
+    return f'"{digest}"'
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already covers ``etag``."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def is_unmodified_since(request: Request, mtime: float) -> bool:
+    """True if If-Modified-Since (used only without If-None-Match) is at or after ``mtime``."""
+    if request.headers.get("if-none-match"):
+        return False
+    header = request.headers.get("if-modified-since")
+    if not header:
+        return False
+    try:
+        return parsedate_to_datetime(header).timestamp() >= int(mtime)
+    except (TypeError, ValueError):
+        return False
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE})
+
+
+def set_etag(response: Response, etag: str):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE
@@ -7,7 +7,13 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 
-from .routers import books, chapters, agent, prompts, images, publish
+from .routers import books, chapters, agent, prompts, images, publish, sync, search
+from .services import storage, git_sync
+from .services.agent import close_provider, save_state as save_agent_state, warm_provider
+from .services.history import history_reader
+from .services.images import image_processor
+from .services.search import search_index
+from .services.suggestion_cache import suggestion_cache
 from .auth import LoginRequest, Token, authenticate_user, create_access_token
 
 app = FastAPI(
@@ -37,6 +43,44 @@ app.include_router(agent.router)
 app.include_router(prompts.router)
 app.include_router(images.router)
 app.include_router(publish.router)
+app.include_router(sync.router)
+app.include_router(search.router)
+
+
+@app.on_event("startup")
+def warm_indexes():
+    """Catch the search index up with any chapters changed while we were down."""
+    search_index.start_reconcile()
+
+
+@app.on_event("startup")
+async def warm_agent_provider():
+    """Pre-spawn warm agent workers (needs the running event loop)."""
+    warm_provider()
+
+
+@app.on_event("startup")
+async def backfill_image_variants():
+    """Generate responsive variants for stored images that have none yet."""
+    image_processor.start_backfill()
+
+
+@app.on_event("shutdown")
+def flush_caches():
+    """Persist in-memory indexes and pending commits before the process exits."""
+    storage.flush_metadata_index()
+    git_sync.flush()
+    history_reader.close()
+    search_index.close()
+    suggestion_cache.save()
+    save_agent_state()
+    image_processor.close()
+
+
+@app.on_event("shutdown")
+async def close_agent_provider():
+    """Close pooled LLM connections."""
+    await close_provider()
 
 
 @app.post("/api/login", response_model=Token)
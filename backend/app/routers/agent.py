@@ -1,8 +1,8 @@
 """Agent API router for AI-powered editing."""
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
-from typing import Literal, Optional
+from pydantic import BaseModel, Field
+from typing import Optional
 
 from ..services import agent, storage
 from ..auth import get_current_user
@@ -16,14 +16,26 @@ class AgentSuggestRequest(BaseModel):
     selectionStart: int
     selectionEnd: int
     prompt: str
-    provider: Optional[Literal["anthropic", "openai"]] = "anthropic"
     content: Optional[str] = None  # Optional: use this content instead of fetching from storage
 
 
 class AgentReviseRequest(BaseModel):
     sessionId: str
     prompt: str  # Additional feedback for revision
-    provider: Optional[Literal["anthropic", "openai"]] = "anthropic"
+
+
+class AgentPrefetchRequest(BaseModel):
+    bookSlug: str
+    chapterSlug: str
+    selectionStart: int
+    selectionEnd: int
+    content: Optional[str] = None  # Must match what /suggest will be sent
+    clientId: Optional[str] = None  # Defaults to the user; one prefetch group per client
+    limit: int = Field(3, ge=1, le=5)
+
+
+class CancelPrefetchRequest(BaseModel):
+    clientId: Optional[str] = None
 
 
 class ApproveEditRequest(BaseModel):
@@ -58,7 +70,6 @@ async def get_suggestion(req: AgentSuggestRequest, user: str = Depends(get_curre
             req.selectionStart,
             req.selectionEnd,
             req.prompt,
-            req.provider,
             req.bookSlug,
             req.chapterSlug,
         ),
@@ -67,6 +78,38 @@ async def get_suggestion(req: AgentSuggestRequest, user: str = Depends(get_curre
     )
 
 
+@router.post("/prefetch")
+async def prefetch_suggestions(req: AgentPrefetchRequest, user: str = Depends(get_current_user)):
+    """
+    Speculatively generate suggestions for the most-used prompts on a selection.
+    
+    Call when a selection is made; a later /suggest with one of those prompts
+    is then served from cache. Calling again (or /prefetch/cancel) cancels
+    the previous selection's work.
+    """
+    if req.content is not None:
+        content = req.content
+    else:
+        chapter = storage.get_chapter(req.bookSlug, req.chapterSlug)
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        content = chapter["content"]
+    
+    return agent.prefetch_suggestions(
+        content,
+        req.selectionStart,
+        req.selectionEnd,
+        req.clientId or user,
+        req.limit,
+    )
+
+
+@router.post("/prefetch/cancel")
+async def cancel_prefetch(req: CancelPrefetchRequest, user: str = Depends(get_current_user)):
+    """Cancel speculative work for the client's previous selection."""
+    return {"cancelled": agent.cancel_prefetch(req.clientId or user)}
+
+
 @router.post("/revise")
 async def revise_suggestion(req: AgentReviseRequest, user: str = Depends(get_current_user)):
     """
@@ -79,26 +122,48 @@ async def revise_suggestion(req: AgentReviseRequest, user: str = Depends(get_cur
     - New revision feedback
     """
     return StreamingResponse(
-        agent.revise_suggestion(req.sessionId, req.prompt, req.provider),
+        agent.revise_suggestion(req.sessionId, req.prompt),
         media_type="text/event-stream",
         headers={"Cache-Control": "no-cache", "Connection": "keep-alive"},
     )
 
 
+@router.get("/stats")
+async def get_agent_stats(user: str = Depends(get_current_user)):
+    """Pending-edit session count and bytes held, plus suggestion cache counters."""
+    return agent.get_stats()
+
+
 @router.post("/approve")
 async def approve_edit(req: ApproveEditRequest, user: str = Depends(get_current_user)):
     """
     Approve and apply the current suggestion.
     
-    The agent saves the edit to the file on the backend.
+    The edit is rebased onto the chapter as currently saved, so changes made
+    elsewhere since the suggestion are kept; 409 only if the selected text
+    itself changed. Returns the applied op (offsets into the version with
+    ``baseHash``) and the new ``contentHash`` so the client can patch its copy.
     """
-    new_content = agent.apply_edit(req.sessionId)
-    if new_content is None:
+    try:
+        result = await agent.approve_edit(req.sessionId, req.bookSlug, req.chapterSlug)
+    except storage.ChapterConflictError as exc:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": "The selected text has changed since the suggestion", "currentHash": exc.current_hash},
+        ) from exc
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if result is None:
         raise HTTPException(status_code=404, detail="Edit session not found or expired")
     
-    result = storage.save_chapter(req.bookSlug, req.chapterSlug, new_content)
-    
     return {
         "status": "applied",
         "updatedAt": result["updatedAt"],
+        "baseHash": result["baseHash"],
+        "contentHash": result["contentHash"],
+        "op": result["ops"][0],
+        "chapterSlug": result["chapterSlug"],
+        "renamed": result["renamed"],
     }
@@ -1,9 +1,14 @@
 """Books API router."""
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Literal
+from urllib.parse import quote
+
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from ..services import storage
+from ..services import epub, export, storage
 from ..auth import get_current_user
+from ..http_cache import etag_for, is_not_modified, not_modified, set_etag
 
 router = APIRouter(prefix="/api/books", tags=["books"])
 
@@ -26,11 +31,15 @@ def create_book(req: CreateBookRequest, user: str = Depends(get_current_user)):
 
 
 @router.get("/{slug}")
-def get_book(slug: str, user: str = Depends(get_current_user)):
+def get_book(slug: str, request: Request, response: Response, user: str = Depends(get_current_user)):
     """Get book details with chapters."""
     book = storage.get_book(slug)
     if not book:
         raise HTTPException(status_code=404, detail="Book not found")
+    etag = etag_for(book["version"])
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return book
 
 
@@ -40,3 +49,22 @@ def delete_book(slug: str, user: str = Depends(get_current_user)):
     if not storage.delete_book(slug):
         raise HTTPException(status_code=404, detail="Book not found")
     return {"status": "deleted"}
+
+
+@router.get("/{slug}/export")
+def export_book(slug: str, format: Literal["md", "zip", "epub"] = "md", user: str = Depends(get_current_user)):
+    """Stream the whole book as concatenated Markdown, a zip with images, or EPUB."""
+    if format == "epub":
+        stream, media_type = epub.export_epub(slug), "application/epub+zip"
+    elif format == "zip":
+        stream, media_type = export.export_zip(slug), "application/zip"
+    else:
+        stream, media_type = export.export_markdown(slug), "text/markdown; charset=utf-8"
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    filename = quote(f"{slug}.{format}")
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{filename}"},
+    )
@@ -1,10 +1,12 @@
 """Chapters API router."""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
 from pydantic import BaseModel
 from typing import List
 
 from ..services import storage
+from ..services.history import history_reader
 from ..auth import get_current_user
+from ..http_cache import etag_for, is_not_modified, not_modified, set_etag
 
 router = APIRouter(prefix="/api/books/{book_slug}/chapters", tags=["chapters"])
 
@@ -13,6 +15,17 @@ class SaveChapterRequest(BaseModel):
     content: str
 
 
+class TextOp(BaseModel):
+    start: int  # Character offsets into the base content
+    end: int
+    text: str = ""
+
+
+class PatchChapterRequest(BaseModel):
+    baseHash: str
+    ops: List[TextOp]
+
+
 class CreateChapterRequest(BaseModel):
     title: str
 
@@ -22,14 +35,46 @@ class ReorderChaptersRequest(BaseModel):
 
 
 @router.get("/{chapter_slug}")
-def get_chapter(book_slug: str, chapter_slug: str, user: str = Depends(get_current_user)):
+def get_chapter(
+    book_slug: str,
+    chapter_slug: str,
+    request: Request,
+    response: Response,
+    user: str = Depends(get_current_user),
+):
     """Get chapter content."""
+    # Revalidation only needs the indexed hash, not a full read.
+    indexed_hash = storage.get_chapter_hash(book_slug, chapter_slug)
+    if indexed_hash and is_not_modified(request, etag_for(indexed_hash)):
+        return not_modified(etag_for(indexed_hash))
+
     chapter = storage.get_chapter(book_slug, chapter_slug)
     if not chapter:
         raise HTTPException(status_code=404, detail="Chapter not found")
+    set_etag(response, etag_for(chapter["contentHash"]))
     return chapter
 
 
+@router.get("/{chapter_slug}/rendered")
+def get_rendered_chapter(
+    book_slug: str,
+    chapter_slug: str,
+    request: Request,
+    response: Response,
+    user: str = Depends(get_current_user),
+):
+    """Get chapter as sanitized HTML plus its heading TOC, for Reader mode."""
+    indexed_hash = storage.get_chapter_hash(book_slug, chapter_slug)
+    if indexed_hash and is_not_modified(request, etag_for(f"{indexed_hash}-rendered")):
+        return not_modified(etag_for(f"{indexed_hash}-rendered"))
+
+    rendered = storage.get_rendered_chapter(book_slug, chapter_slug)
+    if not rendered:
+        raise HTTPException(status_code=404, detail="Chapter not found")
+    set_etag(response, etag_for(f"{rendered['contentHash']}-rendered"))
+    return rendered
+
+
 @router.put("/{chapter_slug}")
 def save_chapter(book_slug: str, chapter_slug: str, req: SaveChapterRequest, user: str = Depends(get_current_user)):
     """Save chapter content."""
@@ -56,3 +101,67 @@ def reorder_chapters(book_slug: str, req: ReorderChaptersRequest, user: str = De
     if not storage.reorder_chapters(book_slug, req.order):
         raise HTTPException(status_code=404, detail="Book not found")
     return {"status": "reordered"}
+
+
+@router.patch("/{chapter_slug}")
+def patch_chapter(book_slug: str, chapter_slug: str, req: PatchChapterRequest, user: str = Depends(get_current_user)):
+    """Save a chapter by applying text ops against the version with ``baseHash``."""
+    try:
+        return storage.patch_chapter(book_slug, chapter_slug, req.baseHash, [op.model_dump() for op in req.ops])
+    except storage.ChapterConflictError as exc:
+        raise HTTPException(
+            status_code=409,
+            detail={"message": str(exc), "currentHash": exc.current_hash},
+        ) from exc
+    except FileNotFoundError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@router.get("/{chapter_slug}/history")
+def list_chapter_revisions(
+    book_slug: str,
+    chapter_slug: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    user: str = Depends(get_current_user),
+):
+    """List git revisions of a chapter, newest first."""
+    return history_reader.list_revisions(book_slug, chapter_slug, offset, limit)
+
+
+@router.get("/{chapter_slug}/history/{commit}")
+def get_chapter_revision(book_slug: str, chapter_slug: str, commit: str, user: str = Depends(get_current_user)):
+    """Get chapter content as of a revision."""
+    try:
+        content = history_reader.get_content(book_slug, chapter_slug, commit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if content is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {"commit": commit, "content": content}
+
+
+@router.get("/{chapter_slug}/history/{commit}/diff")
+def diff_chapter_revision(
+    book_slug: str,
+    chapter_slug: str,
+    commit: str,
+    against: str = "current",
+    user: str = Depends(get_current_user),
+):
+    """Unified diff from a revision to another revision or the current content."""
+    target_content = None
+    if against == "current":
+        chapter = storage.get_chapter(book_slug, chapter_slug)
+        if not chapter:
+            raise HTTPException(status_code=404, detail="Chapter not found")
+        target_content = chapter["content"]
+    try:
+        diff = history_reader.diff(book_slug, chapter_slug, commit, against, target_content)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return {"from": commit, "to": against, "diff": diff}
@@ -1,85 +1,132 @@
 # Image upload router for ZenApp
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import FileResponse, Response
 from pathlib import Path
+from typing import Literal, Optional
+import asyncio
+import io
 import uuid
+
 from PIL import Image
-import io
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 
 from ..auth import get_current_user
+from ..http_cache import IMMUTABLE, is_not_modified, is_unmodified_since
+from ..services.images import (
+    ALLOWED_EXTENSIONS,
+    MAX_IMAGE_SIZE,
+    IMAGE_SIZES,
+    SAFE_NAME_RE,
+    ImageBusyError,
+    get_images_dir,
+    image_files,
+    image_processor,
+    srcset_for,
+)
 
-router = APIRouter(prefix="/api/books", tags=["images"])
+MEDIA_TYPES = {".jpg": "image/jpeg", ".webp": "image/webp"}
+# While variants are pending a URL may later resolve to a smaller file.
+PROVISIONAL = "public, max-age=60"
 
-# Constants
-MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
-MAX_IMAGE_WIDTH = 1200
-IMAGE_QUALITY = 85
-ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.heic', '.webp'}
+# Room for multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD = 64 * 1024
+READ_CHUNK = 64 * 1024
+UPLOAD_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    },
+}
 
-def get_images_dir(book_slug: str) -> Path:
-    """Get the images directory for a book, creating it if needed."""
-    base_dir = Path(__file__).parent.parent.parent / "data" / "books" / book_slug / "images"
-    base_dir.mkdir(parents=True, exist_ok=True)
-    return base_dir
 
-def process_image(image_data: bytes, filename: str) -> bytes:
-    """Process image: resize if needed, compress, convert to JPG."""
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size is {MAX_IMAGE_SIZE / 1024 / 1024:.1f}MB"
+    )
+
+
+async def _receive_upload(request: Request) -> tuple[str, bytes]:
+    """Read the ``file`` part of a multipart upload, aborting once it is over the limit.
+    
+    A declared Content-Length over the limit is refused before any of the
+    body is read; otherwise the body is parsed as it arrives and the request
+    fails as soon as it passes the limit.
+    """
+    limit = MAX_IMAGE_SIZE + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > limit:
+        raise _too_large()
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    
+    async def body():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > limit:
+                raise _too_large()
+            yield chunk
+    
+    parser = MultiPartParser(request.headers, body(), max_files=1, max_fields=16)
+    try:
+        form = await parser.parse()
+    except BaseException as e:
+        # Starlette only closes its spooled files itself on some errors.
+        await FormData(parser.items).close()
+        for spooled in getattr(parser, "_files_to_close_on_error", ()):
+            spooled.close()
+        if isinstance(e, MultiPartException):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+    
+    file = form.get("file")
+    if not isinstance(file, UploadFile):
+        raise HTTPException(status_code=400, detail="Missing file")
     try:
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Convert RGBA to RGB (for PNG with transparency)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Resize if too wide
-        if img.width > MAX_IMAGE_WIDTH:
-            ratio = MAX_IMAGE_WIDTH / img.width
-            new_height = int(img.height * ratio)
-            img = img.resize((MAX_IMAGE_WIDTH, new_height), Image.Resampling.LANCZOS)
-        
-        # Save to bytes
-        output = io.BytesIO()
-        img.save(output, format='JPEG', quality=IMAGE_QUALITY, optimize=True)
-        return output.getvalue()
-    
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to process image: {str(e)}")
+        content = bytearray()
+        while chunk := await file.read(READ_CHUNK):
+            content += chunk
+            if len(content) > MAX_IMAGE_SIZE:
+                raise _too_large()
+        return file.filename or "", bytes(content)
+    finally:
+        await file.close()
 
-@router.post("/{book_slug}/images")
+router = APIRouter(prefix="/api/books", tags=["images"])
+
+@router.post("/{book_slug}/images", openapi_extra=UPLOAD_SCHEMA)
 async def upload_image(
     book_slug: str,
-    file: UploadFile = File(...),
+    request: Request,
     user: dict = Depends(get_current_user)
 ):
-    """Upload an image for a book."""
+    """Upload an image for a book (multipart ``file`` field)."""
+    
+    # Read file in chunks, rejecting oversized uploads early (413)
+    filename, content = await _receive_upload(request)
     
     # Validate file extension
-    ext = Path(file.filename or "").suffix.lower()
+    ext = Path(filename).suffix.lower()
     if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(
             status_code=400,
             detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Read file
-    content = await file.read()
-    
-    # Check size
-    if len(content) > MAX_IMAGE_SIZE:
-        raise HTTPException(
-            status_code=400,
-            detail=f"File too large. Maximum size is {MAX_IMAGE_SIZE / 1024 / 1024:.1f}MB"
-        )
-    
-    # Process image (resize, compress, convert to JPG)
-    processed_content = process_image(content, file.filename or "image.jpg")
+    # Process image (resize, compress, convert to JPG) in a worker process
+    try:
+        processed_content = await image_processor.process(content, filename or "image.jpg")
+    except (ImageBusyError, RuntimeError) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "2"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
     # Generate unique filename
     unique_filename = f"{uuid.uuid4()}.jpg"
@@ -87,31 +134,65 @@ async def upload_image(
     # Save to disk
     images_dir = get_images_dir(book_slug)
     file_path = images_dir / unique_filename
+    await asyncio.to_thread(file_path.write_bytes, processed_content)
     
-    with open(file_path, 'wb') as f:
-        f.write(processed_content)
+    # Narrower JPEG/WebP variants are generated after we respond
+    image_processor.schedule_variants(file_path)
     
-    # Return URL
+    # Return URL plus responsive image metadata
     url = f"/api/books/{book_slug}/images/{unique_filename}"
+    width, height = Image.open(io.BytesIO(processed_content)).size  # Header only
     
     return {
         "url": url,
         "filename": unique_filename,
-        "size": len(processed_content)
+        "size": len(processed_content),
+        "width": width,
+        "height": height,
+        "srcset": srcset_for(url),
+        "sizes": IMAGE_SIZES,
     }
 
 @router.get("/{book_slug}/images/{filename}")
-async def get_image(book_slug: str, filename: str):
-    """Serve an image file."""
+async def get_image(
+    book_slug: str,
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4000),
+    format: Optional[Literal["jpeg", "webp"]] = None,
+):
+    """Serve an image file.
     
-    images_dir = get_images_dir(book_slug)
-    file_path = images_dir / filename
+    ``w`` selects the narrowest stored variant at least that wide; ``format``
+    picks JPEG or WebP, otherwise WebP is served when the Accept header
+    allows it. Until variants exist the original is served.
+    
+    Files never change, so responses are cacheable forever (once variants
+    exist) and revalidate with ETag/Last-Modified; Range requests are
+    handled by FileResponse.
+    """
+    if not SAFE_NAME_RE.match(book_slug) or not SAFE_NAME_RE.match(filename):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    negotiated = format is None
+    if negotiated:
+        format = "webp" if "image/webp" in request.headers.get("accept", "") else "jpeg"
     
-    if not file_path.exists():
+    found = image_files.lookup(book_slug, filename, w, format)
+    if found is None:
         raise HTTPException(status_code=404, detail="Image not found")
+    file_path, stat_result, final = found
     
-    # Security check: ensure file is within images directory
-    if not file_path.resolve().is_relative_to(images_dir.resolve()):
-        raise HTTPException(status_code=403, detail="Access denied")
+    etag = f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE if final else PROVISIONAL}
+    if negotiated:
+        headers["Vary"] = "Accept"
+    if is_not_modified(request, etag) or is_unmodified_since(request, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
     
-    return FileResponse(file_path, media_type="image/jpeg")
+    return FileResponse(
+        file_path,
+        media_type=MEDIA_TYPES.get(file_path.suffix, "image/jpeg"),
+        headers=headers,
+        stat_result=stat_result,
+    )
@@ -1,39 +1,25 @@
 # API router for prompt templates
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Request, Response
 from typing import List
-import os
 
-router = APIRouter(prefix="/api", tags=["prompts"])
+from ..http_cache import etag_for, is_not_modified, not_modified, set_etag
+from ..services.prompts import load_prompts, save_prompts as write_prompts
 
-PROMPTS_FILE = os.path.join(os.path.dirname(__file__), '../../data/prompts.md')
+router = APIRouter(prefix="/api", tags=["prompts"])
 
 @router.get('/prompts', response_model=List[str])
-async def get_prompts():
+async def get_prompts(request: Request, response: Response):
     """Get list of pre-defined prompts from prompts.md"""
-    if not os.path.exists(PROMPTS_FILE):
-        return []
-    
-    with open(PROMPTS_FILE, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Parse prompts - each non-empty line that's not a heading is a prompt
-    prompts = []
-    for line in content.split('\n'):
-        line = line.strip()
-        if line and not line.startswith('#'):
-            prompts.append(line)
-    
+    prompts, digest = load_prompts()
+    etag = etag_for(digest)
+    if is_not_modified(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
     return prompts
 
 @router.post('/prompts')
 async def save_prompts(prompts: List[str]):
     """Save prompts to prompts.md"""
-    # Write prompts as markdown list
-    content = "# AI Edit Prompts\n\n"
-    content += "\n\n".join(prompts)
-    
-    with open(PROMPTS_FILE, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
+    write_prompts(prompts)
     return {"status": "saved", "count": len(prompts)}
@@ -0,0 +1,20 @@
+"""Full-text search API router."""
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from ..services.search import search_index
+from ..auth import get_current_user
+
+router = APIRouter(prefix="/api/search", tags=["search"])
+
+
+@router.get("")
+def search(
+    q: str = Query(..., min_length=1),
+    book: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    user: str = Depends(get_current_user),
+):
+    """Search chapter sections across all books (or one book), best match first."""
+    return search_index.search(q, book, limit)
@@ -0,0 +1,16 @@
+"""Git sync status API router."""
+from fastapi import APIRouter, HTTPException, Depends
+
+from ..services import git_sync
+from ..auth import get_current_user
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("/commits/{commit_id}")
+def get_commit_status(commit_id: str, user: str = Depends(get_current_user)):
+    """Get the commit status (pending/committed/pushed/failed) of a queued save."""
+    status = git_sync.get_status(commit_id)
+    if not status:
+        raise HTTPException(status_code=404, detail="Commit not found")
+    return status
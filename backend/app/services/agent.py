@@ -1,8 +1,28 @@
 """Agent service for AI-powered text editing."""
+import abc
+import asyncio
 import json
 import os
+import re
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict, deque
+from pathlib import Path
 from typing import AsyncIterator, Optional
 
+from . import storage
+from .agent_scheduler import (
+    DEADLINE_SECONDS,
+    INTERACTIVE,
+    SPECULATIVE,
+    RunHandle,
+    SchedulerBusyError,
+    agent_scheduler,
+)
+from .metadata_index import content_hash
+from .prompts import load_prompts
+from .suggestion_cache import suggestion_cache, suggestion_key
+
 AGENT_SYSTEM_PROMPT = """You are an expert writing editor. 
 The user will give you a passage and an editing instruction.
 Return ONLY the edited text, nothing else. No explanations, no markdown code blocks.
@@ -14,79 +34,240 @@ Now they want you to revise your suggestion based on additional feedback.
 Return ONLY the revised text, nothing else. No explanations, no markdown code blocks."""
 
 
+# Agent backend: "codex" spawns the CLI per request, "http" streams from an
+# OpenAI-compatible API over a pooled connection.
+AGENT_BACKEND = os.getenv("ZENAPP_AGENT_BACKEND", "codex").strip().lower()
+LLM_BASE_URL = os.getenv("ZENAPP_LLM_BASE_URL", "https://api.openai.com/v1")
+LLM_API_KEY = os.getenv("ZENAPP_LLM_API_KEY", os.getenv("OPENAI_API_KEY", ""))
+LLM_MODEL = os.getenv("ZENAPP_LLM_MODEL", "gpt-4o-mini")
+# Warm `codex exec -` processes kept waiting on stdin (codex backend only).
+CODEX_POOL_SIZE = int(os.getenv("ZENAPP_CODEX_POOL_SIZE", "2"))
+
+# Whole-chapter edits are split into chunks of about this many tokens.
+CHUNK_TOKENS = int(os.getenv("ZENAPP_AGENT_CHUNK_TOKENS", "800"))
+CHAPTER_WORKERS = int(os.getenv("ZENAPP_AGENT_CHAPTER_WORKERS", "4"))
+BLOCK_RE = re.compile(r"[^\n]*\S[^\n]*(?:\n(?!\s*\n|#)[^\n]*\S[^\n]*)*")
+# Tokens of outline and surrounding paragraphs sent with each edit.
+CONTEXT_TOKENS = int(os.getenv("ZENAPP_AGENT_CONTEXT_TOKENS", "600"))
+OUTLINE_CACHE_SIZE = 64
+CJK_CHAR_RE = re.compile("[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+PROMPT_USAGE_FILE = Path(__file__).parent.parent.parent / "data" / ".cache" / "prompt_usage.json"
+
+SESSION_TTL_SECONDS = float(os.getenv("ZENAPP_AGENT_SESSION_TTL", "7200"))
+MAX_SESSIONS = 200
+
+
+class ContentStore:
+    """Chapter contents shared by pending edits, keyed by hash and refcounted."""
+
+    def __init__(self):
+        self._entries: dict[str, list] = {}  # hash -> [content, refcount, size in bytes]
+
+    def put(self, content: str) -> str:
+        digest = content_hash(content)
+        entry = self._entries.get(digest)
+        if entry is None:
+            self._entries[digest] = [content, 1, len(content.encode('utf-8'))]
+        else:
+            entry[1] += 1
+        return digest
+
+    def get(self, digest: str) -> str:
+        return self._entries[digest][0]
+
+    def release(self, digest: str):
+        entry = self._entries.get(digest)
+        if entry is None:
+            return
+        entry[1] -= 1
+        if entry[1] <= 0:
+            del self._entries[digest]
+
+    def stats(self) -> dict:
+        return {
+            "contents": len(self._entries),
+            "contentBytes": sum(entry[2] for entry in self._entries.values()),
+        }
+
+
+# Global content store for pending edits
+content_store = ContentStore()
+
+
 class PendingEdit:
-    """Holds info about a pending edit."""
+    """Holds info about a pending edit; the chapter content lives in ``content_store``."""
+    __slots__ = (
+        "content_hash",
+        "selection_start",
+        "selection_end",
+        "current_suggestion",
+        "prompt_history",
+        "last_used",
+    )
+
     def __init__(
         self,
-        original_content: str,
+        content_hash: str,
         selection_start: int,
         selection_end: int,
-        original_text: str,
         current_suggestion: str,
         prompt_history: list[str],
     ):
-        self.original_content = original_content
+        self.content_hash = content_hash
         self.selection_start = selection_start
         self.selection_end = selection_end
-        self.original_text = original_text
         self.current_suggestion = current_suggestion
         self.prompt_history = prompt_history
+        self.last_used = time.monotonic()
+
+    @property
+    def original_content(self) -> str:
+        return content_store.get(self.content_hash)
+
+    @property
+    def original_text(self) -> str:
+        return self.original_content[self.selection_start:self.selection_end]
+
+    def size(self) -> int:
+        """Bytes held by this edit, excluding the shared chapter content."""
+        return len(self.current_suggestion.encode('utf-8')) + sum(len(p.encode('utf-8')) for p in self.prompt_history)
 
 
 class AgentSession:
-    """Holds the current editing session state."""
-    
-    def __init__(self):
-        self.pending_edits: dict[str, PendingEdit] = {}
-    
+    """Holds the current editing session state.
+
+    Sessions expire ``ttl`` seconds after last use, and the least recently
+    used ones are dropped beyond ``max_sessions``.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.pending_edits: OrderedDict[str, PendingEdit] = OrderedDict()
+
+    def _drop(self, session_id: str):
+        edit = self.pending_edits.pop(session_id, None)
+        if edit is not None:
+            content_store.release(edit.content_hash)
+
+    def _evict(self):
+        deadline = time.monotonic() - self.ttl
+        while self.pending_edits:
+            session_id, edit = next(iter(self.pending_edits.items()))
+            if edit.last_used > deadline and len(self.pending_edits) <= self.max_sessions:
+                break
+            self._drop(session_id)
+
     def store_pending(self, session_id: str, edit: PendingEdit):
+        self._drop(session_id)
         self.pending_edits[session_id] = edit
-    
+        self._evict()
+
     def get_pending(self, session_id: str) -> Optional[PendingEdit]:
-        return self.pending_edits.get(session_id)
-    
+        self._evict()
+        edit = self.pending_edits.get(session_id)
+        if edit is not None:
+            edit.last_used = time.monotonic()
+            self.pending_edits.move_to_end(session_id)
+        return edit
+
     def clear_pending(self, session_id: str):
-        self.pending_edits.pop(session_id, None)
+        self._drop(session_id)
+
+    def stats(self) -> dict:
+        self._evict()
+        return {
+            "sessions": len(self.pending_edits),
+            "sessionBytes": sum(edit.size() for edit in self.pending_edits.values()),
+            **content_store.stats(),
+        }
 
 
 # Global session store
 agent_sessions = AgentSession()
 
 
+class PromptUsage:
+    """How often each prompt is used, persisted across restarts."""
+
+    def __init__(self, usage_file: Path):
+        self.usage_file = usage_file
+        self._counts: Optional[Counter] = None
+        self._dirty = False
+
+    def _load(self) -> Counter:
+        if self._counts is None:
+            try:
+                self._counts = Counter(json.loads(self.usage_file.read_text()))
+            except (OSError, ValueError):
+                self._counts = Counter()
+        return self._counts
+
+    def record(self, prompt: str):
+        self._load()[prompt] += 1
+        self._dirty = True
+
+    def top(self, limit: int) -> list[str]:
+        """Pre-defined prompts, most used first (file order breaks ties)."""
+        counts = self._load()
+        prompts, _ = load_prompts()
+        ranked = sorted(enumerate(prompts), key=lambda item: (-counts[item[1]], item[0]))
+        return [prompt for _, prompt in ranked[:limit]]
+
+    def save(self):
+        if not self._dirty:
+            return
+        try:
+            self.usage_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.usage_file.with_name(f".{self.usage_file.name}.tmp")
+            tmp.write_text(json.dumps(dict(self._load()), ensure_ascii=False))
+            os.replace(tmp, self.usage_file)
+            self._dirty = False
+        except OSError as e:
+            print(f"Prompt usage save failed: {e}")
+
+
+# Global prompt usage counts
+prompt_usage = PromptUsage(PROMPT_USAGE_FILE)
+
+# client id -> suggestion keys of its current speculative prefetch
+_prefetch_groups: dict[str, list[str]] = {}
+
+
 async def get_edit_suggestion(
     content: str,
     selection_start: int,
     selection_end: int,
     prompt: str,
-    provider: str = "anthropic",
     book_slug: str = "",
     chapter_slug: str = "",
 ) -> AsyncIterator[str]:
     """
-    Stream initial edit suggestion using Copilot CLI.
+    Stream initial edit suggestion from the agent provider.
     """
     import uuid
     
-    selected_text = content[selection_start:selection_end]
     session_id = str(uuid.uuid4())
     
     # Extract context: chapter title and current section
     context = _extract_context(content, selection_start, selection_end)
     
     replacement = ""
+    prompt_usage.record(prompt)
     
-    # Always use Copilot CLI (no API keys needed)
-    async for event, text in _stream_initial_edit(selected_text, prompt, provider, context):
+    # Identical requests share one run.
+    key, stream = _suggestion_plan(content, selection_start, selection_end, prompt, context)
+    async for event, text in suggestion_cache.stream(key, stream):
         if text:
             replacement = text
         yield event
     
     # Store pending edit for approval or revision
     agent_sessions.store_pending(session_id, PendingEdit(
-        original_content=content,
+        content_hash=content_store.put(content),
         selection_start=selection_start,
         selection_end=selection_end,
-        original_text=selected_text,
         current_suggestion=replacement,
         prompt_history=[prompt],
     ))
@@ -94,10 +275,66 @@ async def get_edit_suggestion(
     yield f"event: session\ndata: {json.dumps({'sessionId': session_id})}\n\n"
 
 
+def _suggestion_plan(
+    content: str,
+    selection_start: int,
+    selection_end: int,
+    prompt: str,
+    context: dict,
+    handle: Optional[RunHandle] = None,
+):
+    """Suggestion cache key and stream factory for a suggest request.
+
+    A whole long chapter is edited as parallel paragraph chunks instead.
+    """
+    selected_text = content[selection_start:selection_end]
+    key = suggestion_key(selected_text, prompt, context, agent_provider.name)
+    if _is_chapter_selection(content, selection_start, selection_end):
+        return key, lambda: _stream_chapter_edit(content, selection_start, selection_end, prompt)
+    return key, lambda: _stream_initial_edit(selected_text, prompt, context, handle)
+
+
+def prefetch_suggestions(
+    content: str,
+    selection_start: int,
+    selection_end: int,
+    client_id: str = "",
+    limit: int = 3,
+) -> dict:
+    """Speculatively generate suggestions for the most-used prompts on a selection.
+
+    Replaces (and cancels) the client's previous prefetch. Only idle agent
+    slots are used, and running prefetches are preempted by interactive
+    requests. Whole-chapter selections are never prefetched.
+    """
+    cancel_prefetch(client_id)
+    started, cached = [], []
+    if selection_end <= selection_start or _is_chapter_selection(content, selection_start, selection_end):
+        return {"started": started, "cached": cached}
+
+    context = _extract_context(content, selection_start, selection_end)
+    idle = agent_scheduler.idle_slots()
+    keys = []
+    for prompt in prompt_usage.top(limit):
+        handle = RunHandle(SPECULATIVE)
+        key, stream = _suggestion_plan(content, selection_start, selection_end, prompt, context, handle)
+        if suggestion_cache.has(key):
+            cached.append(prompt)
+        elif len(started) < idle and suggestion_cache.prefetch(key, stream, handle.promote):
+            started.append(prompt)
+            keys.append(key)
+    _prefetch_groups[client_id] = keys
+    return {"started": started, "cached": cached}
+
+
+def cancel_prefetch(client_id: str = "") -> int:
+    """Cancel the client's speculative generations that nobody is waiting on."""
+    return suggestion_cache.cancel_prefetch(_prefetch_groups.pop(client_id, []))
+
+
 async def revise_suggestion(
     session_id: str,
     revision_prompt: str,
-    provider: str = "anthropic",
 ) -> AsyncIterator[str]:
     """
     Revise an existing suggestion based on additional feedback.
@@ -109,13 +346,11 @@ async def revise_suggestion(
     
     replacement = ""
     
-    # Always use Copilot CLI
     async for event, text in _stream_revision(
         pending.original_text,
         pending.current_suggestion,
         pending.prompt_history,
         revision_prompt,
-        provider,
     ):
         if text:
             replacement = text
@@ -128,143 +363,708 @@ async def revise_suggestion(
     yield f"event: session\ndata: {json.dumps({'sessionId': session_id})}\n\n"
 
 
-def apply_edit(session_id: str) -> Optional[str]:
+def get_stats() -> dict:
+    """Memory held by agent sessions, suggestion cache and scheduler counters."""
+    return {
+        **agent_sessions.stats(),
+        "suggestions": suggestion_cache.stats(),
+        "scheduler": agent_scheduler.stats(),
+        "backend": agent_provider.name,
+        "provider": agent_provider.stats(),
+    }
+
+
+async def approve_edit(session_id: str, book_slug: str, chapter_slug: str) -> Optional[dict]:
     """
-    Apply a pending edit and return the new full content.
+    Apply a pending edit to the chapter as it is now and return the applied op.
+    
+    The selection is rebased onto the current file if the chapter changed
+    since the suggestion (raises ``storage.ChapterConflictError`` if the
+    selected text itself changed). The session is kept on conflict. The
+    patch (book lock, file I/O, fsync) runs in a worker thread.
     """
     pending = agent_sessions.get_pending(session_id)
     if not pending:
         return None
     
-    # Apply the edit
-    new_content = (
-        pending.original_content[:pending.selection_start] +
-        pending.current_suggestion +
-        pending.original_content[pending.selection_end:]
+    op = {
+        "start": pending.selection_start,
+        "end": pending.selection_end,
+        "text": pending.current_suggestion,
+    }
+    result = await asyncio.to_thread(
+        storage.patch_chapter,
+        book_slug, chapter_slug, pending.content_hash, [op], base_content=pending.original_content,
     )
     
-    # Clear the session
-    agent_sessions.clear_pending(session_id)
+    # Clear the session (unless it was replaced by a newer suggestion meanwhile)
+    if agent_sessions.pending_edits.get(session_id) is pending:
+        agent_sessions.clear_pending(session_id)
     
-    return new_content
+    return result
 
 
-def _extract_context(content: str, selection_start: int, selection_end: int) -> dict:
-    """Extract contextual information around the selection."""
-    lines = content[:selection_start].split('\n')
-    
-    chapter_title = ""
-    section_heading = ""
-    
-    # Find chapter title (first # heading)
-    for line in content.split('\n'):
-        if line.startswith('# '):
-            chapter_title = line[2:].strip()
-            break
-    
-    # Find current section (nearest ## or ### heading before selection)
-    for line in reversed(lines):
-        if line.startswith('## ') or line.startswith('### '):
-            section_heading = line.lstrip('#').strip()
+class ChapterOutline:
+    """Heading and paragraph offsets of one chapter version, for bisect lookups."""
+    __slots__ = ("title", "heading_starts", "headings", "para_starts", "para_ends")
+
+    def __init__(self, content: str):
+        self.title = ""
+        self.heading_starts: list[int] = []
+        self.headings: list[tuple[int, str]] = []  # (level, text) for ## and ###
+        offset = 0
+        for line in content.split('\n'):
+            if not self.title and line.startswith('# '):
+                self.title = line[2:].strip()
+            elif line.startswith('## ') or line.startswith('### '):
+                self.heading_starts.append(offset)
+                self.headings.append((len(line) - len(line.lstrip('#')), line.lstrip('#').strip()))
+            offset += len(line) + 1
+        self.para_starts: list[int] = []
+        self.para_ends: list[int] = []
+        for match in BLOCK_RE.finditer(content):
+            self.para_starts.append(match.start())
+            self.para_ends.append(match.end())
+
+    def section_index(self, position: int) -> int:
+        """Index of the nearest ##/### heading starting before ``position`` (-1 if none)."""
+        return bisect_left(self.heading_starts, position) - 1
+
+
+_outline_cache: OrderedDict[str, ChapterOutline] = OrderedDict()
+
+
+def _chapter_outline(content: str) -> ChapterOutline:
+    """``ChapterOutline`` for this exact content, cached by content hash."""
+    digest = content_hash(content)
+    outline = _outline_cache.get(digest)
+    if outline is None:
+        outline = _outline_cache[digest] = ChapterOutline(content)
+        while len(_outline_cache) > OUTLINE_CACHE_SIZE:
+            _outline_cache.popitem(last=False)
+    else:
+        _outline_cache.move_to_end(digest)
+    return outline
+
+
+def _fit(text: str, budget: int, keep_end: bool) -> str:
+    """``text`` cut to roughly ``budget`` tokens, keeping its end or its start."""
+    tokens = _estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    chars = max(0, len(text) * budget // max(tokens, 1))
+    return text[len(text) - chars:] if keep_end else text[:chars]
+
+
+def _extract_context(
+    content: str,
+    selection_start: int,
+    selection_end: int,
+    budget: int = CONTEXT_TOKENS,
+) -> dict:
+    """Extract contextual information around the selection.
+
+    Besides the chapter title and current section, fills ``budget`` tokens
+    with a section outline (up to a quarter of the budget, centred on the
+    current section) and the nearest paragraphs before and after the
+    selection, alternating sides.
+    """
+    outline = _chapter_outline(content)
+    current = outline.section_index(selection_start)
+
+    # Outline: headings nearest the current section first, then restored to document order.
+    outline_lines: dict[int, str] = {}
+    outline_budget = budget // 4
+    order = sorted(range(len(outline.headings)), key=lambda i: (abs(i - current), i))
+    for i in order:
+        level, text = outline.headings[i]
+        line = f"{'  ' * (level - 2)}- {text}"
+        cost = _estimate_tokens(line) + 1
+        if cost > outline_budget:
             break
-    
-    # Get some surrounding context (200 chars before and after)
-    context_start = max(0, selection_start - 200)
-    context_end = min(len(content), selection_end + 200)
-    surrounding_text = content[context_start:context_end]
-    
+        outline_lines[i] = line
+        outline_budget -= cost
+    remaining = budget - (budget // 4 - outline_budget)
+
+    # Surrounding paragraphs, nearest first, clipped at the selection.
+    before: list[str] = []
+    after: list[str] = []
+    prev = bisect_left(outline.para_starts, selection_start) - 1
+    nxt = bisect_right(outline.para_ends, selection_end)  # May hold the selection's end; clipped below
+    sides = [True, False]
+    while remaining > 0 and sides:
+        for side in list(sides):
+            if side:
+                if prev < 0:
+                    sides.remove(side)
+                    continue
+                text = content[outline.para_starts[prev]:min(outline.para_ends[prev], selection_start)].strip()
+                prev -= 1
+            else:
+                if nxt >= len(outline.para_starts):
+                    sides.remove(side)
+                    continue
+                text = content[max(outline.para_starts[nxt], selection_end):outline.para_ends[nxt]].strip()
+                nxt += 1
+            if not text:
+                continue
+            text = _fit(text, remaining, keep_end=side)
+            (before if side else after).append(text)
+            remaining -= _estimate_tokens(text)
+            if remaining <= 0:
+                break
+
     return {
-        'chapter_title': chapter_title,
-        'section_heading': section_heading,
-        'surrounding_text': surrounding_text,
+        'chapter_title': outline.title,
+        'section_heading': outline.headings[current][1] if current >= 0 else "",
+        'outline': [outline_lines[i] for i in sorted(outline_lines)],
+        'before': "\n\n".join(reversed(before)),
+        'after': "\n\n".join(after),
     }
 
 
-async def _stream_initial_edit(
-    selected_text: str,
-    prompt: str,
-    provider: str,
-    context: dict,
-) -> AsyncIterator[tuple[str, Optional[str]]]:
-    """Stream initial edit using Codex CLI."""
-    import asyncio
-    
+class CodexOutputParser:
+    """Incremental parser for ``codex exec`` output.
+
+    The answer is the non-empty lines between a line reading ``codex`` and
+    the ``tokens used`` footer. ``feed`` takes one line at a time and returns
+    the text to stream, if any, so deltas go out as soon as codex prints them.
+    """
+
+    WAITING, CAPTURING, DONE = "waiting", "capturing", "done"
+
+    def __init__(self):
+        self.state = self.WAITING
+        self.captured: list[str] = []
+        self.last_line = ""  # Fallback answer when nothing is captured
+
+    def feed(self, line: str) -> Optional[str]:
+        stripped = line.strip()
+        if not stripped:
+            return None
+        if 'tokens used' in stripped.lower():
+            self.state = self.DONE
+            return None
+        if stripped == 'codex':
+            if self.state == self.WAITING:
+                self.state = self.CAPTURING
+            return None
+        self.last_line = stripped
+        if self.state != self.CAPTURING:
+            return None
+        self.captured.append(line)
+        return line
+
+    def result(self) -> str:
+        return "".join(self.captured).strip() or self.last_line
+
+
+def _sse(kind: str, payload: dict) -> str:
+    return f"event: {kind}\ndata: {json.dumps(payload)}\n\n"
+
+
+class AgentProvider(abc.ABC):
+    """Produces an edit for a prompt as ``(kind, payload)`` events.
+
+    ``stream`` yields ``delta`` events with ``{'text'}`` as output arrives and
+    finishes with one ``done`` event carrying ``{'replacement'}``. Scheduling,
+    deadlines and timing are handled by ``_agent_events``.
+    """
+
+    name = "base"
+
+    @abc.abstractmethod
+    def stream(self, full_prompt: str) -> AsyncIterator[tuple[str, dict]]:
+        """Async generator of ``(kind, payload)`` events for ``full_prompt``."""
+
+    def warm(self):
+        """Prepare resources ahead of the first request (called at startup)."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {}
+
+
+class CodexProcessPool:
+    """Pre-spawned ``codex exec -`` processes waiting for a prompt on stdin.
+
+    Taking a process from the pool skips CLI startup; each use schedules a
+    background spawn to top the pool back up. Idle processes older than
+    ``max_idle_seconds`` are recycled.
+    """
+
+    def __init__(self, size: int, max_idle_seconds: float = 600.0):
+        self.size = max(0, size)
+        self.max_idle_seconds = max_idle_seconds
+        self._idle: deque[tuple[asyncio.subprocess.Process, float]] = deque()
+        self._refills: set[asyncio.Task] = set()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.refill_failures = 0
+        self.refill_count = 0
+        self.refill_ms_total = 0.0
+        self.last_refill_ms: Optional[float] = None
+
+    @staticmethod
+    async def _spawn() -> asyncio.subprocess.Process:
+        # Call codex CLI in non-interactive mode (uses default gpt-5.2)
+        return await asyncio.create_subprocess_exec(
+            'codex',
+            'exec',
+            '-',  # Read from stdin
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,  # Merge stderr into stdout
+            stdin=asyncio.subprocess.PIPE,
+        )
+
+    @staticmethod
+    async def _discard(process: asyncio.subprocess.Process):
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+    async def acquire(self) -> asyncio.subprocess.Process:
+        """A ready process: from the pool if one is warm, otherwise freshly spawned."""
+        now = time.monotonic()
+        while self._idle:
+            process, spawned_at = self._idle.popleft()
+            if process.returncode is None and now - spawned_at < self.max_idle_seconds:
+                self.hits += 1
+                self.warm()
+                return process
+            await self._discard(process)
+        self.misses += 1
+        self.warm()
+        return await self._spawn()
+
+    def warm(self):
+        """Start background spawns until the pool (plus pending spawns) is full."""
+        if self._closed:
+            return
+        for _ in range(self.size - len(self._idle) - len(self._refills)):
+            task = asyncio.create_task(self._refill())
+            self._refills.add(task)
+            task.add_done_callback(self._refills.discard)
+
+    async def _refill(self):
+        started = time.perf_counter()
+        try:
+            process = await self._spawn()
+        except OSError as e:
+            self.refill_failures += 1
+            print(f"Codex pool refill failed: {e}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.refill_count += 1
+        self.refill_ms_total += elapsed
+        self.last_refill_ms = round(elapsed, 1)
+        if self._closed:
+            await self._discard(process)
+        else:
+            self._idle.append((process, time.monotonic()))
+
+    async def close(self):
+        self._closed = True
+        for task in list(self._refills):
+            task.cancel()
+        while self._idle:
+            process, _ = self._idle.popleft()
+            await self._discard(process)
+
+    def stats(self) -> dict:
+        return {
+            "poolSize": self.size,
+            "idle": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refill_count,
+            "refillFailures": self.refill_failures,
+            "avgRefillMs": round(self.refill_ms_total / self.refill_count, 1) if self.refill_count else None,
+            "lastRefillMs": self.last_refill_ms,
+        }
+
+
+class CodexCLIProvider(AgentProvider):
+    """Runs ``codex exec`` per request and parses its stdout incrementally.
+
+    Processes come from a ``CodexProcessPool`` of ``CODEX_POOL_SIZE`` warm
+    workers (0 disables pre-spawning).
+    """
+
+    name = "codex"
+
+    def __init__(self, pool_size: int = 0):
+        self.pool = CodexProcessPool(pool_size)
+
+    def warm(self):
+        self.pool.warm()
+
+    async def stream(self, full_prompt: str) -> AsyncIterator[tuple[str, dict]]:
+        process = None
+        try:
+            process = await self.pool.acquire()
+
+            # Send prompt to stdin
+            if process.stdin:
+                process.stdin.write(full_prompt.encode('utf-8'))
+                await process.stdin.drain()
+                process.stdin.close()
+
+            parser = CodexOutputParser()
+            if process.stdout:
+                while line := await process.stdout.readline():
+                    delta = parser.feed(line.decode('utf-8', errors='ignore'))
+                    if delta is not None:
+                        yield 'delta', {'text': delta}
+
+            await process.wait()
+            yield 'done', {'replacement': parser.result()}
+        finally:
+            # On timeout or client disconnect, don't leave codex running.
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def close(self):
+        await self.pool.close()
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+
+class OpenAICompatibleProvider(AgentProvider):
+    """Streams chat completions from an OpenAI-compatible HTTP API.
+
+    One ``httpx.AsyncClient`` is shared by all requests, so connections
+    (and TLS sessions) are kept alive and reused instead of paying process
+    startup and auth on every edit.
+    """
+
+    name = "http"
+
+    def __init__(self, base_url: str, api_key: str, model: str, max_connections: int = 8, transport=None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.max_connections = max_connections
+        self.transport = transport  # httpx transport override (tests)
+        self._client = None
+
+    def _http(self):
+        import httpx
+
+        if self._client is None:
+            headers = {'Authorization': f'Bearer {self.api_key}'} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                transport=self.transport,
+                timeout=httpx.Timeout(DEADLINE_SECONDS, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=300.0,
+                ),
+            )
+        return self._client
+
+    async def stream(self, full_prompt: str) -> AsyncIterator[tuple[str, dict]]:
+        body = {
+            'model': self.model,
+            'stream': True,
+            'messages': [{'role': 'user', 'content': full_prompt}],
+        }
+        parts = []
+        async with self._http().stream('POST', '/chat/completions', json=body) as response:
+            if response.status_code >= 400:
+                detail = (await response.aread()).decode('utf-8', errors='ignore')[:200]
+                raise RuntimeError(f'LLM API returned {response.status_code}: {detail}')
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    # Keep reading to the end of the body so the connection returns to the pool.
+                    continue
+                try:
+                    chunk = json.loads(data)
+                except ValueError:
+                    continue
+                for choice in chunk.get('choices') or []:
+                    text = (choice.get('delta') or {}).get('content')
+                    if text:
+                        parts.append(text)
+                        yield 'delta', {'text': text}
+        yield 'done', {'replacement': "".join(parts).strip()}
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def _make_provider() -> AgentProvider:
+    if AGENT_BACKEND == 'http':
+        return OpenAICompatibleProvider(LLM_BASE_URL, LLM_API_KEY, LLM_MODEL)
+    return CodexCLIProvider(CODEX_POOL_SIZE)
+
+
+# Global agent provider (ZENAPP_AGENT_BACKEND=codex|http)
+agent_provider = _make_provider()
+
+
+def warm_provider():
+    agent_provider.warm()
+
+
+def save_state():
+    """Persist prompt usage counts."""
+    prompt_usage.save()
+
+
+async def close_provider():
+    await agent_provider.close()
+
+
+async def _agent_events(full_prompt: str, handle: Optional[RunHandle] = None) -> AsyncIterator[tuple[str, dict]]:
+    """Run ``full_prompt`` on the agent provider through the scheduler.
+
+    Yields ``queued`` (queue position while waiting for a slot), ``delta``,
+    ``done`` (with ``ttftMs``/``totalMs``) and ``error`` events. The whole
+    request (queue wait included) is bounded by the scheduler deadline.
+    Runs are interactive unless ``handle`` says otherwise; speculative runs
+    are cancelled if the scheduler preempts them.
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DEADLINE_SECONDS
+
+    def remaining() -> float:
+        return max(0.0, deadline - loop.time())
+
+    priority = handle.priority if handle else INTERACTIVE
+    on_preempt = asyncio.current_task().cancel if priority > INTERACTIVE else None
+    try:
+        ticket = agent_scheduler.enqueue(priority, on_preempt)
+    except SchedulerBusyError as e:
+        yield 'error', {'error': str(e)}
+        return
+    if handle is not None:
+        handle.ticket = ticket
+
+    first_delta_at = None
+    events = None
+    try:
+        positions = ticket.wait()
+        while True:
+            try:
+                position = await asyncio.wait_for(anext(positions), remaining())
+            except StopAsyncIteration:
+                break
+            yield 'queued', {'position': position}
+
+        events = agent_provider.stream(full_prompt)
+        while True:
+            try:
+                kind, payload = await asyncio.wait_for(anext(events), remaining())
+            except StopAsyncIteration:
+                break
+            if kind == 'delta' and first_delta_at is None:
+                first_delta_at = time.perf_counter()
+            elif kind == 'done':
+                payload = {
+                    **payload,
+                    'ttftMs': round((first_delta_at - started) * 1000, 1) if first_delta_at else None,
+                    'totalMs': round((time.perf_counter() - started) * 1000, 1),
+                }
+            yield kind, payload
+
+    except asyncio.TimeoutError:
+        yield 'error', {'error': f'Agent timed out after {DEADLINE_SECONDS:.0f}s'}
+    except Exception as e:
+        yield 'error', {'error': str(e)}
+    finally:
+        if events is not None:
+            await events.aclose()
+        ticket.release()
+
+
+async def _run_agent(full_prompt: str, handle: Optional[RunHandle] = None) -> AsyncIterator[tuple[str, Optional[str]]]:
+    """``_agent_events`` as SSE text, plus the final replacement on ``done``."""
+    async for kind, payload in _agent_events(full_prompt, handle):
+        yield _sse(kind, payload), payload['replacement'] if kind == 'done' else None
+
+
+def _initial_prompt(selected_text: str, prompt: str, context: dict) -> str:
     # Construct the prompt with context
     context_info = []
     if context.get('chapter_title'):
         context_info.append(f"Chapter: {context['chapter_title']}")
     if context.get('section_heading'):
         context_info.append(f"Section: {context['section_heading']}")
+    if context.get('outline'):
+        context_info.append("Chapter outline:\n" + "\n".join(context['outline']))
+    if context.get('before'):
+        context_info.append(f"Text before the passage (context only, do not edit):\n{context['before']}")
+    if context.get('after'):
+        context_info.append(f"Text after the passage (context only, do not edit):\n{context['after']}")
     
-    context_str = "\n".join(context_info)
+    context_str = "\n\n".join(context_info)
     
-    full_prompt = f'''{AGENT_SYSTEM_PROMPT}
+    return f'''{AGENT_SYSTEM_PROMPT}
 
 {context_str}
 
 Edit this text: "{selected_text}"
 
 Instruction: {prompt}'''
-    
+
+
+async def _stream_initial_edit(
+    selected_text: str,
+    prompt: str,
+    context: dict,
+    handle: Optional[RunHandle] = None,
+) -> AsyncIterator[tuple[str, Optional[str]]]:
+    """Stream initial edit from the agent provider."""
+    async for item in _run_agent(_initial_prompt(selected_text, prompt, context), handle):
+        yield item
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per four other characters."""
+    cjk = len(CJK_CHAR_RE.findall(text))
+    return cjk + (len(text) - cjk) // 4
+
+
+def _split_chunks(text: str, max_tokens: int = CHUNK_TOKENS) -> list[tuple[int, int]]:
+    """Split ``text`` at blank lines and headings into ``(start, end)`` spans of about ``max_tokens``.
+
+    Spans exclude the blank-line separators between them, so the text can be
+    reassembled by keeping everything outside the spans verbatim. A heading
+    is never left as the last block of a chunk.
+    """
+    blocks = []  # (start, end, is_bare_heading)
+    for match in BLOCK_RE.finditer(text):
+        block = match.group(0)
+        blocks.append((match.start(), match.end(), block.lstrip().startswith('#') and '\n' not in block))
+
+    chunks: list[list[tuple[int, int, bool]]] = []
+    current: list[tuple[int, int, bool]] = []
+    tokens = 0
+    for block in blocks:
+        size = _estimate_tokens(text[block[0]:block[1]])
+        if current and tokens + size > max_tokens:
+            carried = []
+            while len(current) > 1 and current[-1][2]:
+                carried.insert(0, current.pop())
+            chunks.append(current)
+            current, tokens = carried, sum(_estimate_tokens(text[b[0]:b[1]]) for b in carried)
+        current.append(block)
+        tokens += size
+    if current:
+        chunks.append(current)
+    return [(chunk[0][0], chunk[-1][1]) for chunk in chunks]
+
+
+def _is_chapter_selection(content: str, selection_start: int, selection_end: int) -> bool:
+    """True when the selection is the whole chapter and too long for one prompt."""
+    return (
+        not content[:selection_start].strip()
+        and not content[selection_end:].strip()
+        and _estimate_tokens(content[selection_start:selection_end]) > CHUNK_TOKENS
+    )
+
+
+async def _stream_chapter_edit(
+    content: str,
+    selection_start: int,
+    selection_end: int,
+    prompt: str,
+) -> AsyncIterator[tuple[str, Optional[str]]]:
+    """Edit a long selection as concurrent paragraph chunks, streamed back in document order.
+
+    Each chunk is a separate agent run (at most ``CHAPTER_WORKERS`` at a
+    time, all still subject to the global scheduler). The head chunk streams
+    live; later chunks buffer until everything before them is done. Chunks
+    that fail keep their original text.
+    """
+    started = time.perf_counter()
+    text = content[selection_start:selection_end]
+    spans = _split_chunks(text)
+    deltas: list[list[str]] = [[] for _ in spans]
+    results: list[Optional[str]] = [None] * len(spans)
+    errors: list[Optional[str]] = [None] * len(spans)
+    changed = asyncio.Event()
+    workers = asyncio.Semaphore(min(CHAPTER_WORKERS, agent_scheduler.max_concurrency))
+
+    async def run_chunk(i: int, start: int, end: int):
+        chunk = text[start:end]
+        try:
+            async with workers:
+                context = _extract_context(content, selection_start + start, selection_start + end)
+                async for kind, payload in _agent_events(_initial_prompt(chunk, prompt, context)):
+                    if kind == 'delta':
+                        deltas[i].append(payload['text'])
+                    elif kind == 'done':
+                        results[i] = payload['replacement']
+                    elif kind == 'error':
+                        errors[i] = payload['error']
+                    changed.set()
+        finally:
+            if not results[i]:
+                results[i] = chunk
+                errors[i] = errors[i] or 'Empty response'
+            changed.set()
+
+    tasks = [asyncio.create_task(run_chunk(i, start, end)) for i, (start, end) in enumerate(spans)]
+    first_delta_at = None
     try:
-        # Call codex CLI in non-interactive mode (uses default gpt-5.2)
-        process = await asyncio.create_subprocess_exec(
-            'codex',
-            'exec',
-            '-',  # Read from stdin
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,  # Merge stderr into stdout
-            stdin=asyncio.subprocess.PIPE,
-        )
-        
-        # Send prompt to stdin
-        if process.stdin:
-            process.stdin.write(full_prompt.encode('utf-8'))
-            await process.stdin.drain()
-            process.stdin.close()
-        
-        full_response = ""
-        all_output = []
-        
-        # Collect all output first
-        if process.stdout:
-            async for line in process.stdout:
-                line_str = line.decode('utf-8', errors='ignore')
-                all_output.append(line_str)
-        
-        await process.wait()
-        
-        # Parse output: find lines between "codex" and "tokens used"
-        capturing = False
-        for line_str in all_output:
-            stripped = line_str.strip()
-            
-            if stripped == 'codex':
-                capturing = True
+        head, emitted, completed = 0, 0, 0
+        while head < len(spans):
+            while emitted < len(deltas[head]):
+                if first_delta_at is None:
+                    first_delta_at = time.perf_counter()
+                yield _sse('delta', {'text': deltas[head][emitted]}), None
+                emitted += 1
+            finished = sum(result is not None for result in results)
+            if finished != completed:
+                completed = finished
+                yield _sse('progress', {'completed': completed, 'total': len(spans)}), None
+            if results[head] is not None:
+                head, emitted = head + 1, 0
+                if head < len(spans):
+                    yield _sse('delta', {'text': text[spans[head - 1][1]:spans[head][0]]}), None
                 continue
-            
-            if 'tokens used' in stripped.lower():
-                break
-            
-            if capturing and stripped:
-                full_response += line_str
-                yield f"event: delta\ndata: {json.dumps({'text': line_str})}\n\n", None
-        
-        # Clean up response
-        full_response = full_response.strip()
-        
-        if not full_response:
-            # Fallback: take last non-empty line before "tokens used"
-            for line_str in reversed(all_output):
-                stripped = line_str.strip()
-                if stripped and 'tokens used' not in stripped.lower() and stripped != 'codex':
-                    full_response = stripped
-                    break
-        
-        yield f"event: done\ndata: {json.dumps({'replacement': full_response})}\n\n", full_response
-        
-    except Exception as e:
-        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n", None
+            changed.clear()
+            await changed.wait()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    pieces = [text[:spans[0][0]]]
+    for i, (start, end) in enumerate(spans):
+        if i:
+            pieces.append(text[spans[i - 1][1]:start])
+        pieces.append(results[i])
+    pieces.append(text[spans[-1][1]:])
+    replacement = "".join(pieces)
+
+    failed = sum(error is not None for error in errors)
+    if failed:
+        message = f"{failed} of {len(spans)} sections could not be edited and were left unchanged"
+        yield _sse('error', {'error': message}), None
+    yield _sse('done', {
+        'replacement': replacement,
+        'chunks': len(spans),
+        'failedChunks': failed,
+        'ttftMs': round((first_delta_at - started) * 1000, 1) if first_delta_at else None,
+        'totalMs': round((time.perf_counter() - started) * 1000, 1),
+    }), replacement
 
 
 async def _stream_revision(
@@ -272,11 +1072,8 @@ async def _stream_revision(
     current_suggestion: str,
     prompt_history: list[str],
     revision_prompt: str,
-    provider: str,
 ) -> AsyncIterator[tuple[str, Optional[str]]]:
-    """Stream revised suggestion using Codex CLI."""
-    import asyncio
-    
+    """Stream revised suggestion from the agent provider."""
     # Build context with history
     history_text = "\n".join(f"- {p}" for p in prompt_history)
     
@@ -292,61 +1089,9 @@ Your previous suggestion: "{current_suggestion}"
 New feedback: {revision_prompt}
 
 Please provide a revised version:'''
-    
-    try:
-        process = await asyncio.create_subprocess_exec(
-            'codex',
-            'exec',
-            '-',
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.STDOUT,
-            stdin=asyncio.subprocess.PIPE,
-        )
-        
-        if process.stdin:
-            process.stdin.write(full_prompt.encode('utf-8'))
-            await process.stdin.drain()
-            process.stdin.close()
-        
-        full_response = ""
-        all_output = []
-        
-        if process.stdout:
-            async for line in process.stdout:
-                line_str = line.decode('utf-8', errors='ignore')
-                all_output.append(line_str)
-        
-        await process.wait()
-        
-        # Parse output
-        capturing = False
-        for line_str in all_output:
-            stripped = line_str.strip()
-            
-            if stripped == 'codex':
-                capturing = True
-                continue
-            
-            if 'tokens used' in stripped.lower():
-                break
-            
-            if capturing and stripped:
-                full_response += line_str
-                yield f"event: delta\ndata: {json.dumps({'text': line_str})}\n\n", None
-        
-        full_response = full_response.strip()
-        
-        if not full_response:
-            for line_str in reversed(all_output):
-                stripped = line_str.strip()
-                if stripped and 'tokens used' not in stripped.lower() and stripped != 'codex':
-                    full_response = stripped
-                    break
-        
-        yield f"event: done\ndata: {json.dumps({'replacement': full_response})}\n\n", full_response
-        
-    except Exception as e:
-        yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n", None
+
+    async for item in _run_agent(full_prompt):
+        yield item
 
 
 async def _mock_stream(selected_text: str, prompt: str) -> AsyncIterator[tuple[str, Optional[str]]]:
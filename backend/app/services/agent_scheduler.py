@@ -0,0 +1,181 @@
+"""Admission control for agent subprocesses.
+
+At most ``ZENAPP_AGENT_MAX_CONCURRENCY`` agent runs execute at once; the
+rest wait in a queue ordered by priority, then arrival (FIFO), and can
+report their position while they wait. When the queue itself is full
+new requests are refused with ``SchedulerBusyError`` instead of piling
+up processes.
+
+Speculative work never queues: it only starts when a slot is free right
+now, and a running speculative ticket is preempted (its ``on_preempt``
+callback, normally a task cancel) as soon as an interactive request needs
+the slot. A speculative run that a user starts waiting on is promoted to
+interactive and can no longer be preempted.
+"""
+import asyncio
+import itertools
+import os
+from typing import AsyncIterator, Callable, Optional
+
+MAX_CONCURRENCY = int(os.getenv("ZENAPP_AGENT_MAX_CONCURRENCY", "2"))
+MAX_QUEUE = int(os.getenv("ZENAPP_AGENT_MAX_QUEUE", "16"))
+DEADLINE_SECONDS = float(os.getenv("ZENAPP_AGENT_DEADLINE_SECONDS", "180"))
+
+INTERACTIVE = 0
+SPECULATIVE = 1
+
+
+class SchedulerBusyError(Exception):
+    """Raised when the wait queue is full."""
+
+
+class Ticket:
+    """A request's place in the scheduler; release it when the run ends."""
+    __slots__ = ("scheduler", "priority", "seq", "granted", "released", "on_preempt", "_changed")
+
+    def __init__(self, scheduler: "AgentScheduler", priority: int, seq: int, on_preempt: Optional[Callable] = None):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.released = False
+        self.on_preempt = on_preempt
+        self._changed = asyncio.Event()
+
+    def _notify(self):
+        self._changed.set()
+
+    @property
+    def position(self) -> int:
+        """1-based position in the wait queue (0 once running)."""
+        return 0 if self.granted else self.scheduler._position(self)
+
+    async def wait(self) -> AsyncIterator[int]:
+        """Yield the queue position whenever it changes, returning once granted."""
+        last = None
+        while not self.granted:
+            position = self.position
+            if position != last:
+                last = position
+                yield position
+            self._changed.clear()
+            await self._changed.wait()
+
+    def promote(self):
+        """Make this ticket interactive (and no longer preemptible)."""
+        self.on_preempt = None
+        if self.priority > INTERACTIVE:
+            self.priority = INTERACTIVE
+            self.scheduler._resort()
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.scheduler._release(self)
+
+
+class RunHandle:
+    """Lets code outside a run promote its ticket once it exists."""
+    __slots__ = ("priority", "ticket")
+
+    def __init__(self, priority: int):
+        self.priority = priority
+        self.ticket: Optional[Ticket] = None
+
+    def promote(self):
+        self.priority = INTERACTIVE
+        if self.ticket is not None:
+            self.ticket.promote()
+
+
+class AgentScheduler:
+    """Concurrency cap plus a priority/FIFO wait queue, shared by all agent runs."""
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, max_queue: int = MAX_QUEUE):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self._running: set[Ticket] = set()
+        self._waiting: list[Ticket] = []
+        self._seq = itertools.count()
+        self.completed = 0
+        self.rejected = 0
+        self.preempted = 0
+
+    def _position(self, ticket: Ticket) -> int:
+        return self._waiting.index(ticket) + 1 if ticket in self._waiting else 0
+
+    def _grant(self):
+        changed = False
+        while self._waiting and len(self._running) < self.max_concurrency:
+            ticket = self._waiting.pop(0)
+            ticket.granted = True
+            self._running.add(ticket)
+            ticket._notify()
+            changed = True
+        if changed:
+            for ticket in self._waiting:
+                ticket._notify()
+
+    def _resort(self):
+        self._waiting.sort(key=lambda t: (t.priority, t.seq))
+        for ticket in self._waiting:
+            ticket._notify()
+
+    def _preempt_for(self, priority: int) -> bool:
+        """Preempt the lowest-priority preemptible running ticket below ``priority``."""
+        victims = [t for t in self._running if t.priority > priority and t.on_preempt is not None]
+        if not victims:
+            return False
+        victim = max(victims, key=lambda t: (t.priority, t.seq))
+        callback, victim.on_preempt = victim.on_preempt, None
+        self.preempted += 1
+        callback()
+        return True
+
+    def enqueue(self, priority: int = INTERACTIVE, on_preempt: Optional[Callable] = None) -> Ticket:
+        """Take a ticket; it is granted immediately when a slot is free.
+
+        Speculative tickets are refused unless a slot is free now. Interactive
+        tickets preempt running speculative work when all slots are busy.
+        """
+        full = len(self._running) >= self.max_concurrency
+        if priority > INTERACTIVE and (full or self._waiting):
+            raise SchedulerBusyError("No idle agent slot for speculative work")
+        preempted = full and self._preempt_for(priority)
+        if full and not preempted and len(self._waiting) >= self.max_queue:
+            self.rejected += 1
+            raise SchedulerBusyError("Agent is busy, please try again shortly")
+        ticket = Ticket(self, priority, next(self._seq), on_preempt)
+        self._waiting.append(ticket)
+        self._waiting.sort(key=lambda t: (t.priority, t.seq))
+        self._grant()
+        return ticket
+
+    def _release(self, ticket: Ticket):
+        if ticket in self._running:
+            self._running.discard(ticket)
+            self.completed += 1
+        elif ticket in self._waiting:
+            self._waiting.remove(ticket)
+            for other in self._waiting:
+                other._notify()
+        self._grant()
+
+    def idle_slots(self) -> int:
+        """Slots free right now (0 while anything is queued)."""
+        return 0 if self._waiting else max(0, self.max_concurrency - len(self._running))
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": len(self._waiting),
+            "maxConcurrency": self.max_concurrency,
+            "maxQueue": self.max_queue,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "preempted": self.preempted,
+        }
+
+
+# Global agent scheduler
+agent_scheduler = AgentScheduler()
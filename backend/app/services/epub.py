@@ -0,0 +1,277 @@
+"""EPUB 3 export.
+
+Each chapter is rendered to an XHTML fragment once and cached on disk
+under its content hash, so re-exporting a book after editing one chapter
+only re-renders that chapter. Cache misses in large books are rendered in
+parallel worker processes. Referenced book images are downsized once and
+embedded.
+"""
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from html import escape
+from pathlib import Path
+from typing import Iterator, Optional
+from urllib.parse import unquote
+
+from PIL import Image
+
+from . import storage
+from .images import SAFE_NAME_RE
+from .metadata_index import content_hash
+from .render import render_markdown
+
+FRAGMENT_VERSION = 1
+PARALLEL_THRESHOLD = 4
+IMAGE_MAX_WIDTH = 1000
+IMAGE_QUALITY = 80
+CHUNK_SIZE = 64 * 1024
+
+EPUB_CACHE_DIR = storage.CACHE_DIR / "epub"
+IMAGE_SRC_RE = re.compile(r'src="/api/books/([^/"]+)/images/([^"/?#]+)"')
+IMAGE_TAG_RE = re.compile(r'<img\b[^>]*?\bsrc="/api/books/([^/"]+)/images/([^"/?#]+)"[^>]*>')
+CJK_RE = re.compile("[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]")
+
+STYLE_CSS = """body { font-family: serif; line-height: 1.6; }
+img { max-width: 100%; height: auto; }
+blockquote { margin-left: 1em; padding-left: 1em; border-left: 3px solid #ccc; }
+pre { white-space: pre-wrap; }
+"""
+
+
+def _fragment_path(digest: str) -> Path:
+    return EPUB_CACHE_DIR / "fragments" / f"{digest}-v{FRAGMENT_VERSION}.xhtml"
+
+
+def _render_fragments(book_slug: str, chapters: list[dict]) -> list[str]:
+    """XHTML body for each chapter, from cache or freshly rendered."""
+    fragments: list[Optional[str]] = []
+    misses: list[tuple[int, Path, str]] = []
+    chapters_dir = storage.DATA_DIR / book_slug / "chapters"
+
+    for i, ch in enumerate(chapters):
+        digest = storage.get_chapter_hash(book_slug, ch["slug"])
+        cached = _fragment_path(digest) if digest else None
+        if cached is not None and cached.exists():
+            fragments.append(cached.read_text(encoding="utf-8"))
+            continue
+        fragments.append(None)
+        try:
+            content = (chapters_dir / f"{ch['slug']}.md").read_text()
+        except FileNotFoundError:
+            content = ""
+        misses.append((i, cached, content))
+
+    if len(misses) >= PARALLEL_THRESHOLD:
+        workers = min(len(misses), os.cpu_count() or 1)
+        # spawn, not fork: the server process is multi-threaded.
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            rendered = list(pool.map(render_markdown, [content for _, _, content in misses]))
+    else:
+        rendered = [render_markdown(content) for _, _, content in misses]
+
+    for (i, cached, _), fragment in zip(misses, rendered):
+        fragments[i] = fragment
+        if cached is not None:
+            cached.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+            tmp.write_text(fragment, encoding="utf-8")
+            os.replace(tmp, cached)
+    return fragments
+
+
+def _downsized_image(book_slug: str, source: Path) -> Optional[bytes]:
+    """JPEG bytes of a book image scaled to the EPUB width, cached on disk.
+
+    The cache entry is keyed by book, full filename, size and mtime, so a
+    replaced image or a same-named image in another book is never reused.
+    """
+    try:
+        st = source.stat()
+    except OSError:
+        return None
+    key = content_hash(f"{book_slug}/{source.name}:{st.st_size}:{st.st_mtime_ns}")
+    cached = EPUB_CACHE_DIR / "images" / f"{key}-{IMAGE_MAX_WIDTH}.jpg"
+    if cached.exists():
+        return cached.read_bytes()
+    try:
+        with Image.open(source) as img:
+            img.draft("RGB", (IMAGE_MAX_WIDTH, IMAGE_MAX_WIDTH * 4))
+            img = img.convert("RGB")
+            if img.width > IMAGE_MAX_WIDTH:
+                img = img.resize(
+                    (IMAGE_MAX_WIDTH, int(img.height * IMAGE_MAX_WIDTH / img.width)),
+                    Image.Resampling.LANCZOS,
+                )
+            output = io.BytesIO()
+            img.save(output, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+    except (OSError, ValueError) as e:
+        print(f"EPUB image skipped {source.name}: {e}")
+        return None
+    data = output.getvalue()
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    cached.write_bytes(data)
+    return data
+
+
+def _chapter_xhtml(title: str, body: str, lang: str) -> str:
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="{lang}" lang="{lang}">
+<head>
+<title>{escape(title)}</title>
+<link rel="stylesheet" type="text/css" href="../style.css" />
+</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def _nav_xhtml(title: str, chapters: list[dict], lang: str) -> str:
+    items = "\n".join(
+        f'<li><a href="text/ch{i:03d}.xhtml">{escape(ch["title"])}</a></li>'
+        for i, ch in enumerate(chapters, start=1)
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops" xml:lang="{lang}" lang="{lang}">
+<head><title>{escape(title)}</title></head>
+<body>
+<nav epub:type="toc" id="toc">
+<h1>{escape(title)}</h1>
+<ol>
+{items}
+</ol>
+</nav>
+</body>
+</html>
+"""
+
+
+def _content_opf(book: dict, chapters: list[dict], images: list[str], lang: str) -> str:
+    identifier = uuid.uuid5(uuid.NAMESPACE_URL, f"zenapp:book:{book['slug']}")
+    modified = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+    manifest = [
+        '<item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" properties="nav" />',
+        '<item id="css" href="style.css" media-type="text/css" />',
+    ]
+    manifest += [
+        f'<item id="ch{i:03d}" href="text/ch{i:03d}.xhtml" media-type="application/xhtml+xml" />'
+        for i in range(1, len(chapters) + 1)
+    ]
+    manifest += [
+        f'<item id="img{i:03d}" href="images/{escape(name)}" media-type="image/jpeg" />'
+        for i, name in enumerate(images, start=1)
+    ]
+    spine = "\n".join(f'<itemref idref="ch{i:03d}" />' for i in range(1, len(chapters) + 1))
+    creator = f"<dc:creator>{escape(book['author'])}</dc:creator>" if book.get("author") else ""
+    manifest_xml = "\n".join(manifest)
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="bookid" xml:lang="{lang}">
+<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:identifier id="bookid">urn:uuid:{identifier}</dc:identifier>
+<dc:title>{escape(book['title'])}</dc:title>
+{creator}
+<dc:language>{lang}</dc:language>
+<meta property="dcterms:modified">{modified}</meta>
+</metadata>
+<manifest>
+{manifest_xml}
+</manifest>
+<spine>
+{spine}
+</spine>
+</package>
+"""
+
+
+CONTAINER_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+<rootfiles>
+<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml" />
+</rootfiles>
+</container>
+"""
+
+
+def build_epub(book_slug: str) -> Optional[tempfile.SpooledTemporaryFile]:
+    """Build the book's EPUB into a temporary file positioned at 0."""
+    book = storage.get_book(book_slug)
+    if not book:
+        return None
+    chapters = book["chapters"]
+    lang = "zh" if CJK_RE.search(book["title"]) else "en"
+    images_dir = storage.DATA_DIR / book_slug / "images"
+
+    fragments = _render_fragments(book_slug, chapters)
+
+    # Downsize every image of this book the chapters reference.
+    referenced = {
+        unquote(filename)
+        for fragment in fragments
+        for ref_book, filename in IMAGE_SRC_RE.findall(fragment)
+        if unquote(ref_book) == book_slug and SAFE_NAME_RE.match(unquote(filename))
+    }
+    embedded: dict[str, str] = {}  # source filename -> name inside the EPUB
+    image_data = {}
+    for filename in sorted(referenced):
+        source = images_dir / filename
+        data = _downsized_image(book_slug, source) if source.is_file() else None
+        if data is None:
+            continue
+        # Keep the full filename so photo.png and photo.jpg stay distinct.
+        name = filename if filename.lower().endswith(".jpg") else f"{filename}.jpg"
+        n = 1
+        while name in image_data:
+            n += 1
+            name = f"{filename}-{n}.jpg"
+        embedded[filename] = name
+        image_data[name] = data
+
+    def rewrite(match: re.Match) -> str:
+        ref_book, filename = unquote(match.group(1)), unquote(match.group(2))
+        if ref_book != book_slug:
+            return match.group(0)
+        if filename not in embedded:
+            return ""  # Missing or unreadable: drop it rather than reference a file not in the EPUB
+        src = f'src="../images/{escape(embedded[filename], quote=True)}"'
+        return IMAGE_SRC_RE.sub(lambda _: src, match.group(0), count=1)
+
+    bodies = [IMAGE_TAG_RE.sub(rewrite, fragment) for fragment in fragments]
+
+    output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        # The mimetype entry must come first and be stored uncompressed.
+        zf.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", CONTAINER_XML)
+        zf.writestr("OEBPS/content.opf", _content_opf(book, chapters, list(image_data), lang))
+        zf.writestr("OEBPS/nav.xhtml", _nav_xhtml(book["title"], chapters, lang))
+        zf.writestr("OEBPS/style.css", STYLE_CSS)
+        for i, (ch, body) in enumerate(zip(chapters, bodies), start=1):
+            zf.writestr(f"OEBPS/text/ch{i:03d}.xhtml", _chapter_xhtml(ch["title"], body, lang))
+        for name, data in image_data.items():
+            zf.writestr(f"OEBPS/images/{name}", data, compress_type=zipfile.ZIP_STORED)
+    output.seek(0)
+    return output
+
+
+def export_epub(book_slug: str) -> Optional[Iterator[bytes]]:
+    """Build the EPUB, then stream it in chunks."""
+    output = build_epub(book_slug)
+    if output is None:
+        return None
+
+    def generate() -> Iterator[bytes]:
+        with output:
+            while chunk := output.read(CHUNK_SIZE):
+                yield chunk
+
+    return generate()
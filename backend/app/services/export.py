@@ -0,0 +1,124 @@
+"""Whole-book export as a stream of bytes.
+
+Both formats are generators that read chapters (and images) in fixed-size
+chunks, so memory stays flat no matter how large the book is. The zip is
+written to an unseekable sink, which makes ``zipfile`` emit data
+descriptors instead of seeking back to patch headers.
+"""
+import json
+import zipfile
+from pathlib import Path
+from typing import Iterator, Optional
+
+from . import storage
+from .images import is_variant
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _StreamSink:
+    """Write-only file object whose buffered bytes are drained by the generator."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        if chunks:
+            yield b"".join(chunks)
+
+
+def _chapter_files(book_slug: str) -> Optional[tuple[dict, list[tuple[str, Path]]]]:
+    book = storage.get_book(book_slug)
+    if not book:
+        return None
+    chapters_dir = storage.DATA_DIR / book_slug / "chapters"
+    return book, [(ch["slug"], chapters_dir / f"{ch['slug']}.md") for ch in book["chapters"]]
+
+
+def _image_files(book_slug: str) -> list[Path]:
+    images_dir = storage.DATA_DIR / book_slug / "images"
+    if not images_dir.is_dir():
+        return []
+    # Only the uploaded images: responsive variants are regenerated from them.
+    return sorted(
+        p for p in images_dir.iterdir()
+        if p.is_file() and not p.name.startswith(".") and not is_variant(p)
+    )
+
+
+def _read_chunks(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+def export_markdown(book_slug: str) -> Optional[Iterator[bytes]]:
+    """All chapters in ``chapterOrder`` concatenated into one Markdown stream."""
+    found = _chapter_files(book_slug)
+    if found is None:
+        return None
+    _, chapter_files = found
+
+    def generate() -> Iterator[bytes]:
+        for i, (_, path) in enumerate(chapter_files):
+            if i:
+                yield b"\n\n"
+            try:
+                yield from _read_chunks(path)
+            except FileNotFoundError:
+                continue
+
+    return generate()
+
+
+def export_zip(book_slug: str) -> Optional[Iterator[bytes]]:
+    """Zip with ``book.json``, numbered chapter files and the book's images."""
+    found = _chapter_files(book_slug)
+    if found is None:
+        return None
+    book, chapter_files = found
+
+    def generate() -> Iterator[bytes]:
+        sink = _StreamSink()
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            manifest = {
+                "slug": book["slug"],
+                "title": book["title"],
+                "author": book["author"],
+                "chapterOrder": [slug for slug, _ in chapter_files],
+            }
+            zf.writestr("book.json", json.dumps(manifest, indent=2, ensure_ascii=False))
+            yield from sink.drain()
+
+            width = max(2, len(str(len(chapter_files))))
+            for i, (slug, path) in enumerate(chapter_files, start=1):
+                try:
+                    with zf.open(f"chapters/{i:0{width}d}-{slug}.md", "w") as dest:
+                        for chunk in _read_chunks(path):
+                            dest.write(chunk)
+                            yield from sink.drain()
+                except FileNotFoundError:
+                    continue
+                yield from sink.drain()
+
+            for path in _image_files(book_slug):
+                # Images are already compressed; store them as-is.
+                info = zipfile.ZipInfo.from_file(path, f"images/{path.name}")
+                info.compress_type = zipfile.ZIP_STORED
+                with zf.open(info, "w") as dest:
+                    for chunk in _read_chunks(path):
+                        dest.write(chunk)
+                        yield from sink.drain()
+                yield from sink.drain()
+        yield from sink.drain()
+
+    return generate()
@@ -0,0 +1,270 @@
+"""Background git committer for book data.
+
+Storage writes enqueue the paths they touched and return immediately.
+A single worker thread coalesces rapid changes to the same book into one
+commit once the book has been idle for a short while, then pushes with
+exponential backoff. Every enqueued change gets an id whose status
+(pending -> committed -> pushed, or failed) can be queried later.
+"""
+import os
+import subprocess
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+REPO_ROOT = Path(__file__).parent.parent.parent.parent
+
+ENABLED = os.getenv("ZENAPP_GIT_SYNC", "1") != "0"
+IDLE_SECONDS = float(os.getenv("ZENAPP_GIT_IDLE_SECONDS", "2.0"))
+PUSH_RETRY_BASE_SECONDS = 2.0
+PUSH_RETRY_MAX_SECONDS = 300.0
+MAX_TRACKED_JOBS = 1000
+
+PENDING = "pending"
+COMMITTED = "committed"
+PUSHED = "pushed"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+def _utc_now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def run_git(args: list[str]) -> subprocess.CompletedProcess:
+    """Run git command in repo root."""
+    return subprocess.run(
+        ["git", *args],
+        cwd=REPO_ROOT,
+        text=True,
+        capture_output=True,
+        check=False,
+    )
+
+
+def _is_missing_pathspec(stderr: str) -> bool:
+    lowered = stderr.lower()
+    return "pathspec" in lowered and ("did not match any file" in lowered or "did not match any files" in lowered)
+
+
+class _Batch:
+    """Changes to one book waiting for the idle timer."""
+    __slots__ = ("book_slug", "paths", "messages", "job_ids", "last_update")
+
+    def __init__(self, book_slug: str):
+        self.book_slug = book_slug
+        self.paths: list[str] = []
+        self.messages: list[str] = []
+        self.job_ids: list[str] = []
+        self.last_update = 0.0
+
+
+class CommitQueue:
+    """Coalescing commit queue served by one background thread."""
+
+    def __init__(self, idle_seconds: float = IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._cond = threading.Condition()
+        self._batches: dict[str, _Batch] = {}
+        self._jobs: OrderedDict[str, dict] = OrderedDict()
+        self._unpushed: list[str] = []
+        self._push_attempts = 0
+        self._next_push_at: Optional[float] = None
+        self._flush_requested = False
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, book_slug: str, paths: list[str], message: str) -> dict:
+        """Queue paths for commit and return the job status record."""
+        if not ENABLED:
+            return {"id": None, "status": DISABLED}
+        job_id = uuid.uuid4().hex[:12]
+        now = _utc_now()
+        job = {
+            "id": job_id,
+            "bookSlug": book_slug,
+            "message": message,
+            "status": PENDING,
+            "commit": None,
+            "error": None,
+            "queuedAt": now,
+            "updatedAt": now,
+        }
+        with self._cond:
+            self._jobs[job_id] = job
+            while len(self._jobs) > MAX_TRACKED_JOBS:
+                self._jobs.popitem(last=False)
+            batch = self._batches.get(book_slug)
+            if batch is None:
+                batch = self._batches[book_slug] = _Batch(book_slug)
+            for path in paths:
+                if path not in batch.paths:
+                    batch.paths.append(path)
+            batch.messages.append(message)
+            batch.job_ids.append(job_id)
+            batch.last_update = time.monotonic()
+            self._ensure_worker()
+            self._cond.notify()
+            return dict(job)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def flush(self, timeout: float = 30.0):
+        """Commit everything pending now and attempt one push."""
+        with self._cond:
+            if self._thread is None:
+                return
+            self._flush_requested = True
+            self._cond.notify()
+            deadline = time.monotonic() + timeout
+            while self._flush_requested and time.monotonic() < deadline:
+                self._cond.wait(timeout=0.1)
+
+    # --- Worker ---
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="git-sync", daemon=True)
+            self._thread.start()
+
+    def _set_status(self, job_ids: list[str], status: str, commit: Optional[str] = None, error: Optional[str] = None):
+        now = _utc_now()
+        with self._cond:
+            for job_id in job_ids:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                job["status"] = status
+                if commit:
+                    job["commit"] = commit
+                job["error"] = error
+                job["updatedAt"] = now
+
+    def _take_due(self) -> tuple[list[_Batch], bool, bool]:
+        """Wait until a batch is idle or a push is due; return the work."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                flush = self._flush_requested
+                due = [
+                    b for b in self._batches.values()
+                    if flush or now - b.last_update >= self.idle_seconds
+                ]
+                push_due = bool(self._unpushed) and (
+                    flush or (self._next_push_at is not None and now >= self._next_push_at)
+                )
+                if due or push_due or flush:
+                    for batch in due:
+                        del self._batches[batch.book_slug]
+                    return due, push_due or (flush and bool(self._unpushed)), flush
+
+                wake_times = [b.last_update + self.idle_seconds for b in self._batches.values()]
+                if self._unpushed and self._next_push_at is not None:
+                    wake_times.append(self._next_push_at)
+                timeout = max(0.0, min(wake_times) - now) if wake_times else None
+                self._cond.wait(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batches, push_due, flush = self._take_due()
+            for batch in batches:
+                self._commit_batch(batch)
+            with self._cond:
+                push_due = push_due or (bool(self._unpushed) and self._push_attempts == 0 and bool(batches))
+            if push_due:
+                self._push()
+            if flush:
+                with self._cond:
+                    self._flush_requested = False
+                    self._cond.notify_all()
+
+    def _commit_batch(self, batch: _Batch):
+        try:
+            for path in batch.paths:
+                add_result = run_git(["add", "-A", "--", path])
+                if add_result.returncode != 0:
+                    err = add_result.stderr.strip()
+                    if _is_missing_pathspec(err):
+                        continue
+                    print(f"Git add failed: {err}")
+                    self._set_status(batch.job_ids, FAILED, error=f"git add failed: {err}")
+                    return
+
+            # Nothing staged means file content didn't change.
+            staged_result = run_git(["diff", "--cached", "--quiet"])
+            if staged_result.returncode != 0:
+                if len(batch.messages) == 1:
+                    commit_args = ["commit", "-m", batch.messages[0]]
+                else:
+                    subject = f"Update {batch.book_slug} ({len(batch.messages)} changes)"
+                    body = "\n".join(f"- {msg}" for msg in batch.messages)
+                    commit_args = ["commit", "-m", subject, "-m", body]
+                commit_result = run_git(commit_args)
+                if commit_result.returncode != 0:
+                    err = commit_result.stderr.strip()
+                    print(f"Git commit failed: {err}")
+                    self._set_status(batch.job_ids, FAILED, error=f"git commit failed: {err}")
+                    return
+
+            head = run_git(["rev-parse", "HEAD"]).stdout.strip() or None
+            self._set_status(batch.job_ids, COMMITTED, commit=head)
+            with self._cond:
+                self._unpushed.extend(batch.job_ids)
+        except Exception as e:
+            print(f"Git operation failed: {e}")
+            self._set_status(batch.job_ids, FAILED, error=str(e))
+
+    def _push(self):
+        with self._cond:
+            job_ids = list(self._unpushed)
+        try:
+            push_result = run_git(["push"])
+            ok = push_result.returncode == 0
+            err = push_result.stderr.strip()
+        except Exception as e:
+            ok, err = False, str(e)
+
+        with self._cond:
+            if ok:
+                pushed = set(job_ids)
+                self._unpushed = [j for j in self._unpushed if j not in pushed]
+                self._push_attempts = 0
+                self._next_push_at = None
+            else:
+                print(f"Git push failed: {err}")
+                delay = min(PUSH_RETRY_MAX_SECONDS, PUSH_RETRY_BASE_SECONDS * (2 ** self._push_attempts))
+                self._push_attempts += 1
+                self._next_push_at = time.monotonic() + delay
+        if ok:
+            self._set_status(job_ids, PUSHED)
+        else:
+            now = _utc_now()
+            with self._cond:
+                for job_id in job_ids:
+                    job = self._jobs.get(job_id)
+                    if job is not None:
+                        job["error"] = f"git push failed (retrying): {err}"
+                        job["updatedAt"] = now
+
+
+# Global commit queue
+commit_queue = CommitQueue()
+
+
+def enqueue(book_slug: str, paths: list[str], message: str) -> dict:
+    """Queue a commit for the given repo-relative paths."""
+    return commit_queue.enqueue(book_slug, paths, message)
+
+
+def get_status(job_id: str) -> Optional[dict]:
+    return commit_queue.status(job_id)
+
+
+def flush(timeout: float = 30.0):
+    commit_queue.flush(timeout)
@@ -0,0 +1,223 @@
+"""Chapter revision history backed by git.
+
+Historical content is read through one long-lived ``git cat-file --batch``
+process instead of spawning ``git show`` per request. Blobs are kept in
+an LRU cache keyed by object id (objects are immutable), and the
+revision list of a chapter is cached per HEAD so scrolling through
+hundreds of revisions runs ``git log`` once.
+"""
+import difflib
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from .git_sync import REPO_ROOT, run_git
+
+BLOB_CACHE_BYTES = 32 * 1024 * 1024
+MAX_CACHED_LOGS = 64
+MAX_CACHED_SPECS = 4096
+
+COMMIT_RE = re.compile(r"^[0-9a-f]{7,40}$")
+
+
+def _chapter_path(book_slug: str, chapter_slug: str) -> str:
+    return f"backend/data/books/{book_slug}/chapters/{chapter_slug}.md"
+
+
+class _CatFileBatch:
+    """A persistent ``git cat-file --batch`` process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _ensure_process(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                cwd=REPO_ROOT,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+            )
+        return self._process
+
+    def read(self, spec: str) -> Optional[tuple[str, str, bytes]]:
+        """Return ``(oid, type, data)`` for an object spec, or None if missing."""
+        if "\n" in spec or "\0" in spec:
+            # The batch protocol is line-based: a newline would smuggle in a
+            # second request and leave every later reply off by one.
+            return None
+        with self._lock:
+            for attempt in range(2):
+                process = self._ensure_process()
+                try:
+                    process.stdin.write(spec.encode("utf-8") + b"\n")
+                    process.stdin.flush()
+                    header = process.stdout.readline()
+                    if not header:
+                        raise BrokenPipeError("git cat-file exited")
+                    parts = header.decode("utf-8", errors="replace").split()
+                    if len(parts) != 3:
+                        # "<spec> missing" / "<spec> ambiguous"
+                        return None
+                    oid, obj_type, size = parts[0], parts[1], int(parts[2])
+                    data = process.stdout.read(size)
+                    process.stdout.read(1)  # trailing LF
+                    return oid, obj_type, data
+                except (BrokenPipeError, OSError, ValueError):
+                    self._kill()
+                    if attempt:
+                        raise
+        return None
+
+    def _kill(self):
+        if self._process is not None:
+            try:
+                self._process.kill()
+                self._process.wait(timeout=1)
+            except Exception:
+                pass
+            self._process = None
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                try:
+                    self._process.stdin.close()
+                    self._process.wait(timeout=2)
+                except Exception:
+                    self._kill()
+            self._process = None
+
+
+class HistoryReader:
+    """Revision lists, historical content and diffs for chapters."""
+
+    def __init__(self):
+        self._batch = _CatFileBatch()
+        self._lock = threading.Lock()
+        self._blobs: OrderedDict[str, bytes] = OrderedDict()
+        self._blob_bytes = 0
+        self._specs: OrderedDict[str, str] = OrderedDict()
+        self._logs: OrderedDict[tuple[str, str], list[dict]] = OrderedDict()
+
+    # --- Object access ---
+
+    def _head(self) -> Optional[str]:
+        found = self._batch.read("HEAD")
+        return found[0] if found else None
+
+    def _remember_blob(self, oid: str, data: bytes):
+        with self._lock:
+            if oid in self._blobs:
+                self._blobs.move_to_end(oid)
+                return
+            self._blobs[oid] = data
+            self._blob_bytes += len(data)
+            while self._blob_bytes > BLOB_CACHE_BYTES and len(self._blobs) > 1:
+                _, evicted = self._blobs.popitem(last=False)
+                self._blob_bytes -= len(evicted)
+
+    def _read_blob(self, commit: str, path: str) -> Optional[bytes]:
+        spec = f"{commit}:{path}"
+        with self._lock:
+            oid = self._specs.get(spec)
+            if oid is not None and oid in self._blobs:
+                self._blobs.move_to_end(oid)
+                return self._blobs[oid]
+
+        found = self._batch.read(spec)
+        if not found or found[1] != "blob":
+            return None
+        oid, _, data = found
+        self._remember_blob(oid, data)
+        # Only full commit ids pin the spec -> blob mapping forever.
+        if len(commit) == 40:
+            with self._lock:
+                self._specs[spec] = oid
+                while len(self._specs) > MAX_CACHED_SPECS:
+                    self._specs.popitem(last=False)
+        return data
+
+    # --- Revisions ---
+
+    def _revisions(self, path: str) -> list[dict]:
+        head = self._head()
+        if head is None:
+            return []
+        key = (path, head)
+        with self._lock:
+            cached = self._logs.get(key)
+            if cached is not None:
+                self._logs.move_to_end(key)
+                return cached
+
+        result = run_git([
+            "-c", "core.quotepath=off",
+            "log", "--follow", "--name-only",
+            "--format=%x1e%H%x1f%at%x1f%an%x1f%s",
+            "--", path,
+        ])
+        revisions = []
+        if result.returncode == 0:
+            for record in result.stdout.split("\x1e")[1:]:
+                header, _, names = record.partition("\n")
+                commit, timestamp, author, subject = header.split("\x1f", 3)
+                name_lines = [n for n in names.splitlines() if n.strip()]
+                revisions.append({
+                    "commit": commit,
+                    "timestamp": datetime.utcfromtimestamp(int(timestamp)).isoformat() + "Z",
+                    "author": author,
+                    "message": subject,
+                    "path": name_lines[0] if name_lines else path,
+                })
+
+        with self._lock:
+            self._logs[key] = revisions
+            while len(self._logs) > MAX_CACHED_LOGS:
+                self._logs.popitem(last=False)
+        return revisions
+
+    def list_revisions(self, book_slug: str, chapter_slug: str, offset: int = 0, limit: int = 50) -> dict:
+        revisions = self._revisions(_chapter_path(book_slug, chapter_slug))
+        return {
+            "total": len(revisions),
+            "revisions": revisions[offset:offset + limit],
+        }
+
+    def get_content(self, book_slug: str, chapter_slug: str, commit: str) -> Optional[str]:
+        """Return chapter content as of a commit, or None if it did not exist."""
+        if not COMMIT_RE.match(commit):
+            raise ValueError("Invalid commit id")
+        path = _chapter_path(book_slug, chapter_slug)
+        # Follow renames: use the path the chapter had in that commit.
+        for rev in self._revisions(path):
+            if rev["commit"].startswith(commit):
+                commit, path = rev["commit"], rev["path"]
+                break
+        data = self._read_blob(commit, path)
+        return data.decode("utf-8", errors="replace") if data is not None else None
+
+    def diff(self, book_slug: str, chapter_slug: str, base: str, target: str, target_content: Optional[str] = None) -> Optional[str]:
+        """Unified diff between two revisions (or a revision and given content)."""
+        old = self.get_content(book_slug, chapter_slug, base)
+        new = target_content if target_content is not None else self.get_content(book_slug, chapter_slug, target)
+        if old is None or new is None:
+            return None
+        return "".join(difflib.unified_diff(
+            old.splitlines(keepends=True),
+            new.splitlines(keepends=True),
+            fromfile=f"{chapter_slug}@{base[:7]}",
+            tofile=f"{chapter_slug}@{target[:7]}",
+        ))
+
+    def close(self):
+        self._batch.close()
+
+
+# Global history reader
+history_reader = HistoryReader()
@@ -0,0 +1,406 @@
+"""Book image processing.
+
+Decoding, resizing and JPEG encoding an upload takes hundreds of
+milliseconds of CPU, so it runs in a small pool of worker processes
+instead of on the event loop. The number of uploads waiting for or
+holding a worker is capped at ``ZENAPP_IMAGE_MAX_PENDING``; beyond that
+``ImageBusyError`` is raised and the caller should answer 503.
+
+After the primary JPEG is stored, narrower JPEG and WebP variants (see
+``VARIANT_WIDTHS``) are generated in the background, one at a time and
+only while no upload is waiting, so upload latency does not grow.
+``resolve_variant`` picks the file to serve for a requested width and
+format, falling back to the primary until the variants exist. Images
+stored without variants (before they existed, or when the server stopped
+first) are queued again at startup by ``start_backfill``; if generating
+them fails, a ``.{stem}.novariants`` marker is left so the primary is
+served as final instead of being retried and re-checked on every request.
+
+Stored files never change (names are random UUIDs), so ``image_files``
+remembers each request's resolved path and stat once variants are final
+and the GET hot path does no filesystem work.
+"""
+import asyncio
+import io
+import multiprocessing
+import os
+import re
+import stat
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional
+from urllib.parse import unquote
+
+from PIL import Image
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data" / "books"
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+MAX_IMAGE_WIDTH = 1200
+IMAGE_QUALITY = 85
+ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.heic', '.webp'}
+
+# Responsive variants: ``{stem}-{width}.jpg|webp`` below the primary's width,
+# plus a full-width ``{stem}.webp``.
+VARIANT_WIDTHS = (400, 800, 1200)
+VARIANT_FORMATS = {"jpeg": ".jpg", "webp": ".webp"}
+WEBP_QUALITY = 80
+# Matches the Reader's column (.reader-content max-width).
+IMAGE_SIZES = "(max-width: 700px) 100vw, 700px"
+BOOK_IMAGE_RE = re.compile(r"^/api/books/([^/?#]+)/images/([^/?#]+\.jpg)$")
+# Book slugs and image filenames: no separators, no leading dot.
+SAFE_NAME_RE = re.compile(r"^(?!\.)[^/\\\x00]+$")
+VARIANT_NAME_RE = re.compile(rf"^(.+)-(?:{'|'.join(map(str, VARIANT_WIDTHS))})\.(?:jpg|webp)$")
+
+WORKERS = int(os.getenv("ZENAPP_IMAGE_WORKERS", str(min(2, os.cpu_count() or 1))))
+MAX_PENDING = int(os.getenv("ZENAPP_IMAGE_MAX_PENDING", "8"))
+
+
+class ImageBusyError(Exception):
+    """Raised when too many uploads are already being processed."""
+
+
+def images_path(book_slug: str) -> Path:
+    """The images directory for a book (not created)."""
+    return DATA_DIR / book_slug / "images"
+
+
+def get_images_dir(book_slug: str) -> Path:
+    """Get the images directory for a book, creating it if needed."""
+    base_dir = images_path(book_slug)
+    base_dir.mkdir(parents=True, exist_ok=True)
+    return base_dir
+
+
+def _no_variants_marker(primary: Path) -> Path:
+    """Left next to a primary whose variants could not be generated."""
+    return primary.with_name(f".{primary.stem}.novariants")
+
+
+def is_variant(path: Path) -> bool:
+    """True for a generated variant of a stored primary (``{stem}-{w}.jpg|webp``, ``{stem}.webp``)."""
+    match = VARIANT_NAME_RE.match(path.name)
+    if match:
+        return (path.parent / f"{match.group(1)}.jpg").exists()
+    return path.suffix == ".webp" and path.with_suffix(".jpg").exists()
+
+
+def missing_variants(data_dir: Path) -> list[Path]:
+    """Stored primaries with neither variants nor a failure marker."""
+    return [
+        path for path in sorted(data_dir.glob("*/images/*.jpg"))
+        if not path.name.startswith(".")
+        and not is_variant(path)
+        and not path.with_suffix(".webp").exists()
+        and not _no_variants_marker(path).exists()
+    ]
+
+
+def process_image(image_data: bytes, filename: str) -> bytes:
+    """Process image: resize if needed, compress, convert to JPG.
+
+    Runs in a worker process; raises ValueError for undecodable input.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_data))
+
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding
+        # (never below the target width), instead of decoding full size.
+        if img.format == 'JPEG' and img.width > MAX_IMAGE_WIDTH:
+            scale = MAX_IMAGE_WIDTH / img.width
+            img.draft('RGB', (MAX_IMAGE_WIDTH, max(1, int(img.height * scale))))
+
+        # Convert RGBA to RGB (for PNG with transparency)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Resize if too wide
+        if img.width > MAX_IMAGE_WIDTH:
+            ratio = MAX_IMAGE_WIDTH / img.width
+            new_height = int(img.height * ratio)
+            img = img.resize((MAX_IMAGE_WIDTH, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        # Save to bytes
+        output = io.BytesIO()
+        img.save(output, format='JPEG', quality=IMAGE_QUALITY, optimize=True)
+        return output.getvalue()
+
+    except Exception as e:
+        raise ValueError(f"Failed to process image: {str(e)}") from None
+
+
+def _save_atomic(img: Image.Image, path: Path, **params):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    img.save(tmp, **params)
+    os.replace(tmp, path)
+
+
+def write_variants(primary_path: str) -> list[str]:
+    """Write the resized JPEG/WebP variants of a stored primary image; returns their names.
+
+    Runs in a worker process.
+    """
+    path = Path(primary_path)
+    with Image.open(path) as img:
+        img.load()
+    written = []
+    for width in VARIANT_WIDTHS:
+        if width >= img.width:
+            break
+        resized = img.resize((width, max(1, round(img.height * width / img.width))), Image.Resampling.LANCZOS)
+        for fmt, ext in VARIANT_FORMATS.items():
+            target = path.with_name(f"{path.stem}-{width}{ext}")
+            if fmt == "webp":
+                _save_atomic(resized, target, format="WEBP", quality=WEBP_QUALITY, method=4)
+            else:
+                _save_atomic(resized, target, format="JPEG", quality=IMAGE_QUALITY, optimize=True)
+            written.append(target.name)
+    target = path.with_suffix(".webp")
+    _save_atomic(img, target, format="WEBP", quality=WEBP_QUALITY, method=4)
+    written.append(target.name)
+    return written
+
+
+def resolve_variant(images_dir: Path, filename: str, width: Optional[int], fmt: str) -> tuple[Path, bool]:
+    """The stored file to serve for ``filename`` at ``width`` in ``fmt``.
+
+    Picks the narrowest variant at least ``width`` wide, else the full-width
+    file in that format, else the primary. The flag is False while variants
+    are still to be generated (the full-width WebP is written last, or a
+    failure marker instead), i.e. when a later request may resolve to a
+    better file.
+    """
+    primary = images_dir / filename
+    if not filename.endswith(".jpg") or (fmt == "jpeg" and width is None):
+        return primary, True
+    stem, ext = primary.stem, VARIANT_FORMATS.get(fmt, ".jpg")
+    final = (images_dir / f"{stem}.webp").exists() or _no_variants_marker(primary).exists()
+    if width is not None:
+        for variant_width in VARIANT_WIDTHS:
+            if variant_width >= width:
+                candidate = images_dir / f"{stem}-{variant_width}{ext}"
+                if candidate.exists():
+                    return candidate, final
+    full = images_dir / f"{stem}{ext}"
+    return (full, final) if full.exists() else (primary, final)
+
+
+class ImageFileCache:
+    """LRU of resolved image files and their stat results, for final resolutions only."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple[Path, os.stat_result]] = OrderedDict()
+        self._widths: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(
+        self, book_slug: str, filename: str, width: Optional[int], fmt: str,
+    ) -> Optional[tuple[Path, os.stat_result, bool]]:
+        """``(path, stat, final)`` for a request, or None if the image does not exist."""
+        key = (book_slug, filename, width, fmt)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1], True
+            self.misses += 1
+
+        path, final = resolve_variant(images_path(book_slug), filename, width, fmt)
+        try:
+            stat_result = path.stat()
+        except OSError:
+            return None
+        if not stat.S_ISREG(stat_result.st_mode):
+            return None
+        if final:
+            with self._lock:
+                self._entries[key] = (path, stat_result)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return path, stat_result, final
+
+    def primary_width(self, book_slug: str, filename: str) -> Optional[int]:
+        """Pixel width of a stored primary (read from its header once), or None if unreadable."""
+        key = (book_slug, filename)
+        with self._lock:
+            width = self._widths.get(key)
+            if width is not None:
+                self._widths.move_to_end(key)
+                return width
+        if not SAFE_NAME_RE.match(book_slug) or not SAFE_NAME_RE.match(filename):
+            return None
+        try:
+            with Image.open(images_path(book_slug) / filename) as img:
+                width = img.width
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            self._widths[key] = width
+            while len(self._widths) > self.max_entries:
+                self._widths.popitem(last=False)
+        return width
+
+    def forget_book(self, book_slug: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == book_slug]:
+                del self._entries[key]
+            for key in [k for k in self._widths if k[0] == book_slug]:
+                del self._widths[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def srcset_for(url: str) -> Optional[str]:
+    """``srcset`` value for a book image URL (None for other images or unreadable files).
+
+    Lists the variants ``write_variants`` produces for this image, i.e. the
+    ``VARIANT_WIDTHS`` narrower than the primary, plus the URL itself at the
+    primary's real width. Until they are written ``?w=`` serves the primary.
+    """
+    match = BOOK_IMAGE_RE.match(url)
+    if not match:
+        return None
+    width = image_files.primary_width(unquote(match.group(1)), unquote(match.group(2)))
+    if width is None:
+        return None
+    candidates = [f"{url}?w={w} {w}w" for w in VARIANT_WIDTHS if w < width]
+    candidates.append(f"{url} {width}w")
+    return ", ".join(candidates)
+
+
+class ImageProcessor:
+    """Bounded process pool for ``process_image``, created on first use."""
+
+    def __init__(self, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.processed = 0
+        self.rejected = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._variant_queue: deque[Path] = deque()
+        self._variant_task: Optional[asyncio.Task] = None
+        self._backfill_task: Optional[asyncio.Task] = None
+        self.variants_written = 0
+        self.variant_failures = 0
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the server process is multi-threaded.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def _idle_event(self) -> asyncio.Event:
+        if self._idle is None:
+            self._idle = asyncio.Event()
+            if self.pending == 0:
+                self._idle.set()
+        return self._idle
+
+    async def process(self, image_data: bytes, filename: str) -> bytes:
+        """``process_image`` in a worker; raises ImageBusyError when the queue is full."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ImageBusyError("Too many images are being processed, please retry shortly")
+        self.pending += 1
+        self._idle_event().clear()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._pool(), process_image, image_data, filename)
+            self.processed += 1
+            return result
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool next time.
+            self._executor = None
+            raise RuntimeError("Image worker crashed")
+        finally:
+            self.pending -= 1
+            if self.pending == 0:
+                self._idle_event().set()
+
+    def schedule_variants(self, primary_path: Path):
+        """Queue background generation of ``primary_path``'s variants."""
+        self._variant_queue.append(primary_path)
+        if self._variant_task is None or self._variant_task.done():
+            self._variant_task = asyncio.create_task(self._drain_variants())
+
+    async def _drain_variants(self):
+        loop = asyncio.get_running_loop()
+        while self._variant_queue:
+            # Uploads go first: only start a variant job while none is waiting.
+            await self._idle_event().wait()
+            path = self._variant_queue.popleft()
+            try:
+                written = await loop.run_in_executor(self._pool(), write_variants, str(path))
+                self.variants_written += len(written)
+            except BrokenProcessPool:
+                self._executor = None
+                self._variants_failed(path, "image worker crashed")
+            except Exception as e:
+                self._variants_failed(path, str(e))
+
+    def _variants_failed(self, path: Path, reason: str):
+        self.variant_failures += 1
+        print(f"Image variants failed for {path.name}: {reason}")
+        try:
+            _no_variants_marker(path).touch()
+        except OSError:
+            pass  # Retried by the next startup backfill
+
+    def start_backfill(self):
+        """Queue variants for every stored image that has none (scans in a thread)."""
+        async def backfill():
+            paths = await asyncio.to_thread(missing_variants, DATA_DIR)
+            if paths:
+                print(f"Generating image variants for {len(paths)} stored images")
+            for path in paths:
+                self.schedule_variants(path)
+
+        if self._backfill_task is None:
+            self._backfill_task = asyncio.create_task(backfill())
+
+    def close(self):
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            self._backfill_task = None
+        if self._variant_task is not None:
+            self._variant_task.cancel()
+            self._variant_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "pending": self.pending,
+            "maxPending": self.max_pending,
+            "processed": self.processed,
+            "rejected": self.rejected,
+            "variantsQueued": len(self._variant_queue),
+            "variantsWritten": self.variants_written,
+            "variantFailures": self.variant_failures,
+        }
+
+
+# Global image processor and served-file cache
+image_processor = ImageProcessor()
+image_files = ImageFileCache()
@@ -0,0 +1,212 @@
+"""Process-wide metadata index for books and chapters.
+
+Keeps title, size, mtime and content hash for every chapter (plus the
+parsed ``book.json`` fields) so listing books or opening a book does not
+have to read every chapter file. Entries are revalidated with a single
+``stat()`` and refreshed directly by the storage write functions. The
+index is persisted to disk so a restart does not rescan ``data/books``.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+INDEX_VERSION = 1
+SAVE_INTERVAL_SECONDS = 5.0
+
+
+def content_hash(data: bytes | str) -> str:
+    """Return the hex SHA-256 of chapter content."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def extract_title(content: str, fallback: str) -> str:
+    """Return the first ``# `` heading of a chapter, or the fallback."""
+    for line in content.split("\n"):
+        if line.startswith("# "):
+            return line[2:].strip()
+    return fallback
+
+
+def _stat(path: Path) -> Optional[os.stat_result]:
+    try:
+        return path.stat()
+    except OSError:
+        return None
+
+
+class MetadataIndex:
+    """Stat-validated cache of book and chapter metadata."""
+
+    def __init__(self, data_dir: Path, index_file: Path):
+        self.data_dir = data_dir
+        self.index_file = index_file
+        self._lock = threading.RLock()
+        self._books: dict[str, dict] = {}
+        self._loaded = False
+        self._dirty = False
+        self._last_save = 0.0
+
+    # --- Persistence ---
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            raw = json.loads(self.index_file.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return
+        if raw.get("version") == INDEX_VERSION and isinstance(raw.get("books"), dict):
+            self._books = raw["books"]
+
+    def save(self, force: bool = False):
+        """Persist the index if it changed (throttled unless forced)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.monotonic()
+            if not force and now - self._last_save < SAVE_INTERVAL_SECONDS:
+                return
+            payload = json.dumps({"version": INDEX_VERSION, "books": self._books}, ensure_ascii=False)
+            self._dirty = False
+            self._last_save = now
+        try:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.index_file.with_name(f".{self.index_file.name}.{os.getpid()}.tmp")
+            tmp_file.write_text(payload, encoding="utf-8")
+            os.replace(tmp_file, self.index_file)
+        except OSError as e:
+            print(f"Failed to persist metadata index: {e}")
+
+    def _book(self, slug: str) -> dict:
+        entry = self._books.get(slug)
+        if entry is None:
+            entry = {"meta": None, "listing": None, "chapters": {}}
+            self._books[slug] = entry
+        return entry
+
+    # --- Books ---
+
+    def book_meta(self, slug: str) -> Optional[dict]:
+        """Return ``title``/``author``/``chapterOrder`` for a book, or None."""
+        meta_file = self.data_dir / slug / "book.json"
+        st = _stat(meta_file)
+        with self._lock:
+            self._ensure_loaded()
+            if st is None:
+                if slug in self._books:
+                    del self._books[slug]
+                    self._dirty = True
+                return None
+            entry = self._book(slug)
+            cached = entry["meta"]
+            if cached and cached["mtime"] == st.st_mtime_ns and cached["size"] == st.st_size:
+                return cached
+        try:
+            meta = json.loads(meta_file.read_text())
+        except (OSError, json.JSONDecodeError):
+            return None
+        return self.record_book_meta(slug, meta, st)
+
+    def record_book_meta(self, slug: str, meta: dict, st: Optional[os.stat_result] = None) -> dict:
+        """Store freshly written or parsed ``book.json`` contents."""
+        if st is None:
+            st = (self.data_dir / slug / "book.json").stat()
+        cached = {
+            "title": meta.get("title", slug),
+            "author": meta.get("author"),
+            "chapterOrder": list(meta.get("chapterOrder", [])),
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+        }
+        with self._lock:
+            self._ensure_loaded()
+            self._book(slug)["meta"] = cached
+            self._dirty = True
+        return cached
+
+    def list_books(self) -> list[dict]:
+        """Return slug and title for every book directory with a ``book.json``."""
+        books = []
+        for book_dir in self.data_dir.iterdir():
+            if book_dir.is_dir():
+                meta = self.book_meta(book_dir.name)
+                if meta is not None:
+                    books.append({"slug": book_dir.name, "title": meta["title"]})
+        return books
+
+    def forget_book(self, slug: str):
+        with self._lock:
+            self._ensure_loaded()
+            if self._books.pop(slug, None) is not None:
+                self._dirty = True
+
+    # --- Chapters ---
+
+    def chapter_slugs(self, book_slug: str) -> list[str]:
+        """Return slugs of all ``*.md`` files in the book's chapters dir."""
+        chapters_dir = self.data_dir / book_slug / "chapters"
+        st = _stat(chapters_dir)
+        if st is None:
+            return []
+        with self._lock:
+            self._ensure_loaded()
+            listing = self._book(book_slug)["listing"]
+            if listing and listing["mtime"] == st.st_mtime_ns:
+                return listing["slugs"]
+        slugs = [p.stem for p in chapters_dir.glob("*.md")]
+        with self._lock:
+            self._book(book_slug)["listing"] = {"mtime": st.st_mtime_ns, "slugs": slugs}
+            self._dirty = True
+        return slugs
+
+    def chapter(self, book_slug: str, chapter_slug: str) -> Optional[dict]:
+        """Return ``title``/``size``/``mtime``/``hash`` for a chapter, or None."""
+        ch_file = self.data_dir / book_slug / "chapters" / f"{chapter_slug}.md"
+        st = _stat(ch_file)
+        with self._lock:
+            self._ensure_loaded()
+            chapters = self._book(book_slug)["chapters"]
+            if st is None:
+                if chapters.pop(chapter_slug, None) is not None:
+                    self._dirty = True
+                return None
+            cached = chapters.get(chapter_slug)
+            if cached and cached["mtime"] == st.st_mtime_ns and cached["size"] == st.st_size:
+                return cached
+        try:
+            data = ch_file.read_bytes()
+        except OSError:
+            return None
+        return self._store_chapter(book_slug, chapter_slug, data.decode("utf-8", errors="replace"), content_hash(data), st)
+
+    def record_chapter(self, book_slug: str, chapter_slug: str, content: str) -> dict:
+        """Store metadata for chapter content that was just written."""
+        ch_file = self.data_dir / book_slug / "chapters" / f"{chapter_slug}.md"
+        return self._store_chapter(book_slug, chapter_slug, content, content_hash(content), ch_file.stat())
+
+    def _store_chapter(self, book_slug: str, chapter_slug: str, content: str, digest: str, st: os.stat_result) -> dict:
+        cached = {
+            "title": extract_title(content, chapter_slug),
+            "size": st.st_size,
+            "mtime": st.st_mtime_ns,
+            "hash": digest,
+        }
+        with self._lock:
+            self._ensure_loaded()
+            self._book(book_slug)["chapters"][chapter_slug] = cached
+            self._dirty = True
+        return cached
+
+    def forget_chapter(self, book_slug: str, chapter_slug: str):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._books.get(book_slug)
+            if entry and entry["chapters"].pop(chapter_slug, None) is not None:
+                self._dirty = True
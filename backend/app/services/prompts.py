@@ -0,0 +1,44 @@
+"""Pre-defined AI edit prompts stored in ``data/prompts.md``."""
+import hashlib
+import os
+from typing import List
+
+PROMPTS_FILE = os.path.join(os.path.dirname(__file__), '../../data/prompts.md')
+
+# (mtime_ns, size) -> (prompts, content hash); reparsed only when the file changes
+_prompts_cache: dict = {}
+
+
+def load_prompts() -> tuple[List[str], str]:
+    """Return parsed prompts and their content hash, revalidated by stat()."""
+    try:
+        st = os.stat(PROMPTS_FILE)
+    except OSError:
+        return [], hashlib.sha256(b'').hexdigest()
+    key = (st.st_mtime_ns, st.st_size)
+    if _prompts_cache.get('key') == key:
+        return _prompts_cache['prompts'], _prompts_cache['hash']
+    
+    with open(PROMPTS_FILE, 'r', encoding='utf-8') as f:
+        content = f.read()
+    
+    # Parse prompts - each non-empty line that's not a heading is a prompt
+    prompts = []
+    for line in content.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            prompts.append(line)
+    
+    digest = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    _prompts_cache.update(key=key, prompts=prompts, hash=digest)
+    return prompts, digest
+
+
+def save_prompts(prompts: List[str]):
+    """Write prompts to prompts.md."""
+    # Write prompts as markdown list
+    content = "# AI Edit Prompts\n\n"
+    content += "\n\n".join(prompts)
+    
+    with open(PROMPTS_FILE, 'w', encoding='utf-8') as f:
+        f.write(content)
@@ -0,0 +1,202 @@
+"""Server-side Markdown rendering.
+
+Renders chapter Markdown the way the Reader does (CommonMark + tables,
+strikethrough, footnotes and inline HTML), gives ``##``/``###`` headings
+the same ids as ``frontend/src/lib/toc.ts``, then runs the result through
+a whitelist sanitizer that re-serializes it as well-formed XHTML, so the
+same output is safe for the browser and valid inside an EPUB.
+
+``render_cache`` keeps recent Reader renders in memory, keyed by content
+hash, so re-opening a chapter costs a dict lookup. Reader renders also
+give book images a ``srcset`` of their stored width variants.
+"""
+import re
+import threading
+from collections import OrderedDict
+from html import escape
+from html.parser import HTMLParser
+
+from markdown_it import MarkdownIt
+from mdit_py_plugins.footnote import footnote_plugin
+
+from .images import IMAGE_SIZES, srcset_for
+from .toc import extract_toc, slugify
+
+ALLOWED_TAGS = {
+    "a", "abbr", "b", "blockquote", "br", "code", "del", "div", "em", "figcaption",
+    "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "kbd", "li",
+    "mark", "ol", "p", "pre", "s", "section", "small", "span", "strong", "sub",
+    "sup", "table", "tbody", "td", "th", "thead", "tr", "u", "ul",
+}
+VOID_TAGS = {"br", "hr", "img"}
+# Content of these is dropped entirely, not just the tags.
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "embed", "noscript", "template"}
+ALLOWED_ATTRS = {
+    "*": {"id", "class", "title", "lang"},
+    "a": {"href"},
+    "img": {"src", "alt", "width", "height", "srcset", "sizes", "loading"},
+    "td": {"style", "colspan", "rowspan"},
+    "th": {"style", "colspan", "rowspan"},
+    "ol": {"start"},
+}
+SAFE_URL_RE = re.compile(r"^(https?:|mailto:|#|/|\./|\.\./|[^:/?#]+(?:[/?#]|$))", re.IGNORECASE)
+SAFE_STYLE_RE = re.compile(r"^text-align:\s*(left|right|center)\s*;?$")
+
+
+def _heading_open(self, tokens, idx, options, env):
+    token = tokens[idx]
+    if token.tag in ("h2", "h3") and idx + 1 < len(tokens):
+        token.attrSet("id", slugify(tokens[idx + 1].content.strip()))
+    return self.renderToken(tokens, idx, options, env)
+
+
+_md = (
+    MarkdownIt("commonmark", {"html": True})
+    .enable(["table", "strikethrough"])
+    .use(footnote_plugin)
+)
+_md.add_render_rule("heading_open", _heading_open)
+
+
+class _Sanitizer(HTMLParser):
+    """Whitelist HTML and serialize it as balanced XHTML."""
+
+    def __init__(self, responsive_images: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.responsive_images = responsive_images
+        self.out: list[str] = []
+        self.stack: list[str] = []
+        self.dropping = 0
+
+    def _attrs(self, tag: str, attrs: list[tuple[str, str | None]]) -> str:
+        allowed = ALLOWED_ATTRS["*"] | ALLOWED_ATTRS.get(tag, set())
+        parts = []
+        for name, value in attrs:
+            name = name.lower()
+            if name not in allowed:
+                continue
+            value = value or ""
+            if name in ("href", "src") and not SAFE_URL_RE.match(value.strip()):
+                continue
+            if name == "style" and not SAFE_STYLE_RE.match(value.strip()):
+                continue
+            parts.append(f' {name}="{escape(value, quote=True)}"')
+        if tag == "img" and self.responsive_images:
+            names = {name.lower() for name, _ in attrs}
+            srcset = srcset_for(dict(attrs).get("src") or "")
+            if srcset and "srcset" not in names:
+                parts.append(f' srcset="{escape(srcset, quote=True)}" sizes="{IMAGE_SIZES}"')
+            if "loading" not in names:
+                parts.append(' loading="lazy"')
+        return "".join(parts)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping or tag not in ALLOWED_TAGS:
+            return
+        if tag in VOID_TAGS:
+            self.out.append(f"<{tag}{self._attrs(tag, attrs)} />")
+            return
+        self.out.append(f"<{tag}{self._attrs(tag, attrs)}>")
+        self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in VOID_TAGS or tag in DROP_CONTENT_TAGS:
+            self.handle_starttag(tag, attrs)
+            if tag in DROP_CONTENT_TAGS:
+                self.dropping -= 1
+            return
+        self.handle_starttag(tag, attrs)
+        self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROP_CONTENT_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping or tag not in self.stack:
+            return
+        while self.stack:
+            open_tag = self.stack.pop()
+            self.out.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.out.append(escape(data, quote=False))
+
+    def result(self) -> str:
+        self.close()
+        while self.stack:
+            self.out.append(f"</{self.stack.pop()}>")
+        return "".join(self.out)
+
+
+def sanitize_html(html: str, responsive_images: bool = False) -> str:
+    """Strip non-whitelisted markup and return well-formed XHTML.
+
+    With ``responsive_images``, book images get a ``srcset`` of their
+    width variants and lazy loading (for the Reader, not EPUB).
+    """
+    sanitizer = _Sanitizer(responsive_images)
+    sanitizer.feed(html)
+    return sanitizer.result()
+
+
+def render_markdown(content: str, responsive_images: bool = False) -> str:
+    """Render chapter Markdown to sanitized XHTML."""
+    return sanitize_html(_md.render(content), responsive_images)
+
+
+class RenderCache:
+    """LRU of rendered chapters keyed by content hash, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _cost(entry: dict) -> int:
+        return len(entry["html"]) + sum(len(item["text"]) + len(item["id"]) for item in entry["toc"])
+
+    def get(self, digest: str, content: str) -> dict:
+        """``{html, toc}`` for ``content``, whose hash is ``digest``."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Render outside the lock; a concurrent miss on the same hash just renders twice.
+        entry = {"html": render_markdown(content, responsive_images=True), "toc": extract_toc(content)}
+        cost = self._cost(entry)
+        with self._lock:
+            if digest not in self._entries and cost <= self.max_bytes:
+                self._entries[digest] = entry
+                self._bytes += cost
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= self._cost(evicted)
+        return entry
+
+    def discard(self, digest: str):
+        with self._lock:
+            entry = self._entries.pop(digest, None)
+            if entry is not None:
+                self._bytes -= self._cost(entry)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+
+# Global Reader render cache
+render_cache = RenderCache()
@@ -0,0 +1,376 @@
+"""Full-text search across all books.
+
+Chapters are split into sections at ``##``/``###`` headings and stored in
+an on-disk SQLite FTS5 index. FTS5's built-in tokenizers treat a run of
+CJK characters as one token, so text is pre-tokenized here: CJK runs
+become overlapping bigrams (plus the run's last character, so single
+characters are searchable) and other words are lower-cased.
+
+The storage write paths only queue a chapter; a background thread
+reindexes it from its file once it has been quiet for
+``ZENAPP_SEARCH_INDEX_DELAY`` seconds, skipping files whose (mtime, size)
+are already indexed, so saving never waits on SQLite. The index is also
+reconciled against file stats at startup, and a search first indexes
+anything still queued.
+"""
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from .metadata_index import extract_title
+from .toc import HEADING_RE, slugify
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data" / "books"
+INDEX_FILE = DATA_DIR.parent / ".cache" / "search.sqlite3"
+
+# Bump when tokenizing or section text changes; older indexes are rebuilt.
+INDEX_VERSION = 2
+SNIPPET_RADIUS = 60
+INDEX_DELAY = float(os.getenv("ZENAPP_SEARCH_INDEX_DELAY", "1.0"))
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(rf"([{_CJK}]+)|([^\W{_CJK}]+)")
+# Markdown links/images keep only their text; reference definitions and
+# autolinks are dropped, so URLs and image paths are not indexed.
+_LINK_RE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_LINK_DEF_RE = re.compile(r"^ {0,3}\[[^\]]+\]:\s*\S+.*$", re.MULTILINE)
+_AUTOLINK_RE = re.compile(r"<(?:https?|mailto):[^>\s]*>")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs(
+    book TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    title TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY(book, chapter)
+);
+CREATE TABLE IF NOT EXISTS sections(
+    id INTEGER PRIMARY KEY,
+    book TEXT NOT NULL,
+    chapter TEXT NOT NULL,
+    heading TEXT NOT NULL,
+    anchor TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sections_doc ON sections(book, chapter);
+CREATE VIRTUAL TABLE IF NOT EXISTS sections_fts USING fts5(heading_terms, terms);
+"""
+
+
+def _cjk_grams(run: str) -> list[str]:
+    grams = [run[i:i + 2] for i in range(len(run) - 1)]
+    grams.append(run[-1])
+    return grams
+
+
+def tokenize(text: str) -> str:
+    """Space-separated index terms for ``text``."""
+    terms = []
+    for cjk, word in _TOKEN_RE.findall(text):
+        if cjk:
+            terms.extend(_cjk_grams(cjk))
+        else:
+            terms.append(word.lower())
+    return " ".join(terms)
+
+
+def _match_query(query: str) -> tuple[str, list[str]]:
+    """FTS5 MATCH expression and the raw terms used for snippets."""
+    clauses = []
+    needles = []
+    for cjk, word in _TOKEN_RE.findall(query):
+        if cjk:
+            needles.append(cjk)
+            if len(cjk) == 1:
+                clauses.append(f'"{cjk}"*')
+            else:
+                bigrams = " ".join(cjk[i:i + 2] for i in range(len(cjk) - 1))
+                clauses.append(f'"{bigrams}"')
+        else:
+            needles.append(word.lower())
+            clauses.append(f'"{word.lower()}"*')
+    return " ".join(clauses), needles
+
+
+def _strip_urls(text: str) -> str:
+    text = _LINK_DEF_RE.sub("", text)
+    text = _LINK_RE.sub(r"\1", text)
+    return _AUTOLINK_RE.sub("", text)
+
+
+def _split_sections(content: str, chapter_title: str) -> list[tuple[str, str, str]]:
+    """Split a chapter into ``(heading, anchor, body)`` at ##/### headings.
+
+    Bodies are stored without link and image URLs (see ``_strip_urls``).
+    """
+    sections = []
+    heading, anchor, lines = chapter_title, "", []
+    title_seen = False
+    for line in content.split("\n"):
+        match = HEADING_RE.match(line)
+        if not title_seen and line.startswith("# "):
+            # The chapter title is already the first section's heading.
+            title_seen = True
+        elif match:
+            # Always keep the first section so the chapter title stays searchable.
+            if any(l.strip() for l in lines) or not sections:
+                sections.append((heading, anchor, _strip_urls("\n".join(lines)).strip()))
+            heading = match.group(2).strip()
+            anchor = slugify(heading)
+            lines = []
+        else:
+            lines.append(line)
+    if any(l.strip() for l in lines) or not sections:
+        sections.append((heading, anchor, _strip_urls("\n".join(lines)).strip()))
+    return sections
+
+
+def _snippet(body: str, needles: list[str]) -> str:
+    """HTML snippet around the first matching term, with matches in <mark>."""
+    lowered = body.lower()
+    positions = [lowered.find(n) for n in needles if n and lowered.find(n) >= 0]
+    first = min(positions) if positions else 0
+    start = max(0, first - SNIPPET_RADIUS)
+    end = min(len(body), first + SNIPPET_RADIUS * 2)
+    window = " ".join(body[start:end].split())
+    escaped = html.escape(window)
+    for needle in sorted({html.escape(n) for n in needles if n}, key=len, reverse=True):
+        escaped = re.sub(re.escape(needle), lambda m: f"<mark>{m.group(0)}</mark>", escaped, flags=re.IGNORECASE)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(body) else ""
+    return f"{prefix}{escaped}{suffix}"
+
+
+class SearchIndex:
+    """SQLite FTS5 index of chapter sections."""
+
+    def __init__(self, data_dir: Path, index_file: Path, delay: float = INDEX_DELAY):
+        self.data_dir = data_dir
+        self.index_file = index_file
+        self.delay = delay
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._reconciled = threading.Event()
+        self._reconcile_started = False
+        # (book, chapter) -> monotonic time it may be indexed (debounced saves)
+        self._pending: dict[tuple[str, str], float] = {}
+        self._pending_changed = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.index_file, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            if conn.execute("PRAGMA user_version").fetchone()[0] != INDEX_VERSION:
+                # Emptying docs makes the next reconcile reindex every chapter.
+                with conn:
+                    conn.execute("DELETE FROM sections_fts")
+                    conn.execute("DELETE FROM sections")
+                    conn.execute("DELETE FROM docs")
+                    conn.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+            self._conn = conn
+        return self._conn
+
+    # --- Updates ---
+
+    def _delete(self, db: sqlite3.Connection, book_slug: str, chapter_slug: Optional[str] = None):
+        where, args = ("book = ?", [book_slug]) if chapter_slug is None else ("book = ? AND chapter = ?", [book_slug, chapter_slug])
+        db.execute(f"DELETE FROM sections_fts WHERE rowid IN (SELECT id FROM sections WHERE {where})", args)
+        db.execute(f"DELETE FROM sections WHERE {where}", args)
+        db.execute(f"DELETE FROM docs WHERE {where}", args)
+
+    def index_chapter(self, book_slug: str, chapter_slug: str, content: str, mtime: int, size: int):
+        """(Re)index one chapter; ``mtime``/``size`` are its file stats."""
+        title = extract_title(content, chapter_slug)
+        try:
+            with self._lock:
+                db = self._db()
+                with db:
+                    self._delete(db, book_slug, chapter_slug)
+                    db.execute(
+                        "INSERT INTO docs(book, chapter, title, mtime, size) VALUES (?, ?, ?, ?, ?)",
+                        (book_slug, chapter_slug, title, mtime, size),
+                    )
+                    for heading, anchor, body in _split_sections(content, title):
+                        cur = db.execute(
+                            "INSERT INTO sections(book, chapter, heading, anchor, body) VALUES (?, ?, ?, ?, ?)",
+                            (book_slug, chapter_slug, heading, anchor, body),
+                        )
+                        db.execute(
+                            "INSERT INTO sections_fts(rowid, heading_terms, terms) VALUES (?, ?, ?)",
+                            (cur.lastrowid, tokenize(heading), tokenize(body)),
+                        )
+        except sqlite3.Error as e:
+            print(f"Search index update failed: {e}")
+
+    def remove_chapter(self, book_slug: str, chapter_slug: str):
+        try:
+            with self._lock:
+                db = self._db()
+                with db:
+                    self._delete(db, book_slug, chapter_slug)
+        except sqlite3.Error as e:
+            print(f"Search index update failed: {e}")
+
+    def remove_book(self, book_slug: str):
+        try:
+            with self._lock:
+                db = self._db()
+                with db:
+                    self._delete(db, book_slug)
+        except sqlite3.Error as e:
+            print(f"Search index update failed: {e}")
+
+    def _refresh(self, book_slug: str, chapter_slug: str, indexed: Optional[tuple[int, int]]):
+        """Reindex a chapter from its file unless ``indexed`` (mtime, size) still matches; drop it if gone."""
+        ch_file = self.data_dir / book_slug / "chapters" / f"{chapter_slug}.md"
+        try:
+            st = ch_file.stat()
+        except FileNotFoundError:
+            if indexed is not None:
+                self.remove_chapter(book_slug, chapter_slug)
+            return
+        if indexed != (st.st_mtime_ns, st.st_size):
+            content = ch_file.read_bytes().decode("utf-8", errors="replace")
+            self.index_chapter(book_slug, chapter_slug, content, st.st_mtime_ns, st.st_size)
+
+    def _indexed_stat(self, book_slug: str, chapter_slug: str) -> Optional[tuple[int, int]]:
+        row = self._db().execute(
+            "SELECT mtime, size FROM docs WHERE book = ? AND chapter = ?", (book_slug, chapter_slug),
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def schedule_chapter(self, book_slug: str, chapter_slug: str):
+        """Queue a chapter (saved, renamed away or deleted) to be brought up to date in the background."""
+        with self._pending_changed:
+            self._pending[(book_slug, chapter_slug)] = time.monotonic() + self.delay
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_pending, name="search-indexer", daemon=True)
+                self._worker.start()
+            self._pending_changed.notify()
+
+    def _take_pending(self, due_only: bool) -> list[tuple[str, str]]:
+        now = time.monotonic()
+        with self._pending_changed:
+            keys = [key for key, due in self._pending.items() if not due_only or due <= now]
+            for key in keys:
+                del self._pending[key]
+        return keys
+
+    def _index_pending(self, keys: list[tuple[str, str]]):
+        for book_slug, chapter_slug in keys:
+            try:
+                self._refresh(book_slug, chapter_slug, self._indexed_stat(book_slug, chapter_slug))
+            except (OSError, sqlite3.Error) as e:
+                print(f"Search index update failed: {e}")
+
+    def _run_pending(self):
+        while True:
+            with self._pending_changed:
+                while True:
+                    now = time.monotonic()
+                    next_due = min(self._pending.values(), default=None)
+                    if next_due is not None and next_due <= now:
+                        break
+                    self._pending_changed.wait(None if next_due is None else next_due - now)
+            # Under the index lock, so a concurrent flush() sees these chapters indexed.
+            with self._lock:
+                self._index_pending(self._take_pending(due_only=True))
+
+    def flush(self):
+        """Index every queued chapter now."""
+        with self._lock:
+            self._index_pending(self._take_pending(due_only=False))
+
+    def reconcile(self):
+        """Bring the index in line with files changed outside the app."""
+        try:
+            with self._lock:
+                indexed = {
+                    (book, chapter): (mtime, size)
+                    for book, chapter, mtime, size in self._db().execute("SELECT book, chapter, mtime, size FROM docs")
+                }
+            seen = set()
+            if self.data_dir.exists():
+                for ch_file in self.data_dir.glob("*/chapters/*.md"):
+                    key = (ch_file.parent.parent.name, ch_file.stem)
+                    seen.add(key)
+                    self._refresh(key[0], key[1], indexed.get(key))
+            for book_slug, chapter_slug in indexed.keys() - seen:
+                self.remove_chapter(book_slug, chapter_slug)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Search index reconcile failed: {e}")
+        finally:
+            self._reconciled.set()
+
+    def start_reconcile(self):
+        """Reconcile in a background thread (once per process)."""
+        with self._lock:
+            if self._reconcile_started:
+                return
+            self._reconcile_started = True
+        threading.Thread(target=self.reconcile, name="search-reconcile", daemon=True).start()
+
+    # --- Queries ---
+
+    def search(self, query: str, book_slug: Optional[str] = None, limit: int = 20) -> dict:
+        started = time.perf_counter()
+        self.start_reconcile()
+        self._reconciled.wait()
+        self.flush()
+
+        match, needles = _match_query(query)
+        results = []
+        if match:
+            sql = (
+                "SELECT s.book, s.chapter, d.title, s.heading, s.anchor, s.body, "
+                "bm25(sections_fts, 5.0, 1.0) AS score "
+                "FROM sections_fts "
+                "JOIN sections s ON s.id = sections_fts.rowid "
+                "JOIN docs d ON d.book = s.book AND d.chapter = s.chapter "
+                "WHERE sections_fts MATCH ?"
+            )
+            args: list = [match]
+            if book_slug:
+                sql += " AND s.book = ?"
+                args.append(book_slug)
+            sql += " ORDER BY score LIMIT ?"
+            args.append(limit)
+            with self._lock:
+                rows = self._db().execute(sql, args).fetchall()
+            for book, chapter, title, heading, anchor, body, score in rows:
+                results.append({
+                    "bookSlug": book,
+                    "chapterSlug": chapter,
+                    "chapterTitle": title,
+                    "heading": heading,
+                    "anchor": anchor,
+                    "snippet": _snippet(body, needles),
+                    "score": round(-score, 4),
+                })
+
+        return {
+            "query": query,
+            "results": results,
+            "tookMs": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Global search index
+search_index = SearchIndex(DATA_DIR, INDEX_FILE)
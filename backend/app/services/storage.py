@@ -1,12 +1,72 @@
 """File-based storage service for books and chapters."""
 import json
-import subprocess
+import os
+import shutil
+import tempfile
+import threading
+from difflib import SequenceMatcher
 from pathlib import Path
 from datetime import datetime
 from typing import Optional
 
+from . import git_sync
+from .images import image_files
+from .metadata_index import MetadataIndex, content_hash
+from .render import render_cache
+from .search import search_index
+
 DATA_DIR = Path(__file__).parent.parent.parent / "data" / "books"
-REPO_ROOT = Path(__file__).parent.parent.parent.parent
+CACHE_DIR = DATA_DIR.parent / ".cache"
+
+# Process-wide chapter/book metadata, revalidated by stat() on every lookup.
+_index = MetadataIndex(DATA_DIR, CACHE_DIR / "metadata_index.json")
+
+# Repeats of an op's text on changed lines are told apart by this much context.
+REBASE_CONTEXT = 200
+REBASE_MAX_CANDIDATES = 64
+
+# One lock per book: writes within a book are serialized, different books run in parallel.
+_book_locks: dict[str, threading.RLock] = {}
+_book_locks_guard = threading.Lock()
+
+
+class ChapterConflictError(Exception):
+    """Raised when a patch's base hash no longer matches the chapter."""
+
+    def __init__(self, current_hash: str):
+        super().__init__("Chapter has changed since the base version")
+        self.current_hash = current_hash
+
+
+def _book_lock(book_slug: str) -> threading.RLock:
+    """Return the (re-entrant) write lock for a book."""
+    with _book_locks_guard:
+        lock = _book_locks.get(book_slug)
+        if lock is None:
+            lock = _book_locks[book_slug] = threading.RLock()
+        return lock
+
+
+def _atomic_write_text(path: Path, text: str):
+    """Write a file via temp file + fsync + rename so readers never see a partial write."""
+    try:
+        mode = path.stat().st_mode & 0o777
+    except OSError:
+        mode = 0o644
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
 
 
 def _slugify(text: str) -> str:
@@ -26,6 +86,11 @@ def _extract_heading_slug(content: str, fallback_slug: str) -> str:
     return fallback_slug
 
 
+def flush_metadata_index():
+    """Persist the metadata index immediately (e.g. on shutdown)."""
+    _index.save(force=True)
+
+
 def ensure_data_dir():
     """Ensure the data directory exists."""
     DATA_DIR.mkdir(parents=True, exist_ok=True)
@@ -36,60 +101,47 @@ def ensure_data_dir():
 def list_books() -> list[dict]:
     """List all books."""
     ensure_data_dir()
-    books = []
-    for book_dir in DATA_DIR.iterdir():
-        if book_dir.is_dir():
-            meta_file = book_dir / "book.json"
-            if meta_file.exists():
-                meta = json.loads(meta_file.read_text())
-                books.append({"slug": book_dir.name, "title": meta.get("title", book_dir.name)})
+    books = _index.list_books()
+    _index.save()
     return books
 
 
 def get_book(slug: str) -> Optional[dict]:
     """Get book metadata and chapters."""
-    book_dir = DATA_DIR / slug
-    meta_file = book_dir / "book.json"
-    if not meta_file.exists():
+    meta = _index.book_meta(slug)
+    if meta is None:
         return None
     
-    meta = json.loads(meta_file.read_text())
-    chapters_dir = book_dir / "chapters"
-    
-    chapters = []
-    chapter_order = meta.get("chapterOrder", [])
+    chapter_entries = []
+    chapter_order = meta["chapterOrder"]
     
     # Add chapters in order
     for ch_slug in chapter_order:
-        ch_file = chapters_dir / f"{ch_slug}.md"
-        if ch_file.exists():
-            # Extract title from first heading or use slug
-            content = ch_file.read_text()
-            title = ch_slug
-            for line in content.split("\n"):
-                if line.startswith("# "):
-                    title = line[2:].strip()
-                    break
-            chapters.append({"slug": ch_slug, "title": title})
+        entry = _index.chapter(slug, ch_slug)
+        if entry:
+            chapter_entries.append({"slug": ch_slug, **entry})
     
     # Add any chapters not in order
-    if chapters_dir.exists():
-        for ch_file in chapters_dir.glob("*.md"):
-            ch_slug = ch_file.stem
-            if ch_slug not in chapter_order:
-                content = ch_file.read_text()
-                title = ch_slug
-                for line in content.split("\n"):
-                    if line.startswith("# "):
-                        title = line[2:].strip()
-                        break
-                chapters.append({"slug": ch_slug, "title": title})
+    ordered = set(chapter_order)
+    for ch_slug in _index.chapter_slugs(slug):
+        if ch_slug not in ordered:
+            entry = _index.chapter(slug, ch_slug)
+            if entry:
+                chapter_entries.append({"slug": ch_slug, **entry})
+    
+    chapters = [{"slug": c["slug"], "title": c["title"]} for c in chapter_entries]
     
+    _index.save()
+    version = content_hash(json.dumps(
+        [meta["title"], meta["author"], [[c["slug"], c["hash"]] for c in chapter_entries]],
+        ensure_ascii=False,
+    ))
     return {
         "slug": slug,
-        "title": meta.get("title", slug),
-        "author": meta.get("author"),
+        "title": meta["title"],
+        "author": meta["author"],
         "chapters": chapters,
+        "version": version,
     }
 
 
@@ -98,32 +150,37 @@ def create_book(title: str, author: str = "") -> dict:
     ensure_data_dir()
     slug = _slugify(title)
     book_dir = DATA_DIR / slug
-    book_dir.mkdir(exist_ok=True)
-    (book_dir / "chapters").mkdir(exist_ok=True)
-    
-    meta = {
-        "title": title,
-        "author": author,
-        "createdAt": datetime.utcnow().isoformat() + "Z",
-        "chapterOrder": [],
-    }
-    (book_dir / "book.json").write_text(json.dumps(meta, indent=2))
+    with _book_lock(slug):
+        book_dir.mkdir(exist_ok=True)
+        (book_dir / "chapters").mkdir(exist_ok=True)
+        
+        meta = {
+            "title": title,
+            "author": author,
+            "createdAt": datetime.utcnow().isoformat() + "Z",
+            "chapterOrder": [],
+        }
+        _atomic_write_text(book_dir / "book.json", json.dumps(meta, indent=2))
+        _index.record_book_meta(slug, meta)
 
     book_meta_path = f"backend/data/books/{slug}/book.json"
     commit_msg = f"Add book {title}"
-    git_success = _git_commit_and_push([book_meta_path], commit_msg)
+    commit = git_sync.enqueue(slug, [book_meta_path], commit_msg)
 
-    return {"slug": slug, "title": title, "gitCommitted": git_success}
+    return {"slug": slug, "title": title, "commitId": commit["id"], "commitStatus": commit["status"]}
 
 
 def delete_book(slug: str) -> bool:
     """Delete a book and all its chapters."""
-    import shutil
-    book_dir = DATA_DIR / slug
-    if not book_dir.exists():
-        return False
-    shutil.rmtree(book_dir)
-    return True
+    with _book_lock(slug):
+        book_dir = DATA_DIR / slug
+        if not book_dir.exists():
+            return False
+        shutil.rmtree(book_dir)
+        _index.forget_book(slug)
+        search_index.remove_book(slug)
+        image_files.forget_book(slug)
+        return True
 
 
 # --- Chapters ---
@@ -135,129 +192,294 @@ def get_chapter(book_slug: str, chapter_slug: str) -> Optional[dict]:
         return None
     
     stat = ch_file.stat()
+    content, digest = _read_chapter_file(ch_file)
     return {
-        "content": ch_file.read_text(),
+        "content": content,
         "updatedAt": datetime.fromtimestamp(stat.st_mtime).isoformat() + "Z",
+        "contentHash": digest,
     }
 
 
-def _run_git(args: list[str]) -> subprocess.CompletedProcess:
-    """Run git command in repo root."""
-    return subprocess.run(
-        ["git", *args],
-        cwd=REPO_ROOT,
-        text=True,
-        capture_output=True,
-        check=False,
-    )
-
-
-def _is_missing_pathspec(stderr: str) -> bool:
-    lowered = stderr.lower()
-    return "pathspec" in lowered and ("did not match any file" in lowered or "did not match any files" in lowered)
+def _read_chapter_file(ch_file: Path) -> tuple[str, str]:
+    """Return a chapter's text with newlines normalized, and the hash of its bytes.
 
+    The hash is taken over the bytes on disk, like the metadata index does,
+    so ETags and patch base hashes agree for chapters saved with CRLF.
+    """
+    data = ch_file.read_bytes()
+    content = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+    return content, content_hash(data)
 
-def _git_commit_and_push(paths: list[str], commit_msg: str) -> bool:
-    """Stage selected paths, commit (if changed), and push."""
-    try:
-        for path in paths:
-            add_result = _run_git(["add", "-A", "--", path])
-            if add_result.returncode != 0:
-                err = add_result.stderr.strip()
-                if _is_missing_pathspec(err):
-                    continue
-                print(f"Git add failed: {err}")
-                return False
-
-        # Nothing staged means file content didn't change.
-        staged_result = _run_git(["diff", "--cached", "--quiet"])
-        if staged_result.returncode == 0:
-            return True
-
-        commit_result = _run_git(["commit", "-m", commit_msg])
-        if commit_result.returncode != 0:
-            print(f"Git commit failed: {commit_result.stderr.strip()}")
-            return False
 
-        push_result = _run_git(["push"])
-        if push_result.returncode != 0:
-            print(f"Git push failed: {push_result.stderr.strip()}")
-            return False
+def get_chapter_hash(book_slug: str, chapter_slug: str) -> Optional[str]:
+    """Content hash of a chapter from the metadata index (stat-validated)."""
+    entry = _index.chapter(book_slug, chapter_slug)
+    return entry["hash"] if entry else None
 
-        return True
-    except Exception as e:
-        # Log error but don't fail the save
-        print(f"Git operation failed: {e}")
-        return False
-
-
-def save_chapter(book_slug: str, chapter_slug: str, content: str) -> dict:
-    """Save chapter content and commit to git."""
-    chapters_dir = DATA_DIR / book_slug / "chapters"
-    chapters_dir.mkdir(parents=True, exist_ok=True)
 
-    old_slug = chapter_slug
-    target_slug = _extract_heading_slug(content, chapter_slug)
-    target_file = chapters_dir / f"{target_slug}.md"
-    old_file = chapters_dir / f"{old_slug}.md"
+def get_rendered_chapter(book_slug: str, chapter_slug: str) -> Optional[dict]:
+    """Sanitized HTML and TOC of a chapter, served from ``render_cache`` when possible."""
+    chapter = get_chapter(book_slug, chapter_slug)
+    if not chapter:
+        return None
+    rendered = render_cache.get(chapter["contentHash"], chapter["content"])
+    return {
+        "html": rendered["html"],
+        "toc": rendered["toc"],
+        "contentHash": chapter["contentHash"],
+        "updatedAt": chapter["updatedAt"],
+    }
 
-    # Avoid overwriting another chapter when heading-generated slug collides.
-    if target_slug != old_slug and target_file.exists():
-        target_slug = old_slug
-        target_file = old_file
 
-    chapter_is_new = not old_file.exists() and not target_file.exists()
-    did_move = target_slug != old_slug and old_file.exists()
+def apply_text_ops(content: str, ops: list[dict]) -> str:
+    """Apply ``{start, end, text}`` replacements given in base-content offsets."""
+    result = []
+    cursor = 0
+    for op in sorted(ops, key=lambda o: (o["start"], o["end"])):
+        start, end = op["start"], op["end"]
+        if start < cursor or end < start or end > len(content):
+            raise ValueError(f"Invalid or overlapping op range {start}-{end}")
+        result.append(content[cursor:start])
+        result.append(op.get("text", ""))
+        cursor = end
+    result.append(content[cursor:])
+    return "".join(result)
+
+
+def _common_prefix_len(a: str, b: str) -> int:
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix_len(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, min(len(a), len(b), limit)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid:] == b[len(b) - mid:]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _line_blocks(base: str, current: str, prefix: int, suffix: int) -> list[tuple[str, int, int, int, int]]:
+    """Line diff of two versions as ``(tag, base_start, base_end, cur_start, cur_end)`` char ranges.
+
+    Only the lines between the common prefix and suffix are compared; the
+    rest is reported as two equal blocks.
+    """
+    lo = base.rfind("\n", 0, prefix) + 1
+    nl = base.find("\n", len(base) - suffix)
+    hi = len(base) if nl == -1 else nl + 1
+    tail = len(base) - hi
+    cur_hi = len(current) - tail
+
+    def offsets(text: str, start: int) -> list[int]:
+        result = [start]
+        for line in text.splitlines(keepends=True):
+            result.append(result[-1] + len(line))
+        return result
+
+    base_lines, cur_lines = base[lo:hi].splitlines(keepends=True), current[lo:cur_hi].splitlines(keepends=True)
+    base_at, cur_at = offsets(base[lo:hi], lo), offsets(current[lo:cur_hi], lo)
+    blocks = [("equal", 0, lo, 0, lo)] if lo else []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, cur_lines).get_opcodes():
+        blocks.append((tag, base_at[i1], base_at[i2], cur_at[j1], cur_at[j2]))
+    if tail:
+        blocks.append(("equal", hi, len(base), cur_hi, len(current)))
+    return blocks
+
+
+def _find_anchored(base: str, current: str, start: int, end: int, prefix: int, suffix: int) -> Optional[int]:
+    """Position of ``base[start:end]`` in ``current``, or None if it was changed or is ambiguous.
+
+    A line diff maps the op: on unchanged lines it moves with them. On lines
+    that changed, its text must still occur in what those lines became
+    (so a copy elsewhere is never taken), and repeats there are told apart
+    by how much of the surrounding text still matches.
+    """
+    covering = [
+        block for block in _line_blocks(base, current, prefix, suffix)
+        if (block[1] < end and block[2] > start) or (start == end and block[1] <= start < block[2])
+    ]
+    if not covering:
+        return None
+    if len(covering) == 1 and covering[0][0] == "equal":
+        _, base_start, _, cur_start, _ = covering[0]
+        return start - base_start + cur_start
 
-    if did_move:
-        old_file.rename(target_file)
+    selected = base[start:end]
+    if not selected:
+        return None
+    region_start, region_end = covering[0][3], covering[-1][4]
+    candidates = []
+    pos = current.find(selected, region_start, region_end)
+    while pos != -1 and len(candidates) < REBASE_MAX_CANDIDATES:
+        candidates.append(pos)
+        pos = current.find(selected, pos + 1, region_end)
+    if len(candidates) <= 1:
+        return candidates[0] if candidates else None
+
+    before, after = base[max(0, start - REBASE_CONTEXT):start], base[end:end + REBASE_CONTEXT]
+
+    def score(pos: int) -> int:
+        ctx_before = current[max(0, pos - REBASE_CONTEXT):pos]
+        ctx_after = current[pos + len(selected):pos + len(selected) + REBASE_CONTEXT]
+        return _common_suffix_len(before, ctx_before, REBASE_CONTEXT) + _common_prefix_len(after, ctx_after)
+
+    scored = sorted(((score(pos), pos) for pos in candidates), reverse=True)
+    if scored[0][0] == scored[1][0]:
+        return None  # Ambiguous
+    return scored[0][1]
+
+
+def rebase_text_ops(base: str, current: str, ops: list[dict]) -> list[dict]:
+    """Move ops given in ``base`` offsets onto ``current``.
+
+    Ops entirely before or after the region that changed between the two
+    versions are kept or shifted; ops touching it are mapped through a line
+    diff (see ``_find_anchored``). Raises ``ChapterConflictError`` only when
+    the op's own text was changed, or can no longer be told apart from a
+    repeat of it.
+    """
+    if base == current:
+        return [dict(op) for op in ops]
+    prefix = _common_prefix_len(base, current)
+    suffix = _common_suffix_len(base, current, min(len(base), len(current)) - prefix)
+    changed_end = len(base) - suffix
+    shift = len(current) - len(base)
+
+    rebased = []
+    for op in ops:
+        start, end = op["start"], op["end"]
+        if end <= prefix:
+            new_start = start
+        elif start >= changed_end:
+            new_start = start + shift
+        else:
+            new_start = _find_anchored(base, current, start, end, prefix, suffix)
+            if new_start is None:
+                raise ChapterConflictError(content_hash(current))
+        rebased.append({**op, "start": new_start, "end": new_start + (end - start)})
+    return rebased
 
-    target_file.write_text(content)
 
-    # Update chapter order and metadata.
-    book_title = None
-    meta_file = DATA_DIR / book_slug / "book.json"
-    meta_changed = False
-    if meta_file.exists():
-        meta = json.loads(meta_file.read_text())
-        book_title = meta.get("title", book_slug)
-        order = list(meta.get("chapterOrder", []))
-
-        if target_slug != old_slug:
-            order = [target_slug if slug == old_slug else slug for slug in order]
-            meta_changed = True
-
-        if target_slug not in order:
-            order.append(target_slug)
-            meta_changed = True
-
-        if meta_changed:
-            meta["chapterOrder"] = order
-            meta_file.write_text(json.dumps(meta, indent=2))
-
-    renamed = target_slug != old_slug
-    action = "Rename" if renamed else ("Add" if chapter_is_new else "Update")
-    if renamed:
-        commit_msg = f"Rename {book_title or book_slug}/{old_slug} -> {target_slug}"
-    else:
-        commit_msg = f"{action} {book_title or book_slug}/{target_slug}"
-
-    target_path = f"backend/data/books/{book_slug}/chapters/{target_slug}.md"
-    old_path = f"backend/data/books/{book_slug}/chapters/{old_slug}.md"
-    meta_path = f"backend/data/books/{book_slug}/book.json"
-
-    # Commit and push chapter + metadata updates, including old path for rename/delete staging.
-    commit_paths = [target_path, meta_path]
-    if did_move:
-        commit_paths.append(old_path)
-    git_success = _git_commit_and_push(commit_paths, commit_msg)
+def save_chapter(book_slug: str, chapter_slug: str, content: str) -> dict:
+    """Save chapter content and queue a git commit."""
+    with _book_lock(book_slug):
+        chapters_dir = DATA_DIR / book_slug / "chapters"
+        chapters_dir.mkdir(parents=True, exist_ok=True)
+
+        old_slug = chapter_slug
+        target_slug = _extract_heading_slug(content, chapter_slug)
+        target_file = chapters_dir / f"{target_slug}.md"
+        old_file = chapters_dir / f"{old_slug}.md"
+
+        # Avoid overwriting another chapter when heading-generated slug collides.
+        if target_slug != old_slug and target_file.exists():
+            target_slug = old_slug
+            target_file = old_file
+
+        chapter_is_new = not old_file.exists() and not target_file.exists()
+        did_move = target_slug != old_slug and old_file.exists()
+        previous_hash = get_chapter_hash(book_slug, old_slug)
+
+        if did_move:
+            old_file.rename(target_file)
+            _index.forget_chapter(book_slug, old_slug)
+            search_index.schedule_chapter(book_slug, old_slug)
+
+        _atomic_write_text(target_file, content)
+        entry = _index.record_chapter(book_slug, target_slug, content)
+        search_index.schedule_chapter(book_slug, target_slug)
+        if previous_hash and previous_hash != entry["hash"]:
+            render_cache.discard(previous_hash)
+
+        # Update chapter order and metadata.
+        book_title = None
+        meta_file = DATA_DIR / book_slug / "book.json"
+        meta_changed = False
+        if meta_file.exists():
+            meta = json.loads(meta_file.read_text())
+            book_title = meta.get("title", book_slug)
+            order = list(meta.get("chapterOrder", []))
+
+            if target_slug != old_slug:
+                order = [target_slug if slug == old_slug else slug for slug in order]
+                meta_changed = True
+
+            if target_slug not in order:
+                order.append(target_slug)
+                meta_changed = True
+
+            if meta_changed:
+                meta["chapterOrder"] = order
+                _atomic_write_text(meta_file, json.dumps(meta, indent=2))
+                _index.record_book_meta(book_slug, meta)
+
+        renamed = target_slug != old_slug
+        action = "Rename" if renamed else ("Add" if chapter_is_new else "Update")
+        if renamed:
+            commit_msg = f"Rename {book_title or book_slug}/{old_slug} -> {target_slug}"
+        else:
+            commit_msg = f"{action} {book_title or book_slug}/{target_slug}"
+
+        target_path = f"backend/data/books/{book_slug}/chapters/{target_slug}.md"
+        old_path = f"backend/data/books/{book_slug}/chapters/{old_slug}.md"
+        meta_path = f"backend/data/books/{book_slug}/book.json"
+
+        # Queue chapter + metadata updates for commit, including old path for rename/delete staging.
+        commit_paths = [target_path, meta_path]
+        if did_move:
+            commit_paths.append(old_path)
+        commit = git_sync.enqueue(book_slug, commit_paths, commit_msg)
     
-    return {
-        "updatedAt": datetime.utcnow().isoformat() + "Z",
-        "gitCommitted": git_success,
-        "chapterSlug": target_slug,
-        "renamed": renamed,
-    }
+        return {
+            "updatedAt": datetime.utcnow().isoformat() + "Z",
+            "contentHash": content_hash(content),
+            "commitId": commit["id"],
+            "commitStatus": commit["status"],
+            "chapterSlug": target_slug,
+            "renamed": renamed,
+        }
+
+
+def patch_chapter(
+    book_slug: str,
+    chapter_slug: str,
+    base_hash: str,
+    ops: list[dict],
+    base_content: Optional[str] = None,
+) -> dict:
+    """Apply text ops to a chapter if it still matches ``base_hash``, then save.
+
+    With ``base_content`` (the text the ops were computed against), a chapter
+    that has changed since is not a conflict by itself: the ops are rebased
+    onto the current text and only fail if the text they replace changed.
+    The result includes the ops as applied and the hash they applied to.
+    """
+    with _book_lock(book_slug):
+        ch_file = DATA_DIR / book_slug / "chapters" / f"{chapter_slug}.md"
+        if not ch_file.exists():
+            raise FileNotFoundError("Chapter not found")
+
+        content, current_hash = _read_chapter_file(ch_file)
+        if current_hash != base_hash:
+            if base_content is None:
+                raise ChapterConflictError(current_hash)
+            try:
+                ops = rebase_text_ops(base_content, content, ops)
+            except ChapterConflictError:
+                raise ChapterConflictError(current_hash) from None
+
+        result = save_chapter(book_slug, chapter_slug, apply_text_ops(content, ops))
+        return {**result, "baseHash": current_hash, "ops": ops}
 
 
 def create_chapter(book_slug: str, title: str) -> dict:
@@ -267,49 +489,61 @@ def create_chapter(book_slug: str, title: str) -> dict:
     result = save_chapter(book_slug, slug, content)
     return {
         "slug": result.get("chapterSlug", slug),
-        "gitCommitted": result.get("gitCommitted", False),
+        "commitId": result["commitId"],
+        "commitStatus": result["commitStatus"],
     }
 
 
 def delete_chapter(book_slug: str, chapter_slug: str) -> bool:
     """Delete a chapter."""
-    ch_file = DATA_DIR / book_slug / "chapters" / f"{chapter_slug}.md"
-    if not ch_file.exists():
-        return False
-    ch_file.unlink()
+    with _book_lock(book_slug):
+        ch_file = DATA_DIR / book_slug / "chapters" / f"{chapter_slug}.md"
+        if not ch_file.exists():
+            return False
+        previous_hash = get_chapter_hash(book_slug, chapter_slug)
+        ch_file.unlink()
+        _index.forget_chapter(book_slug, chapter_slug)
+        search_index.schedule_chapter(book_slug, chapter_slug)
+        if previous_hash:
+            render_cache.discard(previous_hash)
     
-    # Remove from order
-    meta_file = DATA_DIR / book_slug / "book.json"
-    if meta_file.exists():
-        meta = json.loads(meta_file.read_text())
-        if chapter_slug in meta.get("chapterOrder", []):
-            meta["chapterOrder"].remove(chapter_slug)
-            meta_file.write_text(json.dumps(meta, indent=2))
-
-    meta_path = f"backend/data/books/{book_slug}/book.json"
-    chapter_path = f"backend/data/books/{book_slug}/chapters/{chapter_slug}.md"
-    _git_commit_and_push(
-        [chapter_path, meta_path],
-        f"Delete {book_slug}/{chapter_slug}",
-    )
+        # Remove from order
+        meta_file = DATA_DIR / book_slug / "book.json"
+        if meta_file.exists():
+            meta = json.loads(meta_file.read_text())
+            if chapter_slug in meta.get("chapterOrder", []):
+                meta["chapterOrder"].remove(chapter_slug)
+                _atomic_write_text(meta_file, json.dumps(meta, indent=2))
+                _index.record_book_meta(book_slug, meta)
+
+        meta_path = f"backend/data/books/{book_slug}/book.json"
+        chapter_path = f"backend/data/books/{book_slug}/chapters/{chapter_slug}.md"
+        git_sync.enqueue(
+            book_slug,
+            [chapter_path, meta_path],
+            f"Delete {book_slug}/{chapter_slug}",
+        )
 
-    return True
+        return True
 
 
 def reorder_chapters(book_slug: str, chapter_order: list[str]) -> bool:
     """Reorder chapters."""
-    meta_file = DATA_DIR / book_slug / "book.json"
-    if not meta_file.exists():
-        return False
+    with _book_lock(book_slug):
+        meta_file = DATA_DIR / book_slug / "book.json"
+        if not meta_file.exists():
+            return False
     
-    meta = json.loads(meta_file.read_text())
-    meta["chapterOrder"] = chapter_order
-    meta_file.write_text(json.dumps(meta, indent=2))
+        meta = json.loads(meta_file.read_text())
+        meta["chapterOrder"] = chapter_order
+        _atomic_write_text(meta_file, json.dumps(meta, indent=2))
+        _index.record_book_meta(book_slug, meta)
 
-    meta_path = f"backend/data/books/{book_slug}/book.json"
-    _git_commit_and_push(
-        [meta_path],
-        f"Reorder chapters in {book_slug}",
-    )
+        meta_path = f"backend/data/books/{book_slug}/book.json"
+        git_sync.enqueue(
+            book_slug,
+            [meta_path],
+            f"Reorder chapters in {book_slug}",
+        )
 
-    return True
+        return True
@@ -0,0 +1,245 @@
+"""Cache and single-flight for agent suggestions.
+
+A suggestion is keyed by everything that goes into the prompt (selected
+text, instruction, extracted context, provider). Finished suggestions are
+kept in an LRU with a TTL and, if ``ZENAPP_SUGGESTION_CACHE_DISK=1``,
+persisted across restarts. A cache hit replays the recorded deltas at
+once. Identical requests that arrive while a suggestion is still being
+generated attach to the running generation and receive every event from
+the start, so only one ``codex`` process runs per key. The generation is
+cancelled once its last listener disconnects.
+
+``prefetch`` starts a speculative generation with no listeners; its result
+is kept for ``SPECULATIVE_TTL_SECONDS`` only. When a real request attaches
+to a speculative flight it becomes a normal one and its ``promote``
+callback is called so the run stops being preemptible.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Callable, Optional
+
+CACHE_FILE = Path(__file__).parent.parent.parent / "data" / ".cache" / "suggestions.json"
+
+PERSIST = os.getenv("ZENAPP_SUGGESTION_CACHE_DISK", "0") == "1"
+TTL_SECONDS = float(os.getenv("ZENAPP_SUGGESTION_CACHE_TTL", "3600"))
+SPECULATIVE_TTL_SECONDS = 120.0
+MAX_ENTRIES = 256
+
+Event = tuple[str, Optional[str]]  # (SSE text, final replacement or None)
+
+
+def suggestion_key(selected_text: str, prompt: str, context: dict, provider: str) -> str:
+    payload = json.dumps([selected_text, prompt, context, provider], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """One running generation and the events it has produced so far."""
+    __slots__ = ("events", "finished", "changed", "listeners", "task", "speculative", "promote")
+
+    def __init__(self, speculative: bool = False, promote: Optional[Callable[[], None]] = None):
+        self.events: list[Event] = []
+        self.finished = False
+        self.changed = asyncio.Event()
+        self.listeners = 0
+        self.task: Optional[asyncio.Task] = None
+        self.speculative = speculative
+        self.promote = promote
+
+
+class SuggestionCache:
+    """LRU + TTL cache of finished suggestions with single-flight generation."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL_SECONDS, cache_file: Optional[Path] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_file = cache_file
+        # key -> {"deltas": [...], "replacement": str, "createdAt": float, "ttl": float}
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._flights: dict[str, _Flight] = {}
+        self._loaded = cache_file is None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.joins = 0
+        self.prefetches = 0
+
+    # --- Persistence ---
+
+    def _load(self):
+        self._loaded = True
+        try:
+            data = json.loads(self.cache_file.read_text())
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, entry in data.get("entries", []):
+            if now - entry.get("createdAt", 0) < entry.get("ttl", self.ttl):
+                self._entries[key] = entry
+
+    def save(self):
+        """Write unexpired entries to disk (no-op without a cache file)."""
+        if self.cache_file is None or not self._dirty:
+            return
+        self._expire()
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.cache_file.parent, prefix=".suggestions.")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"entries": list(self._entries.items())}, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_file)
+            self._dirty = False
+        except OSError as e:
+            print(f"Suggestion cache save failed: {e}")
+
+    # --- Entries ---
+
+    def _expire(self):
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if now - e["createdAt"] >= e.get("ttl", self.ttl)]:
+            del self._entries[key]
+            self._dirty = True
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        if not self._loaded:
+            self._load()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["createdAt"] >= entry.get("ttl", self.ttl):
+            del self._entries[key]
+            self._dirty = True
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: str, events: list[Event], ttl: float):
+        replacement = next((text for _, text in reversed(events) if text), None)
+        if not replacement or any(event.startswith("event: error") for event, _ in events):
+            # Empty answers and partial ones (e.g. some chapter sections
+            # failed and kept their text) are not cached, so a retry reruns them.
+            return
+        self._entries[key] = {
+            "deltas": [event for event, text in events if text is None and event.startswith("event: delta")],
+            "replacement": replacement,
+            "createdAt": time.time(),
+            "ttl": ttl,
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def clear(self):
+        self._entries.clear()
+        self._dirty = True
+
+    # --- Streaming ---
+
+    async def _produce(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[Event]]):
+        stream = factory()
+        completed = False
+        try:
+            async for item in stream:
+                flight.events.append(item)
+                flight.changed.set()
+            completed = True
+        except Exception as e:
+            flight.events.append((f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n", None))
+        finally:
+            await stream.aclose()
+            flight.finished = True
+            flight.changed.set()
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if completed:
+                # A speculative result nobody asked for yet is only kept briefly.
+                ttl = min(self.ttl, SPECULATIVE_TTL_SECONDS) if flight.speculative else self.ttl
+                self._store(key, flight.events, ttl)
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[Event]]) -> AsyncIterator[Event]:
+        """Yield the suggestion events for ``key``, generating them with ``factory`` only if needed."""
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            for event in entry["deltas"]:
+                yield event, None
+            done = {"replacement": entry["replacement"], "cached": True}
+            yield f"event: done\ndata: {json.dumps(done)}\n\n", entry["replacement"]
+            return
+
+        flight = self._flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._produce(key, flight, factory))
+        else:
+            self.joins += 1
+            if flight.speculative:
+                flight.speculative = False
+                if flight.promote is not None:
+                    flight.promote()
+
+        flight.listeners += 1
+        position = 0
+        try:
+            while True:
+                while position < len(flight.events):
+                    yield flight.events[position]
+                    position += 1
+                if flight.finished:
+                    return
+                flight.changed.clear()
+                await flight.changed.wait()
+        finally:
+            flight.listeners -= 1
+            if flight.listeners == 0 and not flight.finished and flight.task is not None:
+                flight.task.cancel()
+
+    def has(self, key: str) -> bool:
+        """True if ``key`` is cached or being generated."""
+        return key in self._flights or self._lookup(key) is not None
+
+    def prefetch(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[Event]],
+        promote: Optional[Callable[[], None]] = None,
+    ) -> bool:
+        """Start a speculative generation for ``key``; False if already cached or running."""
+        if self.has(key):
+            return False
+        flight = self._flights[key] = _Flight(speculative=True, promote=promote)
+        flight.task = asyncio.create_task(self._produce(key, flight, factory))
+        self.prefetches += 1
+        return True
+
+    def cancel_prefetch(self, keys: list[str]) -> int:
+        """Cancel speculative generations for ``keys`` that nobody is waiting on."""
+        cancelled = 0
+        for key in keys:
+            flight = self._flights.get(key)
+            if flight and flight.speculative and flight.listeners == 0 and not flight.finished:
+                flight.task.cancel()
+                cancelled += 1
+        return cancelled
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "inFlight": len(self._flights),
+            "hits": self.hits,
+            "misses": self.misses,
+            "joins": self.joins,
+            "prefetches": self.prefetches,
+        }
+
+
+# Global suggestion cache
+suggestion_cache = SuggestionCache(cache_file=CACHE_FILE if PERSIST else None)
@@ -0,0 +1,26 @@
+"""Heading anchors and table of contents, matching frontend/src/lib/toc.ts."""
+import re
+
+HEADING_RE = re.compile(r"^(#{2,3})\s+(.+)$")
+
+# JS `\w` is ASCII-only; keep CJK ideographs like the frontend does.
+_STRIP_RE = re.compile("[^A-Za-z0-9_\u4e00-\u9fa5\\s-]")
+
+
+def slugify(text: str) -> str:
+    """Heading id, identical to ``slugify`` in toc.ts / Reader.tsx."""
+    slug = _STRIP_RE.sub("", text.lower())
+    slug = re.sub(r"\s+", "-", slug)
+    slug = re.sub(r"-+", "-", slug)
+    return slug.strip()
+
+
+def extract_toc(markdown: str) -> list[dict]:
+    """List ``{text, level, id}`` for every ``##``/``###`` heading."""
+    toc = []
+    for line in markdown.split("\n"):
+        match = HEADING_RE.match(line)
+        if match:
+            text = match.group(2).strip()
+            toc.append({"text": text, "level": len(match.group(1)), "id": slugify(text)})
+    return toc
@@ -0,0 +1,351 @@
+"""Agent latency under concurrent load, against a fake ``codex`` binary.
+
+Writes a stand-in ``codex`` executable into a temp dir at the front of
+PATH (configurable startup delay, token rate and output format), then
+drives ``POST /api/agent/suggest`` followed by ``POST /api/agent/revise``
+through the FastAPI app in-process at each concurrency level. Every
+request uses a distinct prompt, so the suggestion cache never answers.
+
+Reported per level and endpoint: time to first delta (TTFT) and total
+latency p50/p95/p99, errors, peak number of child processes and peak RSS
+(this process plus its children). Results are written as JSON so runs on
+different commits can be compared with ``--compare``.
+
+Usage (from backend/):
+    python -m bench.agent_load [--levels 1,2,4,8] [--requests 16]
+        [--startup 0.3] [--tokens-per-sec 40] [--words 40] [--format codex|plain]
+        [--max-concurrency 4] [--pool-size 2] [--out agent_load.json]
+        [--compare previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+FAKE_CODEX = """#!{python}
+import os, sys, time
+startup = float(os.environ.get("FAKE_CODEX_STARTUP", "0.3"))
+rate = float(os.environ.get("FAKE_CODEX_TOKENS_PER_SEC", "40"))
+words = int(os.environ.get("FAKE_CODEX_WORDS", "40"))
+fmt = os.environ.get("FAKE_CODEX_FORMAT", "codex")
+time.sleep(startup)
+sys.stdin.read()
+if fmt == "codex":
+    print("OpenAI Codex v0 (fake)\\n--------\\nuser\\n(prompt)\\n\\ncodex", flush=True)
+line = []
+for i in range(words):
+    time.sleep(1 / rate)
+    line.append("word%d" % i)
+    if len(line) == 8 or i == words - 1:
+        print(" ".join(line), flush=True)
+        line = []
+if fmt == "codex":
+    print("tokens used\\n%d" % words, flush=True)
+"""
+
+CONTENT = "# Bench chapter\n\n## Section\n\n" + "\n\n".join(
+    f"Paragraph {n}: " + "lorem ipsum dolor sit amet " * 12 for n in range(20)
+)
+
+
+def _install_fake_codex(bin_dir: Path):
+    path = bin_dir / "codex"
+    path.write_text(FAKE_CODEX.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+# --- Process sampling (Linux /proc) ---
+
+def _rss_kb(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _children(pid: int) -> list[int]:
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The ppid follows the parenthesised command name.
+                if int(f.read().rsplit(")", 1)[1].split()[1]) == pid:
+                    children.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return children
+
+
+class Sampler:
+    """Tracks peak child-process count and peak total RSS while running."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.available = os.path.isdir("/proc")
+        self.reset()
+
+    def reset(self):
+        self.peak_processes = 0
+        self.peak_rss_kb = 0
+
+    def sample(self):
+        pid = os.getpid()
+        children = _children(pid)
+        self.peak_processes = max(self.peak_processes, len(children))
+        self.peak_rss_kb = max(self.peak_rss_kb, _rss_kb(pid) + sum(_rss_kb(c) for c in children))
+
+    async def run(self):
+        while self.available:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+
+# --- Minimal streaming ASGI client (httpx's ASGITransport buffers the body) ---
+
+async def _post_sse(app, path: str, body: dict, token: str) -> dict:
+    """POST ``body`` to ``path`` and time the SSE stream; returns timings and parsed events."""
+    payload = json.dumps(body).encode()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode()),
+            (b"authorization", f"Bearer {token}".encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    sent = False
+    disconnected = asyncio.Event()
+    start = time.perf_counter()
+    result = {"status": None, "ttftMs": None, "totalMs": None, "deltaMs": [], "events": {}}
+    buffer = ""
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": payload, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal buffer
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            buffer += message.get("body", b"").decode()
+            while "\n\n" in buffer:
+                block, buffer = buffer.split("\n\n", 1)
+                kind = data = None
+                for line in block.split("\n"):
+                    if line.startswith("event: "):
+                        kind = line[7:]
+                    elif line.startswith("data: "):
+                        data = json.loads(line[6:])
+                if kind == "delta":
+                    result["deltaMs"].append((time.perf_counter() - start) * 1000)
+                    if result["ttftMs"] is None:
+                        result["ttftMs"] = result["deltaMs"][0]
+                if kind:
+                    result["events"][kind] = data
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    result["totalMs"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+# --- Load levels ---
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 1)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def _summary(results: list[dict], seconds: float) -> dict:
+    ok = [r for r in results if r["status"] == 200 and "done" in r["events"] and "error" not in r["events"]]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "ttftMs": _percentiles([r["ttftMs"] for r in ok if r["ttftMs"] is not None]),
+        "totalMs": _percentiles([r["totalMs"] for r in ok]),
+        "throughputPerSec": round(len(ok) / seconds, 2) if seconds else None,
+    }
+
+
+async def _run_level(app, token: str, concurrency: int, requests: int, sampler: Sampler, run_id: str) -> dict:
+    start_at = CONTENT.index("Paragraph 5")
+    end_at = CONTENT.index("\n\n", start_at)
+    counter = iter(range(requests))
+    suggest_results: list[dict] = []
+    revise_results: list[dict] = []
+
+    async def worker():
+        for n in counter:
+            suggest = await _post_sse(app, "/api/agent/suggest", {
+                "bookSlug": "bench",
+                "chapterSlug": "bench",
+                "selectionStart": start_at,
+                "selectionEnd": end_at,
+                "prompt": f"Tighten this ({run_id}/{concurrency}/{n})",
+                "content": CONTENT,
+            }, token)
+            suggest_results.append(suggest)
+            session = suggest["events"].get("session")
+            if not session:
+                continue
+            revise_results.append(await _post_sse(app, "/api/agent/revise", {
+                "sessionId": session["sessionId"],
+                "prompt": f"Shorter ({run_id}/{concurrency}/{n})",
+            }, token))
+
+    sampler.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+    sampler.sample()
+    return {
+        "concurrency": concurrency,
+        "seconds": round(seconds, 2),
+        "suggest": _summary(suggest_results, seconds),
+        "revise": _summary(revise_results, seconds),
+        "peakProcesses": sampler.peak_processes if sampler.available else None,
+        "peakRssMb": round(sampler.peak_rss_kb / 1024, 1) if sampler.available else None,
+    }
+
+
+async def _bench(levels: list[int], requests: int) -> list[dict]:
+    from app.auth import USERS, create_access_token
+    from app.main import app
+    from app.services import agent
+
+    token = create_access_token(next(iter(USERS)))
+    sampler = Sampler()
+    sampling = asyncio.create_task(sampler.run())
+    run_id = f"{os.getpid()}-{time.time():.0f}"
+    agent.warm_provider()
+    await asyncio.sleep(0.5)  # Let the warm pool fill, as after startup
+    try:
+        return [await _run_level(app, token, level, requests, sampler, run_id) for level in levels]
+    finally:
+        sampling.cancel()
+        await agent.close_provider()
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _print(results: list[dict], previous: dict = None):
+    before = {r["concurrency"]: r for r in (previous or {}).get("levels", [])}
+    print(f"{'conc':>4} {'endpoint':<8} {'ttft p50/p95/p99 ms':>22} {'total p50/p95/p99 ms':>24} {'err':>4} {'procs':>5} {'rss MB':>7}")
+    for level in results:
+        for endpoint in ("suggest", "revise"):
+            s = level[endpoint]
+            ttft = "/".join(str(s["ttftMs"][p]) for p in ("p50", "p95", "p99"))
+            total = "/".join(str(s["totalMs"][p]) for p in ("p50", "p95", "p99"))
+            line = (f"{level['concurrency']:>4} {endpoint:<8} {ttft:>22} {total:>24} {s['errors']:>4} "
+                    f"{level['peakProcesses']!s:>5} {level['peakRssMb']!s:>7}")
+            old = before.get(level["concurrency"], {}).get(endpoint)
+            if old and old["totalMs"]["p50"] and s["totalMs"]["p50"]:
+                line += f"   total p50 {s['totalMs']['p50'] - old['totalMs']['p50']:+.1f} ms vs {previous['commit']}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--levels", default="1,2,4,8", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=16, help="suggest+revise pairs per level")
+    parser.add_argument("--startup", type=float, default=0.3, help="fake codex startup delay (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="fake codex output rate")
+    parser.add_argument("--words", type=int, default=40, help="words in each fake answer")
+    parser.add_argument("--format", choices=["codex", "plain"], default="codex",
+                        help="codex: banner + 'codex' marker + 'tokens used'; plain: answer lines only")
+    parser.add_argument("--max-concurrency", type=int, help="ZENAPP_AGENT_MAX_CONCURRENCY for the run")
+    parser.add_argument("--pool-size", type=int, help="ZENAPP_CODEX_POOL_SIZE for the run")
+    parser.add_argument("--out", default="agent_load.json", help="JSON results file")
+    parser.add_argument("--compare", help="previous results file to diff against")
+    args = parser.parse_args()
+
+    levels = [int(n) for n in args.levels.split(",") if n.strip()]
+    os.environ.update({
+        "ZENAPP_GIT_SYNC": "0",
+        "ZENAPP_AGENT_BACKEND": "codex",
+        "ZENAPP_SUGGESTION_CACHE_DISK": "0",
+        "FAKE_CODEX_STARTUP": str(args.startup),
+        "FAKE_CODEX_TOKENS_PER_SEC": str(args.tokens_per_sec),
+        "FAKE_CODEX_WORDS": str(args.words),
+        "FAKE_CODEX_FORMAT": args.format,
+    })
+    if args.max_concurrency is not None:
+        os.environ["ZENAPP_AGENT_MAX_CONCURRENCY"] = str(args.max_concurrency)
+    if args.pool_size is not None:
+        os.environ["ZENAPP_CODEX_POOL_SIZE"] = str(args.pool_size)
+
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _install_fake_codex(Path(tmp))
+        results = asyncio.run(_bench(levels, args.requests))
+
+    from app.services.agent_scheduler import agent_scheduler
+    from app.services.agent import agent_provider
+    report = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {
+            "levels": levels,
+            "requests": args.requests,
+            "startup": args.startup,
+            "tokensPerSec": args.tokens_per_sec,
+            "words": args.words,
+            "format": args.format,
+            "maxConcurrency": agent_scheduler.max_concurrency,
+            "backend": agent_provider.name,
+            "provider": agent_provider.stats(),
+        },
+        "levels": results,
+    }
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    _print(results, previous)
+    print(f"Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""Peak memory and CPU of processing a large upload, and early rejection of oversized ones.
+
+Part 1 runs ``process_image`` on a synthetic 12-megapixel JPEG in a fresh
+child process per mode and reports the peak RSS increase (VmHWM) and
+CPU time:
+
+    draft   current code: JPEG draft mode decodes at 1/2..1/8 scale
+    full    draft disabled: the whole image is decoded, then resized
+
+Part 2 posts oversized uploads through the app in-process and reports
+how much of the body was read before the 413: none with a declared
+Content-Length, just past the limit for a chunked body without one.
+
+Usage (from backend/):
+    python -m bench.image_memory [--width 4032] [--height 3024] [--runs 3]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+CHILD = """
+import json, resource, sys, time
+from PIL import JpegImagePlugin
+from app.services.images import process_image
+
+def hwm_kb():
+    # VmHWM starts afresh at exec; ru_maxrss can carry over the parent's peak.
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+if sys.argv[2] == "full":
+    JpegImagePlugin.JpegImageFile.draft = lambda self, mode, size: None
+data = open(sys.argv[1], "rb").read()
+before, usage = hwm_kb(), resource.getrusage(resource.RUSAGE_SELF)
+start = time.perf_counter()
+out = process_image(data, "photo.jpg")
+elapsed = time.perf_counter() - start
+after, end = hwm_kb(), resource.getrusage(resource.RUSAGE_SELF)
+print(json.dumps({
+    "peakDeltaMb": (after - before) / 1024,
+    "peakMb": after / 1024,
+    "cpuMs": (end.ru_utime + end.ru_stime - usage.ru_utime - usage.ru_stime) * 1000,
+    "wallMs": elapsed * 1000,
+    "outputBytes": len(out),
+}))
+"""
+
+
+def _synthetic_photo(width: int, height: int) -> bytes:
+    """A smooth, photo-like JPEG (gradients and shapes), so 12MP stays under the upload limit."""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for i in range(60):
+        x, y = (i * 211) % width, (i * 137) % height
+        draw.ellipse((x, y, x + width // 6, y + height // 6), fill=((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=92)
+    return out.getvalue()
+
+
+def _measure(path: Path, mode: str) -> dict:
+    backend_dir = Path(__file__).resolve().parent.parent
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, str(path), mode],
+        cwd=backend_dir, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+async def _upload_abort(total_bytes: int, declare_length: bool) -> tuple[int, int]:
+    """Stream ``total_bytes`` of multipart body to the upload route; returns (status, bytes read)."""
+    from app.auth import USERS, create_access_token
+    from app.main import app
+
+    boundary = "benchboundary"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode()
+    chunk = b"\xff" * (64 * 1024)
+    headers = [
+        (b"host", b"bench"),
+        (b"content-type", f"multipart/form-data; boundary={boundary}".encode()),
+        (b"authorization", f"Bearer {create_access_token(next(iter(USERS)))}".encode()),
+    ]
+    if declare_length:
+        headers.append((b"content-length", str(total_bytes).encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": "/api/books/bench/images", "raw_path": b"/api/books/bench/images",
+        "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    read = 0
+    status = None
+    done = asyncio.Event()
+
+    async def receive():
+        nonlocal read
+        if read == 0:
+            read = len(head)
+            return {"type": "http.request", "body": head, "more_body": True}
+        if read >= total_bytes or done.is_set():
+            await done.wait()
+            return {"type": "http.disconnect"}
+        read += len(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": read < total_bytes}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await app(scope, receive, send)
+    return status, read
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=4032)
+    parser.add_argument("--height", type=int, default=3024)
+    parser.add_argument("--runs", type=int, default=3, help="child processes per mode (best run reported)")
+    parser.add_argument("--oversize-mb", type=float, default=50.0, help="size of the oversized uploads")
+    args = parser.parse_args()
+
+    os.environ.setdefault("ZENAPP_GIT_SYNC", "0")
+    from app.services import images
+
+    data = _synthetic_photo(args.width, args.height)
+    print(f"{args.width}x{args.height} JPEG, {len(data) / 1024 / 1024:.2f} MB "
+          f"(limit {images.MAX_IMAGE_SIZE / 1024 / 1024:.1f} MB), output width {images.MAX_IMAGE_WIDTH}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "photo.jpg"
+        path.write_bytes(data)
+        results = {}
+        for mode in ("full", "draft"):
+            runs = [_measure(path, mode) for _ in range(args.runs)]
+            results[mode] = min(runs, key=lambda r: r["cpuMs"])
+            r = results[mode]
+            print(f"  {mode:<6} peak RSS +{r['peakDeltaMb']:6.1f} MB   cpu {r['cpuMs']:7.1f} ms   "
+                  f"wall {r['wallMs']:7.1f} ms   output {r['outputBytes'] / 1024:.0f} KB")
+        full, draft = results["full"], results["draft"]
+        print(f"  draft vs full: {full['peakDeltaMb'] / max(draft['peakDeltaMb'], 0.1):.1f}x less memory, "
+              f"{full['cpuMs'] / max(draft['cpuMs'], 0.1):.1f}x less CPU")
+
+    total = int(args.oversize_mb * 1024 * 1024)
+    print(f"Oversized upload ({args.oversize_mb:.0f} MB):")
+    for declare in (True, False):
+        status, read = asyncio.run(_upload_abort(total, declare))
+        label = "with Content-Length" if declare else "chunked"
+        print(f"  {label:<20} -> {status}, {read / 1024 / 1024:.2f} MB of body read")
+
+
+if __name__ == "__main__":
+    main()
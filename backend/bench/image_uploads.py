@@ -0,0 +1,164 @@
+"""SSE smoothness while images are uploaded concurrently.
+
+Runs a few agent suggestion streams (against the fake ``codex`` from
+``bench.agent_load``) and, while they are streaming, posts a burst of
+large synthetic JPEG uploads through the app in-process. Reports the gaps
+between consecutive SSE deltas and the upload latencies for three modes:
+
+    none    streams only (baseline gaps)
+    inline  process_image called on the event loop (the old behaviour)
+    pool    the bounded worker-process pool (current behaviour)
+
+Uploads beyond ``ZENAPP_IMAGE_MAX_PENDING`` are answered with 503 and are
+counted as rejected. Images are written to a throwaway directory.
+
+Usage (from backend/):
+    python -m bench.image_uploads [--uploads 8] [--streams 4] [--width 3000]
+        [--height 2000] [--modes none,inline,pool]
+"""
+import argparse
+import asyncio
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("ZENAPP_GIT_SYNC", "0")
+os.environ["ZENAPP_AGENT_BACKEND"] = "codex"
+
+import httpx  # noqa: E402
+from PIL import Image, ImageDraw  # noqa: E402
+
+from bench.agent_load import CONTENT, _install_fake_codex, _percentiles, _post_sse  # noqa: E402
+
+
+def _synthetic_jpeg(width: int, height: int) -> bytes:
+    """A photo-like JPEG: gradients, shapes and noise so it does not compress to nothing."""
+    img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(img)
+    for i in range(0, width, max(1, width // 40)):
+        draw.ellipse((i, (i * 7) % height, i + width // 10, (i * 7) % height + height // 8),
+                     fill=((i * 3) % 256, (i * 5) % 256, (i * 11) % 256))
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    img = Image.blend(img, noise, 0.25)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=90)
+    return out.getvalue()
+
+
+async def _stream(app, token: str, n: int, tag: str) -> list[float]:
+    start_at = CONTENT.index("Paragraph 3")
+    result = await _post_sse(app, "/api/agent/suggest", {
+        "bookSlug": "bench",
+        "chapterSlug": "bench",
+        "selectionStart": start_at,
+        "selectionEnd": CONTENT.index("\n\n", start_at),
+        "prompt": f"Rewrite ({tag}/{n}/{time.time()})",
+        "content": CONTENT,
+    }, token)
+    times = result["deltaMs"]
+    return [b - a for a, b in zip(times, times[1:])]
+
+
+async def _upload(client: httpx.AsyncClient, token: str, data: bytes) -> tuple[int, float]:
+    start = time.perf_counter()
+    res = await client.post(
+        "/api/books/bench/images",
+        files={"file": ("photo.jpg", data, "image/jpeg")},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    return res.status_code, (time.perf_counter() - start) * 1000
+
+
+async def _run_mode(app, token: str, mode: str, args, data: bytes) -> dict:
+    from app.services import images
+
+    original = images.image_processor.process
+    if mode == "inline":
+        async def inline(image_data: bytes, filename: str) -> bytes:
+            return images.process_image(image_data, filename)
+        images.image_processor.process = inline
+
+    try:
+        streams = [asyncio.create_task(_stream(app, token, n, mode)) for n in range(args.streams)]
+        uploads = []
+        if mode != "none":
+            await asyncio.sleep(args.upload_delay)
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                uploads = await asyncio.gather(*(_upload(client, token, data) for _ in range(args.uploads)))
+        gaps = [gap for gaps in await asyncio.gather(*streams) for gap in gaps]
+    finally:
+        images.image_processor.process = original
+
+    ok = [ms for status, ms in uploads if status == 200]
+    return {
+        "mode": mode,
+        "gapMs": {**_percentiles(gaps), "max": round(max(gaps), 1) if gaps else None},
+        "uploads": len(uploads),
+        "uploadOk": len(ok),
+        "uploadRejected": sum(1 for status, _ in uploads if status == 503),
+        "uploadMs": _percentiles(ok),
+    }
+
+
+async def _bench(args, data: bytes) -> list[dict]:
+    from app.auth import USERS, create_access_token
+    from app.main import app
+    from app.services import agent, images
+
+    token = create_access_token(next(iter(USERS)))
+    agent.warm_provider()
+    # Start the image workers before measuring (spawned processes import the app modules).
+    await images.image_processor.process(_synthetic_jpeg(64, 64), "warm.jpg")
+    await asyncio.sleep(0.5)
+    try:
+        return [await _run_mode(app, token, mode, args, data) for mode in args.modes]
+    finally:
+        await agent.close_provider()
+        images.image_processor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uploads", type=int, default=8, help="concurrent uploads per mode")
+    parser.add_argument("--streams", type=int, default=2, help="concurrent SSE streams")
+    parser.add_argument("--width", type=int, default=3000)
+    parser.add_argument("--height", type=int, default=2000)
+    parser.add_argument("--modes", default="none,inline,pool")
+    parser.add_argument("--upload-delay", type=float, default=0.8, help="seconds into the streams to start uploading")
+    parser.add_argument("--tokens-per-sec", type=float, default=160.0, help="fake codex output rate")
+    parser.add_argument("--words", type=int, default=640, help="words per fake answer")
+    args = parser.parse_args()
+    args.modes = [m for m in args.modes.split(",") if m]
+
+    os.environ.update({
+        "FAKE_CODEX_STARTUP": "0.1",
+        "FAKE_CODEX_TOKENS_PER_SEC": str(args.tokens_per_sec),
+        "FAKE_CODEX_WORDS": str(args.words),
+        "FAKE_CODEX_FORMAT": "codex",
+        "ZENAPP_AGENT_MAX_CONCURRENCY": str(max(args.streams, 1)),
+    })
+
+    from app.services import images
+    data = _synthetic_jpeg(args.width, args.height)
+    if len(data) > images.MAX_IMAGE_SIZE:
+        raise SystemExit(f"Synthetic image is {len(data)} bytes, over MAX_IMAGE_SIZE; use a smaller --width/--height")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _install_fake_codex(Path(tmp))
+        images.DATA_DIR = Path(tmp) / "books"
+        results = asyncio.run(_bench(args, data))
+
+    print(f"{args.streams} streams, {args.uploads} uploads of {args.width}x{args.height} ({len(data) / 1024:.0f} KB), "
+          f"{images.image_processor.workers} image workers, max pending {images.image_processor.max_pending}")
+    print(f"{'mode':<7} {'delta gap p50/p95/p99/max ms':>30} {'ok':>3} {'503':>4} {'upload p50/p95 ms':>18}")
+    for r in results:
+        gap = "/".join(str(r["gapMs"][k]) for k in ("p50", "p95", "p99", "max"))
+        upload = "/".join(str(r["uploadMs"][k]) for k in ("p50", "p95"))
+        print(f"{r['mode']:<7} {gap:>30} {r['uploadOk']:>3} {r['uploadRejected']:>4} {upload:>18}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Chapter save throughput under concurrent writers.
+
+Compares N threads saving into one book (serialized by the per-book lock)
+with N threads saving into N different books (independent locks), using
+a throwaway copy of the storage layout. Git commits are disabled.
+
+Usage (from backend/):
+    python -m bench.storage_throughput [--threads 8] [--saves 200] [--size 20000]
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+os.environ.setdefault("ZENAPP_GIT_SYNC", "0")
+
+from app.services import storage  # noqa: E402
+from app.services.metadata_index import MetadataIndex  # noqa: E402
+from app.services.search import SearchIndex  # noqa: E402
+
+
+def _use_data_dir(data_dir: Path):
+    storage.DATA_DIR = data_dir
+    storage._index = MetadataIndex(data_dir, data_dir.parent / "metadata_index.json")
+    storage.search_index = SearchIndex(data_dir, data_dir.parent / "search.sqlite3")
+
+
+def _run(book_slugs: list[str], saves_per_thread: int, content: str) -> float:
+    barrier = threading.Barrier(len(book_slugs) + 1)
+
+    def writer(thread_no: int, book_slug: str):
+        barrier.wait()
+        for i in range(saves_per_thread):
+            storage.save_chapter(book_slug, f"ch-{thread_no}", f"# ch-{thread_no}\n\n{i}\n{content}")
+
+    threads = [
+        threading.Thread(target=writer, args=(n, slug))
+        for n, slug in enumerate(book_slugs)
+    ]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--saves", type=int, default=200, help="saves per thread")
+    parser.add_argument("--size", type=int, default=20000, help="chapter size in characters")
+    args = parser.parse_args()
+
+    content = ("lorem ipsum 中文段落 " * (args.size // 16 + 1))[:args.size]
+    total = args.threads * args.saves
+
+    with tempfile.TemporaryDirectory() as tmp:
+        _use_data_dir(Path(tmp) / "books")
+        slugs = [storage.create_book(f"bench-{n}")["slug"] for n in range(args.threads)]
+
+        same = _run([slugs[0]] * args.threads, args.saves, content)
+        cross = _run(slugs, args.saves, content)
+        storage.search_index.close()
+
+    print(f"{total} saves, {args.threads} threads, {args.size} chars each")
+    print(f"  same book:   {same:7.3f}s  {total / same:8.1f} saves/s")
+    print(f"  cross book:  {cross:7.3f}s  {total / cross:8.1f} saves/s  ({same / cross:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Local OpenAI-compatible streaming server for exercising the HTTP agent backend.
+
+Answers ``POST /v1/chat/completions`` with ``stream: true`` by echoing the
+text quoted after ``Edit this text:`` in the prompt (upper-cased), one word
+per SSE chunk, followed by ``data: [DONE]``. Connections are kept alive, so
+it also shows whether the client reuses them (see the per-connection
+request counts it logs).
+
+Usage (from backend/):
+    python -m bench.stub_llm_server [--port 8765] [--delay 0.02]
+
+    ZENAPP_AGENT_BACKEND=http ZENAPP_LLM_BASE_URL=http://127.0.0.1:8765/v1 \\
+        uvicorn app.main:app --port 8001
+
+With ``--check`` it starts the server, drives the HTTP provider against it
+and exits non-zero if streaming or connection reuse does not work.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUOTED_RE = re.compile(r'Edit this text: "(.*)"(?=\n\nInstruction:|\Z)', re.DOTALL)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    delay = 0.02
+    connections: dict[int, int] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/chat/completions":
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        prompt = body["messages"][-1]["content"]
+        match = QUOTED_RE.search(prompt)
+        answer = (match.group(1) if match else prompt[-80:]).upper()
+
+        key = id(self.connection)
+        self.connections[key] = self.connections.get(key, 0) + 1
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = answer.split(" ")
+        for i, word in enumerate(words):
+            delta = {"content": word + (" " if i < len(words) - 1 else "")}
+            chunk = {"id": "stub", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": delta}]}
+            self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            time.sleep(self.delay)
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+def serve(port: int, delay: float) -> ThreadingHTTPServer:
+    StubHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def _check(port: int, requests: int) -> bool:
+    os.environ["ZENAPP_AGENT_BACKEND"] = "http"
+    os.environ["ZENAPP_LLM_BASE_URL"] = f"http://127.0.0.1:{port}/v1"
+    from app.services import agent
+
+    ok = True
+    for i in range(requests):
+        deltas, done = 0, None
+        async for kind, payload in agent._agent_events(f'Edit this text: "hello stub world {i}"'):
+            if kind == "delta":
+                deltas += 1
+            elif kind == "done":
+                done = payload
+            elif kind == "error":
+                print(f"error: {payload['error']}")
+        expected = f"HELLO STUB WORLD {i}"
+        print(f"request {i}: {deltas} deltas, ttft {done and done['ttftMs']} ms, total {done and done['totalMs']} ms")
+        ok = ok and deltas == 4 and done is not None and done["replacement"] == expected
+    await agent.close_provider()
+
+    reused = max(StubHandler.connections.values(), default=0)
+    print(f"connections: {len(StubHandler.connections)}, most requests on one connection: {reused}")
+    return ok and reused == requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--check", action="store_true", help="run the HTTP provider against the stub and exit")
+    parser.add_argument("--requests", type=int, default=5, help="sequential requests for --check")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.delay)
+    if args.check:
+        ok = asyncio.run(_check(args.port, args.requests))
+        server.shutdown()
+        print("OK" if ok else "FAILED")
+        raise SystemExit(0 if ok else 1)
+
+    print(f"Stub LLM listening on http://127.0.0.1:{args.port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import os
+
+# No background git commits from tests.
+os.environ["ZENAPP_GIT_SYNC"] = "0"
+
+import pytest  # noqa: E402
+
+from app.services import images, search, storage  # noqa: E402
+from app.services.metadata_index import MetadataIndex  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Point storage, images and search at an empty ``books`` directory."""
+    books = tmp_path / "books"
+    books.mkdir()
+    index = search.SearchIndex(books, tmp_path / "search.sqlite3")
+    monkeypatch.setattr(storage, "DATA_DIR", books)
+    monkeypatch.setattr(storage, "_index", MetadataIndex(books, tmp_path / "metadata_index.json"))
+    monkeypatch.setattr(storage, "search_index", index)
+    monkeypatch.setattr(images, "DATA_DIR", books)
+    file_cache = images.ImageFileCache()
+    monkeypatch.setattr(images, "image_files", file_cache)
+    monkeypatch.setattr(storage, "image_files", file_cache)
+    yield books
+    index.close()
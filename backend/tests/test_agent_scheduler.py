@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from app.services import agent
+from app.services.agent_scheduler import (
+    INTERACTIVE,
+    SPECULATIVE,
+    AgentScheduler,
+    RunHandle,
+    SchedulerBusyError,
+)
+
+
+def test_tickets_wait_in_fifo_order():
+    async def run():
+        scheduler = AgentScheduler(max_concurrency=1, max_queue=4)
+        running = scheduler.enqueue()
+        first, second = scheduler.enqueue(), scheduler.enqueue()
+        positions = (running.position, first.position, second.position)
+        running.release()
+        return positions, first.granted, second.position
+
+    positions, first_granted, second_position = asyncio.run(run())
+    assert positions == (0, 1, 2)
+    assert first_granted and second_position == 1
+
+
+def test_full_queue_is_refused():
+    async def run():
+        scheduler = AgentScheduler(max_concurrency=1, max_queue=1)
+        scheduler.enqueue()
+        scheduler.enqueue()
+        with pytest.raises(SchedulerBusyError):
+            scheduler.enqueue()
+        return scheduler.stats()
+
+    assert asyncio.run(run())["rejected"] == 1
+
+
+def test_speculative_work_only_takes_an_idle_slot():
+    async def run():
+        scheduler = AgentScheduler(max_concurrency=1)
+        scheduler.enqueue()
+        with pytest.raises(SchedulerBusyError):
+            scheduler.enqueue(SPECULATIVE, lambda: None)
+
+    asyncio.run(run())
+
+
+def test_interactive_request_preempts_speculative_run():
+    async def run():
+        scheduler = AgentScheduler(max_concurrency=1)
+        preempted = []
+        speculative = scheduler.enqueue(SPECULATIVE, lambda: preempted.append(True))
+        interactive = scheduler.enqueue(INTERACTIVE)
+        waiting_position = interactive.position
+        speculative.release()  # what the cancelled run does on its way out
+        return preempted, waiting_position, interactive.granted, scheduler.stats()
+
+    preempted, waiting_position, granted, stats = asyncio.run(run())
+    assert preempted == [True]
+    assert waiting_position == 1 and granted
+    assert stats["preempted"] == 1
+
+
+def test_promoted_run_is_not_preempted():
+    async def run():
+        scheduler = AgentScheduler(max_concurrency=1, max_queue=1)
+        preempted = []
+        handle = RunHandle(SPECULATIVE)
+        handle.ticket = scheduler.enqueue(SPECULATIVE, lambda: preempted.append(True))
+        handle.promote()
+        waiting = scheduler.enqueue(INTERACTIVE)
+        return preempted, handle.ticket.priority, waiting.position
+
+    preempted, priority, position = asyncio.run(run())
+    assert preempted == [] and priority == INTERACTIVE and position == 1
+
+
+def test_preempted_speculative_agent_run_is_cancelled(monkeypatch):
+    class SlowProvider(agent.AgentProvider):
+        async def stream(self, full_prompt):
+            yield "delta", {"text": "partial"}
+            await asyncio.sleep(10)
+            yield "done", {"replacement": "never"}
+
+    scheduler = AgentScheduler(max_concurrency=1)
+    monkeypatch.setattr(agent, "agent_scheduler", scheduler)
+    monkeypatch.setattr(agent, "agent_provider", SlowProvider())
+
+    async def speculative_run(events: list):
+        async for event in agent._agent_events("prompt", RunHandle(SPECULATIVE)):
+            events.append(event)
+
+    async def run():
+        events = []
+        task = asyncio.create_task(speculative_run(events))
+        await asyncio.sleep(0.05)
+        ticket = scheduler.enqueue(INTERACTIVE)
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0)
+        return events, ticket.granted, scheduler.stats()
+
+    events, granted, stats = asyncio.run(run())
+    assert events == [("delta", {"text": "partial"})]
+    assert granted and stats["preempted"] == 1 and stats["running"] == 1
+
+
+def test_deadline_covers_a_stalled_provider(monkeypatch):
+    class StalledProvider(agent.AgentProvider):
+        async def stream(self, full_prompt):
+            await asyncio.sleep(10)
+            yield "done", {"replacement": "never"}
+
+    scheduler = AgentScheduler(max_concurrency=1)
+    monkeypatch.setattr(agent, "agent_scheduler", scheduler)
+    monkeypatch.setattr(agent, "agent_provider", StalledProvider())
+    monkeypatch.setattr(agent, "DEADLINE_SECONDS", 0.1)
+
+    async def run():
+        return [event async for event in agent._agent_events("prompt")], scheduler.stats()
+
+    events, stats = asyncio.run(run())
+    assert events == [("error", {"error": "Agent timed out after 0s"})]
+    assert stats["running"] == 0 and stats["completed"] == 1
+
+
+def test_deadline_includes_queue_wait(monkeypatch):
+    scheduler = AgentScheduler(max_concurrency=1)
+    monkeypatch.setattr(agent, "agent_scheduler", scheduler)
+    monkeypatch.setattr(agent, "DEADLINE_SECONDS", 0.1)
+
+    async def run():
+        scheduler.enqueue()  # holds the only slot for the whole test
+        events = [event async for event in agent._agent_events("prompt")]
+        return events, scheduler.stats()
+
+    events, stats = asyncio.run(run())
+    assert events[0] == ("queued", {"position": 1})
+    assert events[-1][0] == "error" and "timed out" in events[-1][1]["error"]
+    assert stats["queued"] == 0 and stats["running"] == 1
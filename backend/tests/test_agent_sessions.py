@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from app.services import agent
+from app.services.agent import AgentSession, ContentStore, PendingEdit
+
+CHAPTER = "# One\n\nSome chapter text.\n"
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = ContentStore()
+    monkeypatch.setattr(agent, "content_store", store)
+    return store
+
+
+def _edit(content: str = CHAPTER) -> PendingEdit:
+    return PendingEdit(agent.content_store.put(content), 7, 11, "Different", ["shorter"])
+
+
+def test_sessions_share_chapter_content(store):
+    sessions = AgentSession()
+    sessions.store_pending("a", _edit())
+    sessions.store_pending("b", _edit())
+    assert store.stats()["contents"] == 1
+    assert sessions.get_pending("a").original_text == "Some"
+
+    sessions.clear_pending("a")
+    assert store.stats()["contents"] == 1
+    sessions.clear_pending("b")
+    assert store.stats() == {"contents": 0, "contentBytes": 0}
+
+
+def test_replacing_a_session_releases_its_content(store):
+    sessions = AgentSession()
+    sessions.store_pending("a", _edit())
+    sessions.store_pending("a", _edit(CHAPTER + "More.\n"))
+    assert sessions.stats()["sessions"] == 1
+    assert store.stats()["contents"] == 1
+
+
+def test_sessions_expire_after_ttl(store):
+    sessions = AgentSession(ttl=60)
+    sessions.store_pending("old", _edit())
+    sessions.store_pending("new", _edit(CHAPTER + "New.\n"))
+    sessions.pending_edits["old"].last_used = time.monotonic() - 61
+
+    assert sessions.get_pending("old") is None
+    assert sessions.get_pending("new") is not None
+    assert store.stats()["contents"] == 1
+
+
+def test_least_recently_used_session_is_evicted(store):
+    sessions = AgentSession(max_sessions=2)
+    sessions.store_pending("a", _edit())
+    sessions.store_pending("b", _edit())
+    sessions.get_pending("a")  # b is now the least recently used
+    sessions.store_pending("c", _edit())
+
+    assert list(sessions.pending_edits) == ["a", "c"]
+    assert sessions.get_pending("b") is None
@@ -0,0 +1,39 @@
+import pytest
+
+from app.services import storage
+from app.services.render import render_cache
+
+
+def test_crlf_chapter_hashes_agree(data_dir):
+    storage.create_book("Book")
+    ch_file = data_dir / "book" / "chapters" / "one.md"
+    ch_file.write_bytes(b"# One\r\n\r\nFirst line.\r\n")
+
+    chapter = storage.get_chapter("book", "one")
+    assert chapter["content"] == "# One\n\nFirst line.\n"
+    # The revalidation hash (from the index) matches the ETag a full read sets.
+    assert storage.get_chapter_hash("book", "one") == chapter["contentHash"]
+
+    storage.get_rendered_chapter("book", "one")
+    assert chapter["contentHash"] in render_cache._entries
+
+    start = chapter["content"].index("First")
+    result = storage.patch_chapter("book", "one", chapter["contentHash"], [{"start": start, "end": start + 5, "text": "Only"}])
+    assert result["baseHash"] == chapter["contentHash"]
+    assert ch_file.read_bytes() == b"# One\n\nOnly line.\n"
+    assert storage.get_chapter("book", "one")["contentHash"] == result["contentHash"]
+    # The old rendering was evicted on save.
+    assert chapter["contentHash"] not in render_cache._entries
+
+
+def test_crlf_rebase_conflict_reports_the_byte_hash(data_dir):
+    storage.create_book("Book")
+    ch_file = data_dir / "book" / "chapters" / "one.md"
+    ch_file.write_bytes(b"# One\r\n\r\nFirst line.\r\n")
+    current = storage.get_chapter("book", "one")
+
+    base = "# One\n\nFirst draft.\n"
+    start = base.index("draft")
+    with pytest.raises(storage.ChapterConflictError) as err:
+        storage.patch_chapter("book", "one", "stale", [{"start": start, "end": start + 5, "text": "copy"}], base_content=base)
+    assert err.value.current_hash == current["contentHash"]
@@ -0,0 +1,72 @@
+import io
+import zipfile
+
+from PIL import Image
+
+from app.services import epub, images, storage
+
+
+def test_only_embedded_images_are_referenced(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "EPUB_CACHE_DIR", tmp_path / "epub")
+    storage.create_book("Book")
+    images_dir = images.get_images_dir("book")
+    Image.new("RGB", (1600, 800)).save(images_dir / "good.jpg", format="JPEG")
+    (images_dir / "broken.jpg").write_bytes(b"not an image")
+    storage.save_chapter("book", "one", (
+        "# One\n\n"
+        "![good](/api/books/book/images/good.jpg)\n\n"
+        "![broken](/api/books/book/images/broken.jpg)\n\n"
+        "![missing](/api/books/book/images/missing.jpg)\n"
+    ))
+
+    with epub.build_epub("book") as output, zipfile.ZipFile(output) as zf:
+        names = zf.namelist()
+        chapter = zf.read("OEBPS/text/ch001.xhtml").decode()
+        opf = zf.read("OEBPS/content.opf").decode()
+
+    assert "OEBPS/images/good.jpg" in names
+    assert not any(name.endswith(("broken.jpg", "missing.jpg")) for name in names)
+    assert 'src="../images/good.jpg"' in chapter
+    assert "broken" not in chapter and "missing" not in chapter
+    assert "/api/books/" not in chapter
+    assert 'href="images/good.jpg"' in opf and "broken" not in opf
+
+
+def test_same_stem_images_stay_distinct(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "EPUB_CACHE_DIR", tmp_path / "epub")
+    storage.create_book("Book")
+    images_dir = images.get_images_dir("book")
+    Image.new("RGB", (40, 20), "red").save(images_dir / "photo.png", format="PNG")
+    Image.new("RGB", (40, 20), "blue").save(images_dir / "photo.jpg", format="JPEG")
+    storage.save_chapter("book", "one", (
+        "# One\n\n"
+        "![png](/api/books/book/images/photo.png)\n\n"
+        "![jpg](/api/books/book/images/photo.jpg)\n"
+    ))
+
+    with epub.build_epub("book") as output, zipfile.ZipFile(output) as zf:
+        names = zf.namelist()
+        chapter = zf.read("OEBPS/text/ch001.xhtml").decode()
+        png = zf.read("OEBPS/images/photo.png.jpg")
+        jpg = zf.read("OEBPS/images/photo.jpg")
+
+    assert "OEBPS/images/photo.png.jpg" in names and "OEBPS/images/photo.jpg" in names
+    assert 'src="../images/photo.png.jpg"' in chapter and 'src="../images/photo.jpg"' in chapter
+    assert png != jpg
+
+
+def test_downsized_image_cache_follows_the_source(data_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(epub, "EPUB_CACHE_DIR", tmp_path / "epub")
+    for slug in ("a", "b"):
+        (data_dir / slug).mkdir()
+    Image.new("RGB", (40, 20), "red").save(data_dir / "a" / "pic.jpg", format="JPEG")
+    Image.new("RGB", (80, 20), "blue").save(data_dir / "b" / "pic.jpg", format="JPEG")
+
+    first = epub._downsized_image("a", data_dir / "a" / "pic.jpg")
+    other_book = epub._downsized_image("b", data_dir / "b" / "pic.jpg")
+    assert other_book != first
+
+    Image.new("RGB", (60, 30), "green").save(data_dir / "a" / "pic.jpg", format="JPEG")
+    replaced = epub._downsized_image("a", data_dir / "a" / "pic.jpg")
+    with Image.open(io.BytesIO(replaced)) as img:
+        assert img.size == (60, 30)
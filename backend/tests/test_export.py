@@ -0,0 +1,20 @@
+import io
+import zipfile
+
+from PIL import Image
+
+from app.services import export, images, storage
+
+
+def test_zip_export_leaves_out_image_variants(data_dir):
+    storage.create_book("Book")
+    storage.save_chapter("book", "one", "# One\n\n![x](/api/books/book/images/photo.jpg)\n")
+    images_dir = images.get_images_dir("book")
+    Image.new("RGB", (1000, 500)).save(images_dir / "photo.jpg", format="JPEG")
+    images.write_variants(str(images_dir / "photo.jpg"))
+    (images_dir / "icon.webp").write_bytes(b"uploaded before uploads were converted")
+    (images_dir / ".photo.novariants").touch()
+
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(export.export_zip("book"))))
+    names = [name for name in archive.namelist() if name.startswith("images/")]
+    assert names == ["images/icon.webp", "images/photo.jpg"]
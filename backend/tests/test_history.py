@@ -0,0 +1,12 @@
+from app.services.history import _CatFileBatch
+
+
+def test_spec_with_newline_is_rejected_and_batch_stays_in_sync():
+    batch = _CatFileBatch()
+    try:
+        head = batch.read("HEAD")
+        assert head is not None and head[1] == "commit"
+        assert batch.read("HEAD\nHEAD^{tree}") is None
+        assert batch.read("HEAD") == head
+    finally:
+        batch.close()
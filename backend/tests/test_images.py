@@ -0,0 +1,125 @@
+import asyncio
+import io
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+from starlette import formparsers
+from starlette.requests import Request
+
+from app.routers import images as images_router
+from app.services import images
+from app.services.images import ImageProcessor, is_variant, missing_variants, resolve_variant
+
+
+def _jpeg(width: int, height: int) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 120, 40)).save(out, format="JPEG")
+    return out.getvalue()
+
+
+def _store(data_dir, name: str, data: bytes):
+    images_dir = data_dir / "book" / "images"
+    images_dir.mkdir(parents=True, exist_ok=True)
+    path = images_dir / name
+    path.write_bytes(data)
+    return path
+
+
+def test_write_variants_and_resolve(data_dir):
+    primary = _store(data_dir, "photo.jpg", _jpeg(1000, 500))
+    assert resolve_variant(primary.parent, "photo.jpg", 400, "webp") == (primary, False)
+
+    written = images.write_variants(str(primary))
+    assert written == ["photo-400.jpg", "photo-400.webp", "photo-800.jpg", "photo-800.webp", "photo.webp"]
+    assert resolve_variant(primary.parent, "photo.jpg", 300, "webp") == (primary.parent / "photo-400.webp", True)
+    assert resolve_variant(primary.parent, "photo.jpg", 900, "jpeg") == (primary, True)
+    assert resolve_variant(primary.parent, "photo.jpg", None, "webp") == (primary.parent / "photo.webp", True)
+    assert all(is_variant(primary.parent / name) for name in written)
+    assert not is_variant(primary)
+
+
+def test_missing_variants_lists_only_unprocessed_primaries(data_dir):
+    done = _store(data_dir, "done.jpg", _jpeg(500, 300))
+    images.write_variants(str(done))
+    todo = _store(data_dir, "todo.jpg", _jpeg(500, 300))
+    failed = _store(data_dir, "failed.jpg", _jpeg(500, 300))
+    (failed.parent / ".failed.novariants").touch()
+    assert missing_variants(data_dir) == [todo]
+
+
+def test_failed_variants_resolve_as_final_primary(data_dir):
+    broken = _store(data_dir, "broken.jpg", b"not a jpeg")
+
+    async def run():
+        processor = ImageProcessor(workers=1)
+        try:
+            processor.start_backfill()
+            await processor._backfill_task
+            await processor._variant_task
+            return processor.stats()
+        finally:
+            processor.close()
+
+    stats = asyncio.run(run())
+    assert stats["variantFailures"] == 1
+    assert (broken.parent / ".broken.novariants").exists()
+    assert resolve_variant(broken.parent, "broken.jpg", 400, "webp") == (broken, True)
+    assert missing_variants(data_dir) == []
+
+    cache = images.ImageFileCache()
+    cache.lookup("book", "broken.jpg", 400, "webp")
+    assert cache.lookup("book", "broken.jpg", 400, "webp")[2] is True
+    assert cache.stats()["hits"] == 1
+
+
+def test_srcset_lists_only_variants_narrower_than_the_primary(data_dir):
+    _store(data_dir, "small.jpg", _jpeg(600, 400))
+    _store(data_dir, "large.jpg", _jpeg(1200, 800))
+    small, large = "/api/books/book/images/small.jpg", "/api/books/book/images/large.jpg"
+
+    assert images.srcset_for(small) == f"{small}?w=400 400w, {small} 600w"
+    assert images.srcset_for(large) == f"{large}?w=400 400w, {large}?w=800 800w, {large} 1200w"
+    assert images.srcset_for("/api/books/book/images/missing.jpg") is None
+    assert images.srcset_for("https://example.com/photo.jpg") is None
+
+
+def test_rendered_images_get_their_real_srcset(data_dir):
+    from app.services.render import render_markdown
+
+    _store(data_dir, "small.jpg", _jpeg(300, 200))
+    html = render_markdown("![x](/api/books/book/images/small.jpg)", responsive_images=True)
+    assert 'srcset="/api/books/book/images/small.jpg 300w"' in html
+
+
+def test_oversized_upload_closes_partial_files(monkeypatch):
+    opened = []
+
+    class RecordingFile(tempfile.SpooledTemporaryFile):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    monkeypatch.setattr(formparsers, "SpooledTemporaryFile", RecordingFile)
+    monkeypatch.setattr(images_router, "MULTIPART_OVERHEAD", 0)
+    monkeypatch.setattr(images_router, "MAX_IMAGE_SIZE", 4096)
+
+    # Chunked (no Content-Length), so the limit trips mid-parse.
+    head = (b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.jpg\"\r\n"
+            b"Content-Type: image/jpeg\r\n\r\n")
+    chunks = [head] + [b"x" * 1024] * 8
+    messages = [{"type": "http.request", "body": c, "more_body": True} for c in chunks]
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    request = Request({
+        "type": "http", "method": "POST", "path": "/", "query_string": b"",
+        "headers": [(b"content-type", b"multipart/form-data; boundary=b")],
+    }, receive)
+
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(images_router._receive_upload(request))
+    assert err.value.status_code == 413
+    assert opened and all(f.closed for f in opened)
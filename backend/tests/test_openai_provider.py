@@ -0,0 +1,122 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.services.agent import OpenAICompatibleProvider
+from bench import stub_llm_server
+
+
+def _sse_body(*texts: str) -> bytes:
+    lines = [
+        "data: " + json.dumps({"choices": [{"delta": {"content": text}}]})
+        for text in texts
+    ]
+    lines.append(": keep-alive comment")
+    lines.append("data: [DONE]")
+    return ("\n\n".join(lines) + "\n\n").encode()
+
+
+def _provider(handler) -> OpenAICompatibleProvider:
+    return OpenAICompatibleProvider(
+        "https://llm.test/v1/", "secret", "test-model", transport=httpx.MockTransport(handler),
+    )
+
+
+async def _events(provider: OpenAICompatibleProvider, prompt: str) -> list:
+    return [event async for event in provider.stream(prompt)]
+
+
+def test_streams_deltas_then_done():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, content=_sse_body("Hello", ", ", "world. "),
+                              headers={"content-type": "text/event-stream"})
+
+    async def run():
+        provider = _provider(handler)
+        try:
+            return await _events(provider, "Edit this")
+        finally:
+            await provider.close()
+
+    events = asyncio.run(run())
+    assert events == [
+        ("delta", {"text": "Hello"}),
+        ("delta", {"text": ", "}),
+        ("delta", {"text": "world. "}),
+        ("done", {"replacement": "Hello, world."}),
+    ]
+    [request] = requests
+    assert request.url == "https://llm.test/v1/chat/completions"
+    assert request.headers["authorization"] == "Bearer secret"
+    assert json.loads(request.content) == {
+        "model": "test-model",
+        "stream": True,
+        "messages": [{"role": "user", "content": "Edit this"}],
+    }
+
+
+def test_error_status_raises_with_detail():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(429, text="rate limited")
+
+    async def run():
+        provider = _provider(handler)
+        try:
+            await _events(provider, "Edit this")
+        finally:
+            await provider.close()
+
+    with pytest.raises(RuntimeError, match="429: rate limited"):
+        asyncio.run(run())
+
+
+def test_requests_share_one_client():
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, content=_sse_body("ok"))
+
+    async def run():
+        provider = _provider(handler)
+        try:
+            first = await _events(provider, "one")
+            client = provider._client
+            second = await _events(provider, "two")
+            return first, second, client is provider._client
+        finally:
+            await provider.close()
+
+    first, second, same_client = asyncio.run(run())
+    assert first == second == [("delta", {"text": "ok"}), ("done", {"replacement": "ok"})]
+    assert same_client
+
+
+def test_streams_from_the_stub_server_over_one_connection(monkeypatch):
+    # A real local SSE server: chunked framing and keep-alive, no mock transport.
+    monkeypatch.setattr(stub_llm_server.StubHandler, "connections", {})
+    server = stub_llm_server.serve(0, 0)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    async def run():
+        provider = OpenAICompatibleProvider(base_url, "", "stub")
+        try:
+            return [await _events(provider, f'Edit this text: "hello stub {i}"') for i in range(3)]
+        finally:
+            await provider.close()
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+    for i, events in enumerate(results):
+        assert events == [
+            ("delta", {"text": "HELLO "}),
+            ("delta", {"text": "STUB "}),
+            ("delta", {"text": str(i)}),
+            ("done", {"replacement": f"HELLO STUB {i}"}),
+        ]
+    assert list(stub_llm_server.StubHandler.connections.values()) == [3]
@@ -0,0 +1,152 @@
+import pytest
+
+from app.services import storage
+from app.services.metadata_index import content_hash
+from app.services.storage import ChapterConflictError, apply_text_ops, rebase_text_ops
+
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3
+
+
+def _op(base: str, text: str, replacement: str) -> dict:
+    start = base.index(text)
+    return {"start": start, "end": start + len(text), "text": replacement}
+
+
+def test_op_before_change_is_kept():
+    base = f"# T\n\nFirst paragraph.\n\n{FILLER}\n\nLast paragraph.\n"
+    current = base.replace("Last paragraph.", "Last paragraph, edited.")
+    op = _op(base, "First paragraph.", "Opening.")
+    assert rebase_text_ops(base, current, [op]) == [op]
+
+
+def test_op_after_change_is_shifted():
+    base = f"# T\n\nFirst paragraph.\n\n{FILLER}\n\nLast paragraph.\n"
+    current = base.replace("First paragraph.", "The first paragraph, now longer.")
+    [rebased] = rebase_text_ops(base, current, [_op(base, "Last paragraph.", "End.")])
+    assert apply_text_ops(current, [rebased]) == current.replace("Last paragraph.", "End.")
+
+
+def test_op_between_two_edits_is_anchored():
+    base = f"# T\n\nFirst.\n\n{FILLER}\n\nTarget sentence.\n\n{FILLER}\n\nLast.\n"
+    current = base.replace("First.", "First, edited.").replace("Last.", "Last, edited.")
+    [rebased] = rebase_text_ops(base, current, [_op(base, "Target sentence.", "Changed.")])
+    assert apply_text_ops(current, [rebased]) == current.replace("Target sentence.", "Changed.")
+
+
+def test_edited_selection_is_not_moved_to_a_duplicate():
+    repeated = "The same sentence appears twice."
+    base = f"# T\n\n{repeated}\n\n{FILLER}\n\n{repeated}\n"
+    op = _op(base, repeated, "Rewritten.")  # the first occurrence
+    current = base.replace(repeated, "The same sentence, edited by hand.", 1)
+    with pytest.raises(ChapterConflictError):
+        rebase_text_ops(base, current, [op])
+
+
+def test_duplicate_line_between_edits_maps_exactly():
+    repeated = "Repeated line."
+    base = f"# T\n\nIntro.\n{repeated}\n{repeated}\nOutro.\n"
+    op = _op(base, repeated, "Once.")
+    current = base.replace("Intro.", "Intro, edited.").replace("Outro.", "Outro, edited.")
+    [rebased] = rebase_text_ops(base, current, [op])
+    assert apply_text_ops(current, [rebased]) == current.replace(repeated, "Once.", 1)
+
+
+def test_edits_next_to_selection_on_the_same_line_are_not_conflicts():
+    base = f"# T\n\n{FILLER}\n\nBefore words. Agent target. After words.\n\n{FILLER}\n"
+    op = _op(base, "Agent target.", "Agent version.")
+    current = base.replace("Before words.", "Before, edited.").replace("After words.", "After, edited.")
+    [rebased] = rebase_text_ops(base, current, [op])
+    assert apply_text_ops(current, [rebased]) == current.replace("Agent target.", "Agent version.")
+
+
+def test_repeat_on_the_changed_line_is_chosen_by_context():
+    base = f"# T\n\n{FILLER}\n\nKeep the word here.\n"
+    op = _op(base, "word", "term")
+    current = base.replace("Keep the word here.", "Keep the word here, and the word there.")
+    [rebased] = rebase_text_ops(base, current, [op])
+    assert apply_text_ops(current, [rebased]) == current.replace("word", "term", 1)
+
+
+def test_ambiguous_repeat_conflicts():
+    base = "a word b\n"
+    op = _op(base, "word", "term")
+    with pytest.raises(ChapterConflictError):
+        rebase_text_ops(base, "c word word d\n", [op])
+
+
+def test_overlapping_concurrent_edit_conflicts():
+    base = f"# T\n\n{FILLER}\n\nThe agent rewrites this sentence.\n\n{FILLER}\n"
+    op = _op(base, "The agent rewrites this sentence.", "Agent version.")
+    current = base.replace("rewrites this", "rewrote that")
+    with pytest.raises(ChapterConflictError):
+        rebase_text_ops(base, current, [op])
+
+
+def test_concurrent_edit_next_to_selection_is_kept():
+    base = f"# T\n\n{FILLER}\n\nAgent target. User target.\n\n{FILLER}\n"
+    op = _op(base, "Agent target.", "Agent version.")
+    current = base.replace("User target.", "User version.")
+    [rebased] = rebase_text_ops(base, current, [op])
+    assert apply_text_ops(current, [rebased]) == current.replace("Agent target.", "Agent version.")
+
+
+def test_patch_chapter_rebases_onto_current_text(data_dir):
+    base = f"# Chapter\n\nFirst.\n\n{FILLER}\n\nTarget sentence.\n"
+    storage.create_book("Book")
+    storage.save_chapter("book", "chapter", base)
+    base_hash = storage.get_chapter_hash("book", "chapter")
+    current = base.replace("First.", "First, edited.")
+    storage.save_chapter("book", "chapter", current)
+
+    result = storage.patch_chapter(
+        "book", "chapter", base_hash, [_op(base, "Target sentence.", "Changed.")], base_content=base,
+    )
+    assert result["baseHash"] == content_hash(current)
+    assert storage.get_chapter("book", "chapter")["content"] == current.replace("Target sentence.", "Changed.")
+
+
+def test_patch_chapter_conflict_keeps_chapter(data_dir):
+    base = f"# Chapter\n\n{FILLER}\n\nTarget sentence.\n"
+    storage.create_book("Book")
+    storage.save_chapter("book", "chapter", base)
+    base_hash = storage.get_chapter_hash("book", "chapter")
+    current = base.replace("Target sentence.", "Target, edited.")
+    storage.save_chapter("book", "chapter", current)
+
+    with pytest.raises(ChapterConflictError):
+        storage.patch_chapter(
+            "book", "chapter", base_hash, [_op(base, "Target sentence.", "Changed.")], base_content=base,
+        )
+    assert storage.get_chapter("book", "chapter")["content"] == current
+
+
+def test_approve_edit_patches_off_the_event_loop(data_dir, monkeypatch):
+    import asyncio
+    import threading
+
+    from app.services import agent
+
+    base = f"# Chapter\n\n{FILLER}\n\nTarget sentence.\n"
+    storage.create_book("Book")
+    storage.save_chapter("book", "chapter", base)
+    sessions = agent.AgentSession()
+    monkeypatch.setattr(agent, "agent_sessions", sessions)
+    op = _op(base, "Target sentence.", "Changed.")
+    sessions.store_pending("s1", agent.PendingEdit(
+        agent.content_store.put(base), op["start"], op["end"], op["text"], ["Shorter"],
+    ))
+
+    threads = []
+    patch_chapter = storage.patch_chapter
+
+    def recording_patch(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return patch_chapter(*args, **kwargs)
+
+    monkeypatch.setattr(storage, "patch_chapter", recording_patch)
+    result = asyncio.run(agent.approve_edit("s1", "book", "chapter"))
+
+    assert threads and threads[0] is not threading.main_thread()
+    assert result["ops"] == [op]
+    assert sessions.get_pending("s1") is None
+    assert storage.get_chapter("book", "chapter")["content"] == base.replace("Target sentence.", "Changed.")
@@ -0,0 +1,105 @@
+import time
+
+from app.services import storage
+from app.services.search import SearchIndex, tokenize
+
+
+def _chapter(title: str, body: str) -> str:
+    return f"# {title}\n\n{body}\n"
+
+
+def test_save_queues_indexing_until_search(data_dir):
+    storage.create_book("Book")
+    storage.search_index.delay = 60.0
+    storage.save_chapter("book", "one", _chapter("One", "A lighthouse keeper."))
+
+    # Nothing is written on the save path; the search indexes what is queued.
+    assert storage.search_index._pending
+    results = storage.search_index.search("lighthouse")["results"]
+    assert [(r["bookSlug"], r["chapterSlug"]) for r in results] == [("book", "one")]
+    assert not storage.search_index._pending
+
+
+def test_background_indexer_debounces_saves(data_dir, monkeypatch):
+    storage.create_book("Book")
+    storage.search_index.delay = 0.05
+    indexed = []
+    original = SearchIndex.index_chapter
+
+    def index_chapter(self, book_slug, chapter_slug, content, mtime, size):
+        indexed.append(content)
+        original(self, book_slug, chapter_slug, content, mtime, size)
+
+    monkeypatch.setattr(SearchIndex, "index_chapter", index_chapter)
+    for i in range(5):
+        storage.save_chapter("book", "one", _chapter("One", f"Draft {i}."))
+
+    deadline = time.monotonic() + 5
+    while storage.search_index._pending and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with storage.search_index._lock:
+        pass  # wait for the batch in progress
+    assert indexed == [_chapter("One", "Draft 4.")]
+
+
+def test_unchanged_file_is_not_reindexed(data_dir, monkeypatch):
+    storage.create_book("Book")
+    storage.save_chapter("book", "one", _chapter("One", "Text."))
+    storage.search_index.flush()
+
+    calls = []
+    monkeypatch.setattr(SearchIndex, "index_chapter", lambda self, *args: calls.append(args))
+    storage.search_index.schedule_chapter("book", "one")
+    storage.search_index.flush()
+    assert calls == []
+
+
+def test_deleted_and_renamed_chapters_leave_the_index(data_dir):
+    storage.create_book("Book")
+    storage.save_chapter("book", "one", _chapter("One", "Zebra crossing."))
+    storage.save_chapter("book", "two", _chapter("Two", "Giraffe neck."))
+    storage.search_index.flush()
+
+    storage.delete_chapter("book", "one")
+    assert storage.search_index.search("zebra")["results"] == []
+
+    storage.save_chapter("book", "two", _chapter("Renamed", "Giraffe neck."))
+    results = storage.search_index.search("giraffe")["results"]
+    assert [r["chapterSlug"] for r in results] == ["renamed"]
+
+
+def test_tokenize_splits_cjk_into_bigrams():
+    assert tokenize("Hello 中文段落") == "hello 中文 文段 段落 落"
+
+
+def test_link_and_image_urls_are_not_indexed(data_dir):
+    storage.create_book("Book")
+    storage.save_chapter("book", "one", _chapter("One", (
+        "See the [harbour map](https://example.com/harbour.png) and\n"
+        "![a quiet pier](/api/books/book/images/0f3a9c.jpg).\n"
+        "<https://example.org/tides>\n\n"
+        "[ref]: https://example.net/almanac\n"
+    )))
+    search = storage.search_index.search
+    assert search("harbour")["results"] and search("pier")["results"]
+    for term in ("example", "https", "png", "0f3a9c", "images", "tides", "almanac"):
+        assert search(term)["results"] == [], term
+
+
+def test_index_from_an_older_version_is_rebuilt(data_dir, tmp_path):
+    storage.create_book("Book")
+    storage.save_chapter("book", "one", _chapter("One", "[old](https://example.com)"))
+    storage.search_index.flush()
+    db = storage.search_index._db()
+    # What an older version stored: the URL's words among the terms.
+    db.execute("UPDATE sections_fts SET terms = 'old https example com'")
+    db.execute("PRAGMA user_version = 1")
+    db.commit()
+    storage.search_index.close()
+
+    index = SearchIndex(data_dir, tmp_path / "search.sqlite3")
+    try:
+        assert index.search("example")["results"] == []
+        assert index.search("old")["results"]
+    finally:
+        index.close()
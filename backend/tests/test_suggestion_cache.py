@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from app.services.suggestion_cache import SuggestionCache
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _factory(calls: list, events: list, delay: float = 0.0):
+    def factory():
+        async def gen():
+            calls.append(1)
+            for event, replacement in events:
+                await asyncio.sleep(delay)
+                yield event, replacement
+        return gen()
+    return factory
+
+
+async def _collect(cache: SuggestionCache, key: str, factory) -> list:
+    return [item async for item in cache.stream(key, factory)]
+
+
+ANSWER = [
+    (_sse("delta", {"text": "Hello"}), None),
+    (_sse("done", {"replacement": "Hello"}), "Hello"),
+]
+
+
+def test_finished_suggestion_is_replayed_from_cache():
+    async def run():
+        cache, calls = SuggestionCache(), []
+        first = await _collect(cache, "k", _factory(calls, ANSWER))
+        second = await _collect(cache, "k", _factory(calls, ANSWER))
+        return calls, first, second, cache.stats()
+
+    calls, first, second, stats = asyncio.run(run())
+    assert len(calls) == 1
+    assert first == ANSWER
+    assert second[0] == ANSWER[0] and second[-1][1] == "Hello"
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_suggestion_with_an_error_is_not_cached():
+    # What a chapter edit with a failed section produces: an error, then done
+    # with the stitched text (the failed section unchanged).
+    events = [
+        (_sse("delta", {"text": "Edited."}), None),
+        (_sse("error", {"error": "1 of 2 sections could not be edited and were left unchanged"}), None),
+        (_sse("done", {"replacement": "Edited. Original."}), "Edited. Original."),
+    ]
+
+    async def run():
+        cache, calls = SuggestionCache(), []
+        first = await _collect(cache, "k", _factory(calls, events))
+        second = await _collect(cache, "k", _factory(calls, events))
+        return calls, first, second, cache.stats()
+
+    calls, first, second, stats = asyncio.run(run())
+    assert len(calls) == 2
+    assert first == second == events
+    assert stats["entries"] == 0 and stats["hits"] == 0
+
+
+def test_identical_requests_share_one_generation():
+    async def run():
+        cache, calls = SuggestionCache(), []
+        factory = _factory(calls, ANSWER, delay=0.01)
+        results = await asyncio.gather(*(_collect(cache, "k", factory) for _ in range(3)))
+        return calls, results, cache.stats()
+
+    calls, results, stats = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(result == ANSWER for result in results)
+    assert stats["joins"] == 2 and stats["inFlight"] == 0
+
+
+def test_generation_is_cancelled_when_last_listener_leaves():
+    async def run():
+        cache, calls = SuggestionCache(), []
+        stream = cache.stream("k", _factory(calls, ANSWER * 50, delay=0.01))
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.05)
+        return cache.stats()
+
+    stats = asyncio.run(run())
+    assert stats["inFlight"] == 0 and stats["entries"] == 0
@@ -11,13 +11,16 @@ import { Reader } from './components/Reader';
 import { AgentPanel } from './components/AgentPanel';
 import { LoginPage } from './components/LoginPage';
 import {
+  cancelPrefetch,
   createChapter,
   fetchXiaohongshuStatus,
   isAuthenticated,
   logout,
+  prefetchSuggestions,
   publishToXiaohongshu,
   saveChapter,
   uploadImage,
+  type ApproveEditResult,
   type XiaohongshuPublishStatus,
 } from './lib/api';
 
@@ -43,21 +46,25 @@ export default function App() {
   const [isPublishingXhs, setIsPublishingXhs] = useState(false);
   const [xhsStatus, setXhsStatus] = useState<XiaohongshuPublishStatus | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const agentBaseRef = useRef<string | null>(null);  // Unsaved editor text a suggestion was made against
 
   // Data hooks
   const { books, loading: booksLoading, create: createBook, error: booksError } = useBooks();
   const { book, loading: bookLoading, reload: reloadBook } = useBook(selectedBookSlug);
   const { 
     content, 
+    contentHash,
     loading: chapterLoading, 
     error: chapterError,
     reload: reloadChapter,
+    applyEdit: applyChapterEdit,
   } = useChapter({ bookSlug: selectedBookSlug, chapterSlug: selectedChapterSlug });
 
-  // Agent hook - reload chapter after edit is applied
+  // Agent hook - patch the chapter copy after an edit is applied
   const { 
     isStreaming, 
     streamedText, 
+    queuePosition,
     sessionId,
     error: agentError, 
     getSuggestion, 
@@ -68,7 +75,13 @@ export default function App() {
   } = useAgent({
     bookSlug: selectedBookSlug,
     chapterSlug: selectedChapterSlug,
-    onEditApplied: reloadChapter,
+    onEditApplied: useCallback((result: ApproveEditResult) => {
+      if (result.renamed && result.chapterSlug !== selectedChapterSlug) {
+        setSelectedChapterSlug(result.chapterSlug);
+      } else if (!applyChapterEdit(result)) {
+        reloadChapter();
+      }
+    }, [selectedChapterSlug, applyChapterEdit, reloadChapter]),
     onSuggestionComplete: useCallback((suggestion: string) => {
       // Auto-apply suggestion to edited content as soon as it arrives
       if (selection) {
@@ -161,7 +174,8 @@ export default function App() {
     
     setIsSaving(true);
     try {
-      const result = await saveChapter(selectedBookSlug, selectedChapterSlug, editedContent);
+      const base = contentHash ? { content, hash: contentHash } : undefined;
+      const result = await saveChapter(selectedBookSlug, selectedChapterSlug, editedContent, base);
       const nextSlug = result.chapterSlug || selectedChapterSlug;
       const renamed = !!result.renamed && nextSlug !== selectedChapterSlug;
       setHasUnsavedChanges(false);
@@ -169,15 +183,11 @@ export default function App() {
         setSelectedChapterSlug(nextSlug);
       }
       
-      // Show success message
-      if (renamed && result.gitCommitted) {
-        setSaveMessage(`✓ Saved, renamed to ${nextSlug}, and pushed to git`);
-      } else if (renamed) {
-        setSaveMessage(`✓ Saved and renamed to ${nextSlug} (git commit failed)`);
-      } else if (result.gitCommitted) {
-        setSaveMessage('✓ Saved and pushed to git');
+      // Show success message (git commit/push happens in the background)
+      if (renamed) {
+        setSaveMessage(`✓ Saved and renamed to ${nextSlug}`);
       } else {
-        setSaveMessage('✓ Saved (git commit failed)');
+        setSaveMessage('✓ Saved');
       }
       
       // Clear message after 3 seconds
@@ -195,7 +205,7 @@ export default function App() {
     } finally {
       setIsSaving(false);
     }
-  }, [selectedBookSlug, selectedChapterSlug, editedContent, hasUnsavedChanges, isUploadingImage, reloadBook, reloadChapter, loadXhsStatus]);
+  }, [selectedBookSlug, selectedChapterSlug, editedContent, content, contentHash, hasUnsavedChanges, isUploadingImage, reloadBook, reloadChapter, loadXhsStatus]);
 
   const handleImageUpload = useCallback(async (event: React.ChangeEvent<HTMLInputElement>) => {
     const files = Array.from(event.target.files || []);
@@ -306,6 +316,13 @@ export default function App() {
     }
   }, [content, hasUnsavedChanges]);
 
+  // An approved agent edit can bring the saved copy level with the editor
+  useEffect(() => {
+    if (hasUnsavedChanges && content && editedContent === content) {
+      setHasUnsavedChanges(false);
+    }
+  }, [content, editedContent, hasUnsavedChanges]);
+
   useEffect(() => {
     loadXhsStatus();
   }, [loadXhsStatus]);
@@ -318,6 +335,26 @@ export default function App() {
     }
   }, []);
 
+  // Warm suggestions for the usual prompts while the user decides; the
+  // content sent must match what handleAgentSubmit will send.
+  useEffect(() => {
+    if (!selection || !selectedBookSlug || !selectedChapterSlug) return;
+    const timer = setTimeout(() => {
+      prefetchSuggestions({
+        bookSlug: selectedBookSlug,
+        chapterSlug: selectedChapterSlug,
+        selectionStart: selection.from,
+        selectionEnd: selection.to,
+        content: hasUnsavedChanges ? editedContent : undefined,
+      });
+    }, 400);
+    return () => {
+      clearTimeout(timer);
+      cancelPrefetch();
+    };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [selection, selectedBookSlug, selectedChapterSlug]);
+
   const handlePublishToXhs = useCallback(async () => {
     if (!selectedBookSlug || !selectedChapterSlug) return;
     if (hasUnsavedChanges) {
@@ -358,7 +395,8 @@ export default function App() {
     if (!selection) return;
     // If we have unsaved edits, use the edited content; otherwise backend will fetch saved content
     const currentContent = hasUnsavedChanges ? editedContent : undefined;
-    getSuggestion(selection.from, selection.to, prompt, 'anthropic', currentContent);
+    agentBaseRef.current = currentContent ?? null;
+    getSuggestion(selection.from, selection.to, prompt, currentContent);
   }, [selection, getSuggestion, hasUnsavedChanges, editedContent]);
 
   const handleAgentRevise = useCallback((prompt: string) => {
@@ -366,11 +404,35 @@ export default function App() {
   }, [reviseSuggestion]);
 
   const handleAgentAccept = useCallback(async () => {
-    // Suggestion already auto-applied, just close panel and clear state
+    // Suggestion is already in the editor; approving saves it on the server too.
+    // On failure (e.g. the passage changed) the panel stays open with the error.
+    if (sessionId && selectedBookSlug && selectedChapterSlug) {
+      // A suggestion made against unsaved text: save that text first, so the
+      // server applies the edit to exactly the version it was computed on.
+      const agentBase = agentBaseRef.current;
+      let renamed = false;
+      if (agentBase !== null && agentBase !== content) {
+        try {
+          const base = contentHash ? { content, hash: contentHash } : undefined;
+          const result = await saveChapter(selectedBookSlug, selectedChapterSlug, agentBase, base);
+          const nextSlug = result.chapterSlug || selectedChapterSlug;
+          renamed = !!result.renamed && nextSlug !== selectedChapterSlug;
+          if (renamed) setSelectedChapterSlug(nextSlug);
+        } catch (err) {
+          console.error('Save before approve failed:', err);
+          setSaveMessage('✗ Save failed');
+          setTimeout(() => setSaveMessage(null), 3000);
+          return;
+        }
+      }
+      // After a rename the suggestion simply stays in the editor as an unsaved change.
+      if (!renamed && !(await approve())) return;
+    }
+    agentBaseRef.current = null;
     setAgentPanelVisible(false);
     setSelection(null);
     discard();  // Clear agent state
-  }, [discard]);
+  }, [sessionId, selectedBookSlug, selectedChapterSlug, content, contentHash, approve, discard]);
 
   const handleAgentDiscard = useCallback(() => {
     discard();
@@ -539,8 +601,10 @@ export default function App() {
               </>
             ) : (
               <Reader
-                content={content}
                 onEditClick={handleToggleEditMode}
+                bookSlug={selectedBookSlug}
+                chapterSlug={selectedChapterSlug}
+                contentHash={contentHash}
               />
             )}
           </>
@@ -559,6 +623,7 @@ export default function App() {
         selectedText={selection?.text || ''}
         streamedText={streamedText}
         isStreaming={isStreaming}
+        queuePosition={queuePosition}
         canApprove={!!sessionId && !isStreaming}
         hasSession={!!sessionId}
         error={agentError}
@@ -9,6 +9,7 @@ interface AgentPanelProps {
   selectedText: string;
   streamedText: string;
   isStreaming: boolean;
+  queuePosition?: number | null;
   canApprove: boolean;
   hasSession: boolean;
   error: string | null;
@@ -24,6 +25,7 @@ export function AgentPanel({
   selectedText,
   streamedText,
   isStreaming,
+  queuePosition,
   canApprove,
   hasSession,
   error,
@@ -115,7 +117,7 @@ export function AgentPanel({
         {(streamedText || isStreaming) && (
           <div className="streamed-response">
             <label>AI suggestion:</label>
-            <p>{streamedText || '...'}</p>
+            <p>{streamedText || (queuePosition ? `Waiting in queue (#${queuePosition})...` : '...')}</p>
           </div>
         )}
 
@@ -1,61 +1,53 @@
-import ReactMarkdown from 'react-markdown';
-import remarkGfm from 'remark-gfm';
-import rehypeRaw from 'rehype-raw';
-import type { Components } from 'react-markdown';
+import { useCallback, useEffect, useState } from 'react';
+import { fetchRenderedChapter } from '../lib/api';
 
 interface ReaderProps {
-  content: string;
   onEditClick: () => void;
+  bookSlug?: string | null;
+  chapterSlug?: string | null;
+  contentHash?: string | null;
 }
 
-// Helper to extract text from react-markdown children
-function extractText(children: any): string {
-  if (typeof children === 'string') return children;
-  if (Array.isArray(children)) {
-    return children.map(extractText).join('');
-  }
-  if (children?.props?.children) {
-    return extractText(children.props.children);
-  }
-  return String(children || '');
-}
+const SKELETON_LINES = [92, 100, 96, 74, 0, 100, 88, 97, 61];
 
-// Helper to generate heading IDs
-function slugify(text: string): string {
-  return text
-    .toLowerCase()
-    .replace(/[^\w\u4e00-\u9fa5\s-]/g, '') // Preserve Chinese characters
-    .replace(/\s+/g, '-')
-    .replace(/-+/g, '-')
-    .trim();
-}
+export function Reader({ onEditClick, bookSlug, chapterSlug, contentHash }: ReaderProps) {
+  // Server-rendered, sanitized HTML (heading ids and image srcsets included).
+  // After a save the previous HTML stays up until the new version arrives.
+  const chapterKey = `${bookSlug}/${chapterSlug}`;
+  const [rendered, setRendered] = useState<{ key: string; html: string } | null>(null);
+  const [failed, setFailed] = useState(false);
+  const [attempt, setAttempt] = useState(0);
+
+  useEffect(() => {
+    if (!bookSlug || !chapterSlug || !contentHash) return;
+    let cancelled = false;
+    setFailed(false);
+    fetchRenderedChapter(bookSlug, chapterSlug)
+      .then((data) => { if (!cancelled) setRendered({ key: chapterKey, html: data.html }); })
+      .catch(() => { if (!cancelled) setFailed(true); });
+    return () => { cancelled = true; };
+  }, [bookSlug, chapterSlug, contentHash, chapterKey, attempt]);
 
-export function Reader({ content, onEditClick }: ReaderProps) {
-  // Custom components to add IDs to headings
-  const components: Components = {
-    h2: ({ children, ...props }) => {
-      const text = extractText(children);
-      const id = slugify(text);
-      return <h2 id={id} {...props}>{children}</h2>;
-    },
-    h3: ({ children, ...props }) => {
-      const text = extractText(children);
-      const id = slugify(text);
-      return <h3 id={id} {...props}>{children}</h3>;
-    },
-  };
+  const retry = useCallback(() => setAttempt((n) => n + 1), []);
+  const html = rendered?.key === chapterKey ? rendered.html : null;
 
   return (
     <div className="reader-container">
-      <div className="reader-content">
-        <ReactMarkdown
-          remarkPlugins={[remarkGfm]}
-          rehypePlugins={[rehypeRaw]}
-          components={components}
-        >
-          {content}
-        </ReactMarkdown>
-      </div>
+      {html !== null ? (
+        <div className="reader-content" dangerouslySetInnerHTML={{ __html: html }} />
+      ) : failed ? (
+        <div className="reader-content reader-error">
+          <p>Could not load this chapter.</p>
+          <button onClick={retry}>Retry</button>
+        </div>
+      ) : (
+        <div className="reader-content reader-skeleton" aria-busy="true" aria-label="Loading chapter">
+          <div className="skeleton-title" />
+          {SKELETON_LINES.map((width, i) => (
+            width ? <div key={i} className="skeleton-line" style={{ width: `${width}%` }} /> : <br key={i} />
+          ))}
+        </div>
+      )}
       <button className="edit-fab" onClick={onEditClick} title="Switch to edit mode">
         ✏️ Edit
       </button>
@@ -1,12 +1,12 @@
 // Hook for AI-powered text editing
 
 import { useState, useCallback } from 'react';
-import { streamAgentSuggestion, streamAgentRevision, approveEdit } from '../lib/api';
+import { streamAgentSuggestion, streamAgentRevision, approveEdit, type ApproveEditResult } from '../lib/api';
 
 interface UseAgentOptions {
   bookSlug: string | null;
   chapterSlug: string | null;
-  onEditApplied?: () => void;
+  onEditApplied?: (result: ApproveEditResult) => void;
   onSuggestionComplete?: (suggestion: string) => void;
 }
 
@@ -15,6 +15,7 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
   const [streamedText, setStreamedText] = useState('');
   const [sessionId, setSessionId] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
 
   // Process SSE stream and update state
   const processStream = useCallback(async (
@@ -23,6 +24,11 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
     let fullText = '';
     
     for await (const event of stream) {
+      if (event.type === 'queued') {
+        setQueuePosition(Number(event.data.position) || null);
+        continue;
+      }
+      setQueuePosition(null);
       if (event.type === 'delta' && event.data.text) {
         fullText += event.data.text;
         setStreamedText(fullText);
@@ -47,7 +53,6 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
     selectionStart: number,
     selectionEnd: number,
     prompt: string,
-    provider: 'anthropic' | 'openai' = 'anthropic',
     content?: string  // Optional: current edited content
   ) => {
     if (!bookSlug || !chapterSlug) return;
@@ -66,7 +71,6 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
         selectionStart,
         selectionEnd,
         prompt,
-        provider,
         content,  // Pass current content if provided
       }));
     } catch (e) {
@@ -74,13 +78,13 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
       setError(e instanceof Error ? e.message : 'Agent request failed');
     } finally {
       setIsStreaming(false);
+      setQueuePosition(null);
     }
   }, [bookSlug, chapterSlug, processStream]);
 
   // Revise existing suggestion
   const reviseSuggestion = useCallback(async (
-    prompt: string,
-    provider: 'anthropic' | 'openai' = 'anthropic'
+    prompt: string
   ) => {
     if (!sessionId) return;
     
@@ -92,26 +96,29 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
       await processStream(streamAgentRevision({
         sessionId,
         prompt,
-        provider,
       }));
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Revision request failed');
     } finally {
       setIsStreaming(false);
+      setQueuePosition(null);
     }
   }, [sessionId, processStream]);
 
   // Approve and save
+  // Returns whether the edit was applied on the server
   const approve = useCallback(async () => {
-    if (!sessionId || !bookSlug || !chapterSlug) return;
+    if (!sessionId || !bookSlug || !chapterSlug) return false;
     
     try {
-      await approveEdit(sessionId, bookSlug, chapterSlug);
+      const result = await approveEdit(sessionId, bookSlug, chapterSlug);
       setSessionId(null);
       setStreamedText('');
-      onEditApplied?.();
+      onEditApplied?.(result);
+      return true;
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Failed to apply edit');
+      return false;
     }
   }, [sessionId, bookSlug, chapterSlug, onEditApplied]);
 
@@ -133,6 +140,7 @@ export function useAgent({ bookSlug, chapterSlug, onEditApplied, onSuggestionCom
   return {
     isStreaming,
     streamedText,
+    queuePosition,
     sessionId,
     error,
     getSuggestion,
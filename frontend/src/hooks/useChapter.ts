@@ -1,8 +1,9 @@
 // Hook for fetching chapter content (read-only from server)
 
 import { useState, useEffect, useCallback } from 'react';
-import { fetchChapter } from '../lib/api';
+import { fetchChapter, type ApproveEditResult } from '../lib/api';
 import { withRetry } from '../lib/retry';
+import { applyOps } from '../lib/textops';
 
 interface UseChapterOptions {
   bookSlug: string | null;
@@ -14,10 +15,12 @@ export function useChapter({ bookSlug, chapterSlug }: UseChapterOptions) {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [lastUpdated, setLastUpdated] = useState<string | null>(null);
+  const [contentHash, setContentHash] = useState<string | null>(null);
 
   const load = useCallback(async () => {
     if (!bookSlug || !chapterSlug) {
       setContent('');
+      setContentHash(null);
       return;
     }
 
@@ -26,6 +29,7 @@ export function useChapter({ bookSlug, chapterSlug }: UseChapterOptions) {
       const data = await withRetry(() => fetchChapter(bookSlug, chapterSlug));
       setContent(data.content);
       setLastUpdated(data.updatedAt);
+      setContentHash(data.contentHash ?? null);
       setError(null);
     } catch (e) {
       setError(e instanceof Error ? e.message : 'Failed to load chapter');
@@ -34,6 +38,16 @@ export function useChapter({ bookSlug, chapterSlug }: UseChapterOptions) {
     }
   }, [bookSlug, chapterSlug]);
 
+  // Apply an approved agent edit locally. Returns false if our copy is not
+  // the version the op was made against (the caller should reload instead).
+  const applyEdit = useCallback((result: ApproveEditResult) => {
+    if (!contentHash || contentHash !== result.baseHash) return false;
+    setContent((prev) => applyOps(prev, [result.op]));
+    setContentHash(result.contentHash);
+    setLastUpdated(result.updatedAt);
+    return true;
+  }, [contentHash]);
+
   // Load on mount and when slug changes
   useEffect(() => {
     load();
@@ -44,6 +58,8 @@ export function useChapter({ bookSlug, chapterSlug }: UseChapterOptions) {
     loading,
     error,
     lastUpdated,
-    reload: load,  // Call this after agent applies an edit
+    contentHash,  // Base version for delta saves
+    reload: load,
+    applyEdit,  // Call this after agent applies an edit (falls back to reload)
   };
 }
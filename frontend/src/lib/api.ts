@@ -1,6 +1,7 @@
 // API client for ZenApp backend
 
-import type { Book, ChapterContent } from '../types';
+import type { Book, ChapterContent, RenderedChapter } from '../types';
+import { diffToOps } from './textops';
 
 const API_BASE = '/api';
 
@@ -81,7 +82,16 @@ export async function fetchChapter(bookSlug: string, chapterSlug: string): Promi
   return res.json();
 }
 
-export async function createChapter(bookSlug: string, title: string): Promise<{ slug: string; gitCommitted?: boolean }> {
+export async function fetchRenderedChapter(bookSlug: string, chapterSlug: string): Promise<RenderedChapter> {
+  const res = await fetch(`${API_BASE}/books/${bookSlug}/chapters/${chapterSlug}/rendered`, { headers: authHeaders() });
+  if (res.status === 401) { clearToken(); throw new Error('Unauthorized'); }
+  if (!res.ok) throw new Error('Failed to fetch rendered chapter');
+  return res.json();
+}
+
+export type CommitStatus = 'pending' | 'committed' | 'pushed' | 'failed' | 'disabled';
+
+export async function createChapter(bookSlug: string, title: string): Promise<{ slug: string; commitId?: string | null; commitStatus?: CommitStatus }> {
   const res = await fetch(`${API_BASE}/books/${bookSlug}/chapters`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json', ...authHeaders() },
@@ -92,11 +102,34 @@ export async function createChapter(bookSlug: string, title: string): Promise<{
   return res.json();
 }
 
+export interface SaveChapterResult {
+  updatedAt: string;
+  contentHash: string;
+  commitId: string | null;
+  commitStatus: CommitStatus;
+  chapterSlug?: string;
+  renamed?: boolean;
+}
+
+// Save a chapter. With a known base version only the changed range is
+// uploaded (PATCH); a hash mismatch falls back to a full PUT.
 export async function saveChapter(
   bookSlug: string,
   chapterSlug: string,
   content: string,
-): Promise<{ updatedAt: string; gitCommitted: boolean; chapterSlug?: string; renamed?: boolean }> {
+  base?: { content: string; hash: string },
+): Promise<SaveChapterResult> {
+  if (base) {
+    const res = await fetch(`${API_BASE}/books/${bookSlug}/chapters/${chapterSlug}`, {
+      method: 'PATCH',
+      headers: { 'Content-Type': 'application/json', ...authHeaders() },
+      body: JSON.stringify({ baseHash: base.hash, ops: diffToOps(base.content, content) }),
+    });
+    if (res.status === 401) { clearToken(); throw new Error('Unauthorized'); }
+    if (res.ok) return res.json();
+    if (res.status !== 409) throw new Error('Failed to save chapter');
+  }
+
   const res = await fetch(`${API_BASE}/books/${bookSlug}/chapters/${chapterSlug}`, {
     method: 'PUT',
     headers: { 'Content-Type': 'application/json', ...authHeaders() },
@@ -107,6 +140,13 @@ export async function saveChapter(
   return res.json();
 }
 
+export async function fetchCommitStatus(commitId: string): Promise<{ id: string; status: CommitStatus; commit: string | null; error: string | null }> {
+  const res = await fetch(`${API_BASE}/sync/commits/${commitId}`, { headers: authHeaders() });
+  if (res.status === 401) { clearToken(); throw new Error('Unauthorized'); }
+  if (!res.ok) throw new Error('Failed to fetch commit status');
+  return res.json();
+}
+
 // --- Agent ---
 
 export interface AgentSuggestRequest {
@@ -115,14 +155,12 @@ export interface AgentSuggestRequest {
   selectionStart: number;
   selectionEnd: number;
   prompt: string;
-  provider?: 'anthropic' | 'openai';
   content?: string;  // Optional: use this content instead of fetching from backend
 }
 
 export interface AgentReviseRequest {
   sessionId: string;
   prompt: string;
-  provider?: 'anthropic' | 'openai';
 }
 
 async function* parseSSEStream(response: Response): AsyncGenerator<{ type: string; data: Record<string, string> }> {
@@ -185,17 +223,56 @@ export async function* streamAgentRevision(req: AgentReviseRequest): AsyncGenera
   yield* parseSSEStream(res);
 }
 
-export async function approveEdit(sessionId: string, bookSlug: string, chapterSlug: string): Promise<{ status: string; updatedAt: string }> {
+export interface ApproveEditResult {
+  status: string;
+  updatedAt: string;
+  baseHash: string;  // Version the op applies to
+  contentHash: string;  // Version after the op
+  op: { start: number; end: number; text: string };
+  chapterSlug: string;
+  renamed: boolean;
+}
+
+// Approve the session's suggestion. The server rebases it onto the saved
+// chapter; 409 means the selected text itself was changed meanwhile.
+export async function approveEdit(sessionId: string, bookSlug: string, chapterSlug: string): Promise<ApproveEditResult> {
   const res = await fetch(`${API_BASE}/agent/approve`, {
     method: 'POST',
     headers: { 'Content-Type': 'application/json', ...authHeaders() },
     body: JSON.stringify({ sessionId, bookSlug, chapterSlug }),
   });
   if (res.status === 401) { clearToken(); throw new Error('Unauthorized'); }
+  if (res.status === 409) throw new Error('The selected text was changed since the suggestion');
   if (!res.ok) throw new Error('Failed to approve edit');
   return res.json();
 }
 
+// Speculatively generate suggestions for the most-used prompts on a selection.
+// Best effort: failures are ignored, /suggest works either way.
+export async function prefetchSuggestions(req: Omit<AgentSuggestRequest, 'prompt'>): Promise<void> {
+  try {
+    await fetch(`${API_BASE}/agent/prefetch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', ...authHeaders() },
+      body: JSON.stringify(req),
+    });
+  } catch {
+    // Ignore
+  }
+}
+
+export async function cancelPrefetch(): Promise<void> {
+  try {
+    await fetch(`${API_BASE}/agent/prefetch/cancel`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', ...authHeaders() },
+      body: JSON.stringify({}),
+    });
+  } catch {
+    // Ignore
+  }
+}
+
 // --- Prompts ---
 
 export async function getPrompts(): Promise<string[]> {
@@ -220,7 +297,17 @@ export async function savePrompts(prompts: string[]): Promise<{ status: string;
 
 // --- Images ---
 
-export async function uploadImage(bookSlug: string, file: File): Promise<{ url: string; filename: string; size: number }> {
+export interface UploadImageResult {
+  url: string;
+  filename: string;
+  size: number;
+  width: number;
+  height: number;
+  srcset: string | null;  // Width variants, generated in the background after upload
+  sizes: string;
+}
+
+export async function uploadImage(bookSlug: string, file: File): Promise<UploadImageResult> {
   const formData = new FormData();
   formData.append('file', file);
   
@@ -0,0 +1,57 @@
+// Minimal text ops for delta chapter saves
+
+export interface TextOp {
+  start: number;  // Offsets in Unicode code points (matches Python str indexing)
+  end: number;
+  text: string;
+}
+
+function isHighSurrogate(code: number): boolean {
+  return code >= 0xd800 && code <= 0xdbff;
+}
+
+function codePointLength(text: string): number {
+  return Array.from(text).length;
+}
+
+// Describe `next` as a single replacement of the differing middle of `base`.
+export function diffToOps(base: string, next: string): TextOp[] {
+  if (base === next) return [];
+
+  let prefix = 0;
+  const maxPrefix = Math.min(base.length, next.length);
+  while (prefix < maxPrefix && base.charCodeAt(prefix) === next.charCodeAt(prefix)) prefix++;
+  if (prefix > 0 && isHighSurrogate(base.charCodeAt(prefix - 1))) prefix--;
+
+  let suffix = 0;
+  const maxSuffix = maxPrefix - prefix;
+  while (
+    suffix < maxSuffix &&
+    base.charCodeAt(base.length - 1 - suffix) === next.charCodeAt(next.length - 1 - suffix)
+  ) suffix++;
+  if (suffix > 0 && isHighSurrogate(base.charCodeAt(base.length - 1 - suffix))) suffix--;
+
+  const start = codePointLength(base.slice(0, prefix));
+  const end = start + codePointLength(base.slice(prefix, base.length - suffix));
+  return [{ start, end, text: next.slice(prefix, next.length - suffix) }];
+}
+
+// UTF-16 index of the code point offset `offset` in `text`.
+function codePointIndex(text: string, offset: number): number {
+  let index = 0;
+  for (let n = 0; n < offset && index < text.length; n++) {
+    index += isHighSurrogate(text.charCodeAt(index)) ? 2 : 1;
+  }
+  return index;
+}
+
+// Apply non-overlapping ops (code point offsets, as returned by the server) to `content`.
+export function applyOps(content: string, ops: TextOp[]): string {
+  let result = content;
+  for (const op of [...ops].sort((a, b) => b.start - a.start)) {
+    const start = codePointIndex(result, op.start);
+    const end = codePointIndex(result, op.end);
+    result = result.slice(0, start) + op.text + result.slice(end);
+  }
+  return result;
+}
@@ -15,6 +15,14 @@ export interface Chapter {
 export interface ChapterContent {
   content: string;
   updatedAt: string;
+  contentHash?: string;
+}
+
+export interface RenderedChapter {
+  html: string;
+  toc: { text: string; level: number; id: string }[];
+  contentHash: string;
+  updatedAt: string;
 }
 
 export interface Draft {